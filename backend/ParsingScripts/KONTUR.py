@@ -2,22 +2,35 @@ import os
 import time
 import shutil
 import re
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from io import BytesIO 
-import requests
+from urllib.parse import urljoin
+import httpx
+from bs4 import BeautifulSoup
 from docx import Document
-import asyncio
-from concurrent.futures import ThreadPoolExecutor
+
+from .webdriver_pool import webdriver_pool, create_driver
+from .executors import executor_runtime
+from .http_pool import http_pool
+from .rate_limiter import rate_limiter
+from .region_state import region_state_store, RegionState, fingerprint, INCREMENTAL_RUNS
+from .checkpoints import get_checkpoint
 
 import pandas as pd
 
-BASE_URL = "https://www.kontur-extern.ru/price-download/77"
+BASE_URL = os.environ.get("KONTUR_BASE_URL", "https://www.kontur-extern.ru/price-download/77")
 DOWNLOAD_DIR = os.environ.get("DOWNLOAD_DIR")
-SELENIUM_URL = os.environ.get("SELENIUM_URL")
 DOCTRANSLATOR_URL = os.environ.get("DOCTRANSLATOR_URL")
+PARSER_KEY = "KONTUR"
+KONTUR_HTTP_FAST_PATH = os.environ.get("KONTUR_HTTP_FAST_PATH", "1") == "1"
+PRICE_LINK_TEXT = "Скачать полный прайс-лист, часть 2"
+KONTUR_HOST_RPS = float(os.environ.get("KONTUR_HOST_RPS", 0.5))
+KONTUR_HOST_BURST = int(os.environ.get("KONTUR_HOST_BURST", 1))
+
+# страницы регионов (браузером) и прайс-листы (http_pool) идут через один bucket хоста
+rate_limiter.configure(BASE_URL, KONTUR_HOST_RPS, KONTUR_HOST_BURST)
 
 _regions = [
     ("01", "Республика Адыгея"),
@@ -119,12 +132,20 @@ regions = [
     ("99", "Байконур")
 ]
 
+def region_url(region_id):
+    return BASE_URL.rsplit("/", 1)[0] + f"/{region_id}"
+
+# возвращает признак скачивания и адрес файла прайс-листа; по адресу следующий запуск проверяет изменения без браузера
 def download_price_file(driver, wait):
+    file_url = None
+
     def download_selenium():
+        nonlocal file_url
         try:
             link = wait.until(EC.element_to_be_clickable((
-                By.XPATH, "//a[contains(text(), 'Скачать полный прайс-лист, часть 2')]"
+                By.XPATH, f"//a[contains(text(), '{PRICE_LINK_TEXT}')]"
             )))
+            file_url = link.get_attribute("href")
             driver.execute_script("arguments[0].click();", link)
             return True
         except Exception as e:
@@ -132,14 +153,15 @@ def download_price_file(driver, wait):
         return False
 
     def download_requests():
+        nonlocal file_url
         try:
-            print("загрузка из requests")
+            print("загрузка через http клиент")
             link = wait.until(EC.element_to_be_clickable((
-                By.XPATH, "//a[contains(text(), 'Скачать полный прайс-лист, часть 2')]"
+                By.XPATH, f"//a[contains(text(), '{PRICE_LINK_TEXT}')]"
             )))
 
             file_url = link.get_attribute("href")
-            response = requests.get(file_url)
+            response = http_pool.request_sync("GET", file_url)
             
             if response.status_code == 200:
                 print("Файл успешно загружен")
@@ -169,7 +191,39 @@ def download_price_file(driver, wait):
     if not download_finished:
         download_finished = download_requests()
 
-    return download_finished   
+    return download_finished, file_url
+
+# быстрый путь без браузера: адрес прайс-листа берется из HTML страницы региона,
+# файл скачивается потоком сразу в DOWNLOAD_DIR. None - страница или файл недоступны, регион проходится браузером
+def resolve_price_file_url(region_id):
+    response = http_pool.request_sync("GET", region_url(region_id))
+    if response.status_code != 200:
+        print(f"  ⚠ Страница региона {region_id} вернула {response.status_code}")
+        return None
+    soup = BeautifulSoup(response.text, "lxml")
+    for link in soup.find_all("a", href=True):
+        if PRICE_LINK_TEXT in link.get_text(" ", strip=True):
+            return urljoin(str(response.url), link["href"])
+    print(f"  ⚠ На странице региона {region_id} нет ссылки на прайс-лист")
+    return None
+
+
+def download_price_file_http(region_id):
+    try:
+        file_url = resolve_price_file_url(region_id)
+        if file_url is None:
+            return None
+        clear_download_dir()
+        target_path = os.path.join(DOWNLOAD_DIR, f"{region_id}_pricelist.doc")
+        response = http_pool.request_sync("GET", file_url, path=target_path)
+    except httpx.HTTPError as e:
+        print(f"  ⚠ Не удалось скачать прайс-лист {region_id} без браузера: {e}")
+        return None
+    if response.status_code != 200 or not os.path.exists(target_path):
+        print(f"  ⚠ Прайс-лист {region_id} вернул {response.status_code}")
+        return None
+    return file_url, response.headers.get("ETag"), response.headers.get("Last-Modified")
+
 
 def parse_docx_from_bytes(docx_bytes: BytesIO):
     try:
@@ -273,11 +327,15 @@ def extract_common_prices_from_bytes(docx_bytes:BytesIO):
     except Exception as e:
         return [f"Ошибка: {e}"] * 7
 
+def parse_price_file(docx_bytes: BytesIO):
+    return parse_docx_from_bytes(docx_bytes), extract_common_prices_from_bytes(docx_bytes)
+
 def translate_file(file_path,file_name):
     with open(file_path, "rb") as f:
         url = DOCTRANSLATOR_URL
-        files = {"file": (file_name, f, "multipart/form-data")}
-        response = requests.post(url, files=files)
+        # файл читается в память, чтобы повтор запроса отправил его заново
+        files = {"file": (file_name, f.read(), "multipart/form-data")}
+    response = http_pool.request_sync("POST", url, files=files)
 
     response.raise_for_status()
 
@@ -286,50 +344,7 @@ def translate_file(file_path,file_name):
     return file
 
 def init_webdriver(local = False, headless = True):
-    
-    options = webdriver.ChromeOptions()
-    if headless:
-        options.add_argument('--headless=new')
-        options.add_argument('--disable-gpu')
-        options.add_argument('--no-sandbox')
-        options.add_argument('--disable-dev-shm-usage')
-    options.add_argument("--disable-blink-features=AutomationControlled")
-    options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36")
-    options.add_argument("--lang=ru-RU")
-    options.add_argument("--window-size=1920,1080")
-    options.add_argument("--disable-extensions")
-    options.add_argument("--disable-plugins")
-    options.add_argument("--disable-popup-blocking")
-    options.add_argument('--start-maximized')
-
-    prefs = {
-        "download.default_directory": DOWNLOAD_DIR,
-        "download.prompt_for_download": False,
-        "download.directory_upgrade": True,
-        "safebrowsing.enabled": True
-    }
-    options.add_experimental_option("prefs", prefs)
-
-
-    if local:
-        driver = webdriver.Chrome(options=options)
-    else:
-        driver = webdriver.Remote(
-            command_executor=SELENIUM_URL,
-            options=options
-        )
-
-    if headless:
-        driver.execute_cdp_cmd(
-            "Browser.setDownloadBehavior",
-            {
-                "behavior": "allow",
-                "downloadPath": DOWNLOAD_DIR
-            }
-        )
-
-        
-    return driver
+    return create_driver(local=local, headless=headless)
 
 
 def init_dataframe():
@@ -348,8 +363,11 @@ def read_data_row(region_id,region_name):
 
     file_docx = translate_file(target_path,f"{region_id}_pricelist.doc")
 
+    # Разбор docx выполняется в пуле процессов
+    main_prices, common_prices = executor_runtime.run_cpu_sync(parse_price_file, file_docx)
+
     # Извлекаем основные тарифы
-    ip_usn, ul_usn, ip_osno, ul_osno, budget_plus, budget = parse_docx_from_bytes(file_docx)
+    ip_usn, ul_usn, ip_osno, ul_osno, budget_plus, budget = main_prices
     print(f"  └ ИП (УСН): {ip_usn}")
     print(f"  └ ЮЛ (УСН): {ul_usn}")
     print(f"  └ ИП (ОСНО): {ip_osno}")
@@ -358,7 +376,6 @@ def read_data_row(region_id,region_name):
     print(f"  └ Бюджетник: {budget}")
 
     # Извлекаем тарифы "Общий"
-    common_prices = extract_common_prices_from_bytes(file_docx)
     print(f"  └ 1+4: {common_prices[0]}")
     print(f"  └ 1+9: {common_prices[1]}")
     print(f"  └ 1+19: {common_prices[2]}")
@@ -370,56 +387,153 @@ def read_data_row(region_id,region_name):
     # Добавляем данные в Excel
     row = [int(region_id), region_name, ip_usn, ip_osno, ul_usn, ul_osno, budget_plus, budget] + common_prices
     return row
-def main():
-    total_regions = len(regions)
+def clear_download_dir():
+    for f in os.listdir(DOWNLOAD_DIR):
+        try:
+            os.remove(os.path.join(DOWNLOAD_DIR, f))
+        except:
+            pass
 
-    print("test")
-    driver = init_webdriver(local=False,headless=True)
 
-    wait = WebDriverWait(driver, 20) 
+def file_fingerprint(path):
+    with open(path, "rb") as f:
+        return fingerprint(f.read())
 
-    df = init_dataframe()
 
-    # === Основной цикл ===
-    for idx, (region_id, region_name) in enumerate(regions, 1):
-        print(f"\n➡ Обрабатываем: {region_id} – {region_name} ({idx}/{total_regions})")
+# проверка региона без браузера: условный GET прайс-листа по адресу из прошлого запуска.
+# 304 или тот же хэш файла - строка берется из прошлого запуска; новый файл разбирается сразу, без повторного скачивания.
+# None - регион нужно пройти браузером
+def refresh_region(region_id, region_name, state):
+    headers = {}
+    if state.get_etag():
+        headers["If-None-Match"] = state.get_etag()
+    if state.get_last_modified():
+        headers["If-Modified-Since"] = state.get_last_modified()
+    try:
+        response = http_pool.request_sync("GET", state.get_url(), headers=headers)
+    except httpx.HTTPError as e:
+        print(f"  ⚠ Не удалось проверить прайс-лист {region_id}: {e}")
+        return None, False
+
+    if response.status_code == 304:
+        return state.get_payload(), False
+    if response.status_code != 200:
+        return None, False
+
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    file_fingerprint = fingerprint(response.content)
+    if file_fingerprint == state.get_fingerprint():
+        region_state_store.set(PARSER_KEY, region_id, RegionState(
+            file_fingerprint, state.get_payload(), state.get_url(), etag, last_modified
+        ))
+        return state.get_payload(), False
+
+    print(f"➡ Прайс-лист изменился: {region_id} – {region_name}")
+    clear_download_dir()
+    with open(os.path.join(DOWNLOAD_DIR, f"{region_id}_pricelist.doc"), "wb") as f:
+        f.write(response.content)
+    try:
+        row = read_data_row(region_id, region_name)
+    except Exception as e:
+        # состояние региона не обновляется, регион проходится заново
+        print(f"❌ Ошибка в регионе {region_id} – {region_name}: {e}")
+        return None, False
+    region_state_store.set(PARSER_KEY, region_id, RegionState(file_fingerprint, row, state.get_url(), etag, last_modified))
+    return row, True
 
-        try:
-            driver.get(BASE_URL.replace("77", region_id))
 
-   
+# checkpoint - чекпоинт запуска: пройденные регионы сохраняются сразу, после сбоя запуск продолжается с того же места
+def main(checkpoint = None):
+    total_regions = len(regions)
 
-            for f in os.listdir(DOWNLOAD_DIR):
-                try:
-                    os.remove(os.path.join(DOWNLOAD_DIR, f))
-                except:
-                    pass
-            wait.until(EC.presence_of_element_located((By.TAG_NAME, "body")))
-
-            if download_price_file(driver, wait):
-                df.loc[len(df)] = read_data_row(region_id,region_name)
-                # print(df)
-                # time.sleep(10)
-            else: print(f"  ❌ Не удалось скачать файл с тарифами для")
-            
+    print("test")
+    rows = checkpoint.load() if checkpoint is not None else {}
+    pending = []
+    reused = len(rows)
+    states = region_state_store.get_all(PARSER_KEY) if INCREMENTAL_RUNS else {}
+    for region_id, region_name in regions:
+        if region_id in rows:
+            continue
+        state = states.get(region_id)
+        row, changed = refresh_region(region_id, region_name, state) if state is not None and state.get_url() else (None, False)
+        if row is None:
+            pending.append((region_id, region_name))
+            continue
+        rows[region_id] = row
+        if checkpoint is not None:
+            checkpoint.save(region_id, row)
+        if not changed:
+            reused += 1
+
+    # браузер нужен только регионам, которые не удалось скачать быстрым путем
+    if pending and KONTUR_HTTP_FAST_PATH:
+        fallback = []
+        for idx, (region_id, region_name) in enumerate(pending, 1):
+            print(f"\n➡ Обрабатываем без браузера: {region_id} – {region_name} ({idx}/{len(pending)}, всего регионов {total_regions})")
+            downloaded = download_price_file_http(region_id)
+            if downloaded is None:
+                fallback.append((region_id, region_name))
+                continue
+            file_url, etag, last_modified = downloaded
+            try:
+                row = read_data_row(region_id, region_name)
+            except Exception as e:
+                # ссылка со страницы могла вести не на тот файл, который отдает кнопка; регион проходится браузером
+                print(f"❌ Ошибка в регионе {region_id} – {region_name}: {e}")
+                fallback.append((region_id, region_name))
+                continue
+            rows[region_id] = row
+            if checkpoint is not None:
+                checkpoint.save(region_id, row)
+            target_path = os.path.join(DOWNLOAD_DIR, f"{region_id}_pricelist.doc")
+            region_state_store.set(PARSER_KEY, region_id, RegionState(file_fingerprint(target_path), row, file_url, etag, last_modified))
+        print(f"{len(pending) - len(fallback)} regions downloaded without browser, {len(fallback)} left for browser")
+        pending = fallback
+
+    if pending:
+        with webdriver_pool.session() as driver:
+            wait = WebDriverWait(driver, 20) 
+
+            # === Основной цикл ===
+            for idx, (region_id, region_name) in enumerate(pending, 1):
+                print(f"\n➡ Обрабатываем: {region_id} – {region_name} ({idx}/{len(pending)}, всего регионов {total_regions})")
 
+                try:
+                    rate_limiter.acquire_sync(region_url(region_id))
+                    driver.get(region_url(region_id))
+
+                    clear_download_dir()
+                    wait.until(EC.presence_of_element_located((By.TAG_NAME, "body")))
+
+                    download_finished, file_url = download_price_file(driver, wait)
+                    if download_finished:
+                        row = read_data_row(region_id,region_name)
+                        rows[region_id] = row
+                        if checkpoint is not None:
+                            checkpoint.save(region_id, row)
+                        target_path = os.path.join(DOWNLOAD_DIR, f"{region_id}_pricelist.doc")
+                        if file_url and os.path.exists(target_path):
+                            region_state_store.set(PARSER_KEY, region_id, RegionState(file_fingerprint(target_path), row, file_url))
+                    else: print(f"  ❌ Не удалось скачать файл с тарифами для")
 
+                except Exception as e:
+                    print(f"❌ Ошибка в регионе {region_id} – {region_name}: {e}")
 
-        except Exception as e:
-            print(f"❌ Ошибка в регионе {region_id} – {region_name}: {e}")
+                print(f"✅ Завершено для {region_name} ({round(idx / len(pending) * 100, 1)}%)")
 
-        print(f"✅ Завершено для {region_name} ({round(idx / total_regions * 100, 1)}%)")
+    region_state_store.record_run(PARSER_KEY, reused, len(rows) - reused)
 
     # === Завершение ===
-    driver.quit()
-
+    df = init_dataframe()
+    for region_id, _ in regions:
+        if region_id in rows:
+            df.loc[len(df)] = rows[region_id]
     return df
 
 
 async def async_selenium():
-    loop = asyncio.get_running_loop() 
-    with ThreadPoolExecutor() as executor:
-        df = await loop.run_in_executor(executor, main)
+    df = await executor_runtime.run_blocking(main, get_checkpoint())
     return df
 
 
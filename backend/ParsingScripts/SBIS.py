@@ -1,12 +1,34 @@
 import httpx
 import json
 import pandas as pd
-import random
 import asyncio
+import os
 
+from .executors import executor_runtime
+from .http_pool import http_pool
+from .rate_limiter import rate_limiter
+from .region_state import region_state_store, RegionState, fingerprint, INCREMENTAL_RUNS
+from .checkpoints import get_checkpoint
 
-async def make_saby_request(region_code="57", duration=12, parent_contract=None, contractor_of_invoice=None, httpxClient = None):
-    url = "https://saby.ru/service/?x_version=25.3200-58"
+PARSER_KEY = "SBIS"
+
+SABY_URL = os.environ.get("SABY_URL", "https://saby.ru/service/?x_version=25.3200-58")
+SBIS_CONCURRENCY = max(1, int(os.environ.get("SBIS_CONCURRENCY", 4)))
+SBIS_HOST_RPS = float(os.environ.get("SBIS_HOST_RPS", 2))
+SBIS_HOST_BURST = int(os.environ.get("SBIS_HOST_BURST", 1))
+SBIS_RETRIES = int(os.environ.get("SBIS_RETRIES", 3))
+SBIS_RETRY_BACKOFF = float(os.environ.get("SBIS_RETRY_BACKOFF", 1))
+
+
+# частота запросов к saby.ru для всех запусков и воркеров; при 429/503 rate_limiter снижает ее сам
+rate_limiter.configure(SABY_URL, SBIS_HOST_RPS, SBIS_HOST_BURST)
+
+
+class SabyRequestError(Exception):
+    pass
+
+async def make_saby_request(region_code="57", duration=12, parent_contract=None, contractor_of_invoice=None):
+    url = SABY_URL
 
     headers = {
         "accept": "application/json, text/javascript, */*; q=0.01",
@@ -57,48 +79,48 @@ async def make_saby_request(region_code="57", duration=12, parent_contract=None,
         "DeviceId": "e6d8f32a-bd30-43ed-81d6-f826b518f467",
     }
     
-    try:
-        response = await httpxClient.post(
-            url,
-            headers=headers,
-            json=payload,
-            cookies=cookies,
-            timeout=30
-        )
-        response.encoding = 'utf-8'
-        response.raise_for_status()
+    # повторяются ошибки соединения, ответы 4xx/5xx, битый JSON и ответы без "result"; каждая попытка
+    # идет через общий HTTP-клиент без его собственных повторов, паузу после 429/503 выдерживает rate_limiter
+    last_error = None
+    for attempt in range(SBIS_RETRIES + 1):
+        if attempt:
+            await asyncio.sleep(http_pool.get_retry_delay(attempt, SBIS_RETRY_BACKOFF))
+        try:
+            response = await http_pool.request(
+                "POST",
+                url,
+                retries=0,
+                json=payload,
+                # клиент общий для всех парсеров, поэтому cookie передаются заголовком запроса, а не сохраняются в клиенте
+                headers={**headers, "cookie": "; ".join(f"{name}={value}" for name, value in cookies.items())},
+            )
+            response.encoding = 'utf-8'
+            response.raise_for_status()
+
+            print(response.text[:100])
+
+            result = response.json()
+            if "result" in result:
+                return result
+            last_error = f"неожиданный формат ответа: {str(result)[:200]}"
+        except httpx.HTTPError as e:
+            last_error = f"ошибка при отправке запроса: {e}"
+        except json.JSONDecodeError as e:
+            last_error = f"ошибка при парсинге JSON ответа: {e}"
+        print(f"регион {region_code}, попытка {attempt + 1}: {last_error}")
 
-        print(response.text[:100])
-        
-        return response.json()
-        
-    except httpxClient.exceptions.RequestException as e:
-        print(f"Ошибка при отправке запроса: {e}")
-        print(str(e))
-        return None
-    except json.JSONDecodeError as e:
-        print(f"Ошибка при парсинге JSON ответа: {e}")
-        return None
+    raise SabyRequestError(f"не удалось получить тарифы региона {region_code} за {SBIS_RETRIES + 1} попыток: {last_error}")
 
-async def get_saby_tariffs_for_region(region_code,client):
+async def get_saby_tariffs_for_region(region_code):
 
     print(f"Получение тарифов для региона {region_code}...")
     
-    result = await make_saby_request(region_code=region_code, httpxClient=client)
-    
-    if result:
-        if "result" in result:
-            return result["result"]
-        else:
-            print(f"Неожиданный формат ответа: {result}")
-            return None
-    else:
-        print(f"Не удалось получить данные для региона {region_code}")
-        return None
+    result = await make_saby_request(region_code=region_code)
+    return result["result"]
 
 async def get_saby_tariffs_for_regions():
-    async with httpx.AsyncClient() as client:
-        regions = regions = {
+    # соединения с saby.ru берутся из общего пула и не закрываются после запуска
+    regions = regions = {
     '77': 'Москва',
     '78': 'Санкт-Петербург',
     '01': 'Республика Адыгея',
@@ -189,8 +211,8 @@ async def get_saby_tariffs_for_regions():
     '94': 'Луганская нар. респ.',
     '95': 'Херсонская обл.'
 }
-        
-        tariff_to_code = {
+    
+    tariff_to_code = {
     "EOpSBISfrmLIoN": "отчетность легкий ип",
     "EOpSBISfrmLB2o": "отчетность легкий бюджет",
     "EOpSBISfrmLUo": "отчетность усн ",
@@ -206,26 +228,56 @@ async def get_saby_tariffs_for_regions():
     "EOpSBISfrmUPQ12": "уполномоченная бухгалтерия подключение",
     "EOussvMin": "уполномоченная бухгалтерия за квартал"
     }
-        
-        all_tariffs = {}
+    
+    # JSON-RPC не поддерживает условные запросы, поэтому ответ запрашивается всегда;
+    # если хэш ответа совпал с прошлым запуском, регион не разбирается заново
+    states = await executor_runtime.run_blocking(region_state_store.get_all, PARSER_KEY) if INCREMENTAL_RUNS else {}
+    changed = {}
+    # регионы, пройденные прерванным запуском с тем же run_id, повторно не запрашиваются
+    checkpoint = get_checkpoint()
+    completed = await executor_runtime.run_blocking(checkpoint.load) if checkpoint is not None else {}
+    region_tariffs_by_id = dict(completed)
+    slots = asyncio.Semaphore(SBIS_CONCURRENCY)
+
+    async def fetch_region(region_id):
+        async with slots:
+            region_tariffs = await get_saby_tariffs_for_region(region_id)
 
-        for region_id in regions:
-            await asyncio.sleep(random.randint(1,5))
-            region_tariffs = await get_saby_tariffs_for_region(region_id,client)
+        region_fingerprint = fingerprint(region_tariffs)
+        state = states.get(region_id)
+        if state is not None and state.get_fingerprint() == region_fingerprint:
+            tariffs = state.get_payload()
+        else:
+            tariffs = json.loads(region_tariffs)
+
+            tariffs = [
+                {
+                    "name": tariff_to_code[x["nomenclature"]],
+                    "price": x["price"]
+                }
+                for x in tariffs["data"] if x["nomenclature"] in tariff_to_code
+            ]
+            changed[region_id] = RegionState(region_fingerprint, tariffs)
+        region_tariffs_by_id[region_id] = tariffs
+        if checkpoint is not None:
+            await executor_runtime.run_blocking(checkpoint.save, region_id, tariffs)
+
+    # регионы запрашиваются параллельно не больше SBIS_CONCURRENCY за раз; при ошибке региона
+    # остальные отменяются, а пройденные остаются в чекпоинте для повтора
+    try:
+        async with asyncio.TaskGroup() as group:
+            for region_id in regions:
+                if region_id not in completed:
+                    group.create_task(fetch_region(region_id))
+    except ExceptionGroup as e:
+        raise e.exceptions[0]
 
-            if region_tariffs:
-                tariffs = json.loads(region_tariffs)
+    # порядок строк результата не зависит от порядка ответов
+    all_tariffs = {regions[region_id]: region_tariffs_by_id[region_id] for region_id in regions}
 
-                tariffs = [
-                    {
-                        "name": tariff_to_code[x["nomenclature"]],
-                        "price": x["price"]
-                    }
-                    for x in tariffs["data"] if x["nomenclature"] in tariff_to_code
-                ]
-                all_tariffs[regions[region_id]] = tariffs
-        
-        return all_tariffs
+    await executor_runtime.run_blocking(region_state_store.set_many, PARSER_KEY, changed)
+    region_state_store.record_run(PARSER_KEY, len(all_tariffs) - len(changed), len(changed))
+    return all_tariffs
 
 def safe_extract(prices, substrings):
     for name in prices:
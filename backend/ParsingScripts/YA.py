@@ -1,39 +1,17 @@
 import os
 import time
-import logging
 import pandas as pd
-import asyncio
-from concurrent.futures import ThreadPoolExecutor
 
-from selenium import webdriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.remote.webdriver import WebDriver
-
-SELENIUM_URL = os.environ.get("SELENIUM_URL")
-
-import time
-import random
-
-
-
-def get_driver() -> WebDriver:
-    options = Options()
-    options.add_argument('--headless=new')
-    options.add_argument('--disable-gpu')
-    options.add_argument('--no-sandbox')
-    options.add_argument('--disable-dev-shm-usage')
-    options.add_argument("--disable-blink-features=AutomationControlled")
-    options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36")
-    options.add_argument("--lang=ru-RU")
-    options.add_argument("--window-size=1920,1080")
 
+from .webdriver_pool import webdriver_pool
+from .executors import executor_runtime
+from .rate_limiter import rate_limiter
 
+YA_URL = "https://ya.ru"
+YA_HOST_RPS = float(os.environ.get("YA_HOST_RPS", 0.2))
 
-    return webdriver.Remote(
-        command_executor=SELENIUM_URL,
-        options=options
-    )
+rate_limiter.configure(YA_URL, YA_HOST_RPS)
 
 # def get_local_driver() -> WebDriver:
 #     options = Options()
@@ -48,37 +26,33 @@ def get_driver() -> WebDriver:
 #     return webdriver.Chrome(options=options)
 
 def parse_ya_sync():
-    driver = get_driver()
-    try:
-        driver.get("https://ya.ru")
-        time.sleep(4)
-
-        elements = driver.find_elements(By.CSS_SELECTOR, "section.informers3__stocks a.informers3__stocks-item")
-
-        data = []
-        for elem in elements:
-            text = elem.text.strip()
-            if text.startswith("USD"):
-                rate = text.replace("USD", "").strip()
-                data.append(("USD", rate))
-            elif text.startswith("EUR"):
-                rate = text.replace("EUR", "").strip()
-                data.append(("EUR", rate))
-
-        df = pd.DataFrame(data, columns=["Currency", "Rate"])
-        return df
-    except:
-        raise RuntimeError("parsing failed")
-
-
-    finally:
-        driver.quit()
+    with webdriver_pool.session() as driver:
+        try:
+            rate_limiter.acquire_sync(YA_URL)
+            driver.get(YA_URL)
+            # ожидание отрисовки информеров, а не пауза между запросами
+            time.sleep(4)
+
+            elements = driver.find_elements(By.CSS_SELECTOR, "section.informers3__stocks a.informers3__stocks-item")
+
+            data = []
+            for elem in elements:
+                text = elem.text.strip()
+                if text.startswith("USD"):
+                    rate = text.replace("USD", "").strip()
+                    data.append(("USD", rate))
+                elif text.startswith("EUR"):
+                    rate = text.replace("EUR", "").strip()
+                    data.append(("EUR", rate))
+
+            df = pd.DataFrame(data, columns=["Currency", "Rate"])
+            return df
+        except:
+            raise RuntimeError("parsing failed")
 
 
 async def async_selenium():
-    loop = asyncio.get_running_loop() 
-    with ThreadPoolExecutor() as executor:
-        df = await loop.run_in_executor(executor, parse_ya_sync)
+    df = await executor_runtime.run_blocking(parse_ya_sync)
     return df
 
 
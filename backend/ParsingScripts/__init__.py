@@ -1,43 +1,72 @@
-from . import SBIS
-from . import KONTUR
-from . import YA
-from typing import Callable, Awaitable
-import pandas as pd
+from .webdriver_pool import webdriver_pool
+from .executors import executor_runtime
+from .registry import ParserRegistry, ParserState, LatestParse, RegistrySnapshot
+from .region_state import region_state_store
+from .checkpoints import checkpoint_store
+from .http_pool import http_pool
+from .rate_limiter import rate_limiter
+from typing import Callable, Awaitable, TYPE_CHECKING
+import importlib
 import datetime
 import asyncio
 import enum
+import time
+import os
 
-# при добавлении нового парсера необходимо добавить его в ParserKey и в parsers
+# модули парсеров (selenium, python-docx, pandas) импортируются при первом запуске или при прогреве после старта
+if TYPE_CHECKING:
+    import pandas as pd
+
+PARSERS_WARM_UP = os.environ.get("PARSERS_WARM_UP", "1") == "1"
+
+# время первого импорта модулей парсеров, секунды
+import_seconds: dict[str, float] = {}
+
+def import_parser_module(module: str):
+    started = time.perf_counter()
+    loaded = importlib.import_module(f"{__name__}.{module}")
+    import_seconds.setdefault(module, time.perf_counter() - started)
+    return loaded
+
+# при добавлении нового парсера необходимо добавить его в ParserKey и в builtin_parsers
 class ParserKey:
     SBIS = "SBIS"
     KONTUR = "KONTUR"
     YA = "YA"
 
 class ParserType(str, enum.Enum):
-    SELENIUM = "selenium" # не могут работать параллельно, т.к. используют один и тот же экземпляр браузера
+    SELENIUM = "selenium" # берут сессию браузера из webdriver_pool, параллельно работает не больше сессий, чем в пуле
     HTTPX = "httpx" # несколько httpx парсеров могут работать параллельно с разными сайтами
 
 class Parser:
     def __init__(self, 
                  key: str,
                  name: str, 
-                 run: Callable[[], Awaitable[pd.DataFrame]], 
+                 run: Callable[[], Awaitable["pd.DataFrame"]] = None, 
                  type: str = "", 
                  output_path: str = "",
-                 latest_parse_datetime: datetime.datetime = None,
-                 latest_parse_file_name: str = ""
+                 max_age: datetime.timedelta = datetime.timedelta(hours=12),
+                 module: str = "",
+                 function: str = "",
+                 diff_keys: list[str] | None = None
                  ):
         self.key = key
         self.name = name
         self.run = run
+        self.module = module # модуль внутри ParsingScripts и функция запуска, если run не передан
+        self.function = function
         self.type = type
         self.output_path = output_path
-        self.latest_parse_datetime = latest_parse_datetime
-        self.latest_parse_file_name = latest_parse_file_name
-        self.lock = asyncio.Lock()
+        self.max_age = max_age # насколько старше запрошенного времени может быть сохраненный результат
+        self.diff_keys = diff_keys or [] # колонки, по которым строки сравниваются с прошлым запуском; пусто - сравнение строк целиком
+        self.state = ParserState()
 
+    # блокировка только для последовательных запусков одного парсера, чтение состояния без нее
     def get_lock(self) -> asyncio.Lock:
-        return self.lock
+        return self.state.get_run_lock()
+
+    def get_store_lock(self) -> asyncio.Lock:
+        return self.state.get_store_lock()
     
     def get_key(self) -> str:
         return self.key
@@ -45,7 +74,20 @@ class Parser:
     def get_name(self) -> str:
         return self.name
 
-    def get_run(self) -> Callable[[], Awaitable[pd.DataFrame]]:
+    def get_run(self) -> Callable[[], Awaitable["pd.DataFrame"]] | None:
+        return self.run
+
+    def get_module(self) -> str:
+        return self.module
+
+    def is_loaded(self) -> bool:
+        return self.run is not None
+
+    # импорт модуля выполняется в пуле потоков, чтобы не блокировать event loop
+    async def load(self) -> Callable[[], Awaitable["pd.DataFrame"]]:
+        if self.run is None:
+            module = await executor_runtime.run_blocking(import_parser_module, self.module)
+            self.run = getattr(module, self.function)
         return self.run
 
     def get_type(self) -> str:
@@ -54,42 +96,68 @@ class Parser:
     def get_output_path(self) -> str:
         return self.output_path
 
+    def get_state(self) -> ParserState:
+        return self.state
+
+    def get_latest(self) -> LatestParse:
+        return self.state.get_latest()
+
     def get_latest_parse_datetime(self) -> datetime.datetime:
-        return self.latest_parse_datetime
+        return self.state.get_latest().get_date_time()
 
     def get_latest_parse_file_name(self) -> str:
-        return self.latest_parse_file_name
-    
-    def set_latest_parse_file_name(self, path: str):
-        self.latest_parse_file_name = path
+        return self.state.get_latest().get_file_name()
 
-    def set_latest_parse_date_time(self, date_time: datetime.datetime):
-        self.latest_parse_datetime = date_time 
+    def get_max_age(self) -> datetime.timedelta:
+        return self.max_age
 
-parsers_lock = asyncio.Lock()
+    def get_diff_keys(self) -> list[str]:
+        return self.diff_keys
 
-parsers = {
-    ParserKey.SBIS: Parser(
+    def set_state(self, state: ParserState):
+        self.state = state
+
+    def set_latest(self, file_name: str, date_time: datetime.datetime, blob = None, digest: str | None = None):
+        self.state.set_latest(file_name, date_time, blob, digest)
+
+builtin_parsers = [
+    Parser(
         key=ParserKey.SBIS,
         name="sbis.ru",
-        run=SBIS.parse_sbis,
         type=ParserType.HTTPX,
-        output_path="./oldData/SBIS/"
+        output_path="./oldData/SBIS/",
+        module="SBIS",
+        function="parse_sbis",
+        max_age=datetime.timedelta(days=1),
+        diff_keys=["Название региона", "Тариф"]
     ),
-     ParserKey.KONTUR: Parser(
+    Parser(
         key=ParserKey.KONTUR,
         name="kontur.ru",
-        run=KONTUR.parse_kontur,
         type=ParserType.SELENIUM,
-        output_path="./oldData/KONTUR/"
-
+        output_path="./oldData/KONTUR/",
+        module="KONTUR",
+        function="parse_kontur",
+        max_age=datetime.timedelta(days=1),
+        diff_keys=["Код региона"]
     ),
-     ParserKey.YA: Parser(
+    Parser(
         key=ParserKey.YA,
         name="ya.ru",
-        run=YA.parse_ya,
         type=ParserType.SELENIUM,
-        output_path="./oldData/YA/"
+        output_path="./oldData/YA/",
+        module="YA",
+        function="parse_ya",
+        max_age=datetime.timedelta(hours=1)
     )
-}
+]
+
+parser_registry = ParserRegistry(builtin_parsers)
 
+async def warm_up_parsers():
+    for parser in parser_registry.get_snapshot().get_all().values():
+        try:
+            await parser.load()
+        except Exception as e:
+            print(f"parser {parser.get_key()} warm up failed: {e}")
+    print(f"parsers warmed up, import time: {import_seconds}")
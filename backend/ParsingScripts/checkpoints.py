@@ -0,0 +1,127 @@
+import os
+import json
+import sqlite3
+import datetime
+import threading
+from contextvars import ContextVar
+
+CHECKPOINT_PATH = os.environ.get("CHECKPOINT_PATH", "./oldData/checkpoints.sqlite3")
+CHECKPOINT_TTL_SECONDS = int(os.environ.get("CHECKPOINT_TTL_SECONDS", 3 * 24 * 3600))
+
+
+# регионы, уже пройденные запуском с этим run_id; запуск после сбоя, перезапуска сервиса
+# или повтора заказа продолжает с первого непройденного региона
+class CheckpointStore:
+    def __init__(self, path: str = CHECKPOINT_PATH):
+        self.path = path
+        self.connection: sqlite3.Connection | None = None
+        self.lock = threading.Lock()
+        self.resumed_runs = 0
+        self.resumed_regions = 0
+
+    def connect(self) -> sqlite3.Connection:
+        if self.connection is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    run_id TEXT NOT NULL,
+                    parser_key TEXT NOT NULL,
+                    region_id TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    PRIMARY KEY (run_id, parser_key, region_id)
+                );
+                CREATE INDEX IF NOT EXISTS checkpoints_updated ON checkpoints(updated_at);
+            """)
+            self.connection = connection
+        return self.connection
+
+    def load(self, run_id: str, parser_key: str) -> dict:
+        with self.lock:
+            rows = self.connect().execute(
+                "SELECT region_id, payload FROM checkpoints WHERE run_id = ? AND parser_key = ?", (run_id, parser_key)
+            ).fetchall()
+        return {row["region_id"]: json.loads(row["payload"]) for row in rows}
+
+    def save(self, run_id: str, parser_key: str, region_id: str, payload) -> None:
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO checkpoints (run_id, parser_key, region_id, payload, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    (run_id, parser_key, region_id, json.dumps(payload, ensure_ascii=False), datetime.datetime.now().isoformat())
+                )
+
+    # успешно завершенный запуск больше не нужен; заброшенные удаляются по CHECKPOINT_TTL_SECONDS
+    def remove(self, run_id: str, parser_key: str) -> None:
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.execute("DELETE FROM checkpoints WHERE run_id = ? AND parser_key = ?", (run_id, parser_key))
+
+    def evict(self, ttl_seconds: int = CHECKPOINT_TTL_SECONDS) -> int:
+        deadline = (datetime.datetime.now() - datetime.timedelta(seconds=ttl_seconds)).isoformat()
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                return connection.execute("DELETE FROM checkpoints WHERE updated_at < ?", (deadline,)).rowcount
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            row = self.connect().execute(
+                "SELECT COUNT(DISTINCT run_id || '/' || parser_key) AS runs, COUNT(*) AS regions FROM checkpoints"
+            ).fetchone()
+        return {
+            "open_runs": row["runs"],
+            "saved_regions": row["regions"],
+            "resumed_runs": self.resumed_runs,
+            "resumed_regions": self.resumed_regions,
+        }
+
+    def close(self) -> None:
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+
+checkpoint_store = CheckpointStore()
+
+
+# чекпоинт одного запуска парсера; парсер сохраняет каждый пройденный регион сразу после разбора
+class RunCheckpoint:
+    def __init__(self, run_id: str, parser_key: str, store: CheckpointStore = checkpoint_store):
+        self.run_id = run_id
+        self.parser_key = parser_key
+        self.store = store
+
+    def get_run_id(self) -> str:
+        return self.run_id
+
+    def get_parser_key(self) -> str:
+        return self.parser_key
+
+    def load(self) -> dict:
+        completed = self.store.load(self.run_id, self.parser_key)
+        if completed:
+            self.store.resumed_runs += 1
+            self.store.resumed_regions += len(completed)
+            print(f"{self.parser_key} run {self.run_id} resumes after {len(completed)} completed regions")
+        return completed
+
+    def save(self, region_id: str, payload) -> None:
+        self.store.save(self.run_id, self.parser_key, region_id, payload)
+
+    def remove(self) -> None:
+        self.store.remove(self.run_id, self.parser_key)
+
+
+# чекпоинт текущего запуска задается воркером перед вызовом парсера; функции парсеров не меняют сигнатуру
+current_checkpoint: ContextVar[RunCheckpoint | None] = ContextVar("current_checkpoint", default=None)
+
+
+def get_checkpoint() -> RunCheckpoint | None:
+    return current_checkpoint.get()
@@ -0,0 +1,122 @@
+import os
+import time
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future
+
+RUNTIME_MAX_THREADS = int(os.environ.get("RUNTIME_MAX_THREADS", 8))
+# пустое значение (так его передает docker-compose, если переменная не задана) - по числу CPU
+RUNTIME_MAX_PROCESSES = int(os.environ.get("RUNTIME_MAX_PROCESSES") or max(1, (os.cpu_count() or 2) - 1))
+
+
+class PoolStats:
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self.submitted = 0
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def on_submit(self):
+        with self.lock:
+            self.submitted += 1
+            self.active += 1
+
+    def on_done(self, started: float, future: Future):
+        with self.lock:
+            self.active -= 1
+            self.busy_seconds += time.monotonic() - started
+            if future.cancelled() or future.exception() is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "max_workers": self.max_workers,
+                "active": self.active,
+                "utilization": self.active / self.max_workers,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "busy_seconds": round(self.busy_seconds, 3),
+            }
+
+
+# общий пул потоков для блокирующих вызовов (браузер, диск, requests)
+# и пул процессов для тяжелых вычислений (кодирование xlsx, разбор docx)
+class ExecutionRuntime:
+    def __init__(self, max_threads: int = RUNTIME_MAX_THREADS, max_processes: int = RUNTIME_MAX_PROCESSES):
+        self.max_threads = max_threads
+        self.max_processes = max_processes
+        self.thread_pool: ThreadPoolExecutor | None = None
+        self.process_pool: ProcessPoolExecutor | None = None
+        self.thread_stats = PoolStats(max_threads)
+        self.process_stats = PoolStats(max_processes)
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.thread_pool is None:
+                self.thread_pool = ThreadPoolExecutor(max_workers=self.max_threads, thread_name_prefix="parsing-io")
+            if self.process_pool is None:
+                self.process_pool = ProcessPoolExecutor(
+                    max_workers=self.max_processes,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+
+    def shutdown(self):
+        with self.lock:
+            thread_pool, self.thread_pool = self.thread_pool, None
+            process_pool, self.process_pool = self.process_pool, None
+        if thread_pool is not None:
+            thread_pool.shutdown(wait=False, cancel_futures=True)
+        if process_pool is not None:
+            process_pool.shutdown(wait=False, cancel_futures=True)
+
+    def get_thread_pool(self) -> ThreadPoolExecutor:
+        if self.thread_pool is None:
+            self.start()
+        return self.thread_pool
+
+    def get_process_pool(self) -> ProcessPoolExecutor:
+        if self.process_pool is None:
+            self.start()
+        return self.process_pool
+
+    def submit(self, executor, stats: PoolStats, func, *args) -> Future:
+        started = time.monotonic()
+        stats.on_submit()
+        try:
+            future = executor.submit(func, *args)
+        except Exception:
+            with stats.lock:
+                stats.active -= 1
+            raise
+        future.add_done_callback(lambda done: stats.on_done(started, done))
+        return future
+
+    async def run_blocking(self, func, *args):
+        future = self.submit(self.get_thread_pool(), self.thread_stats, func, *args)
+        return await asyncio.wrap_future(future)
+
+    async def run_cpu(self, func, *args):
+        future = self.submit(self.get_process_pool(), self.process_stats, func, *args)
+        return await asyncio.wrap_future(future)
+
+    # для синхронного кода парсеров, который уже выполняется в пуле потоков
+    def run_cpu_sync(self, func, *args):
+        return self.submit(self.get_process_pool(), self.process_stats, func, *args).result()
+
+    def get_stats(self) -> dict:
+        return {
+            "threads": self.thread_stats.get_stats(),
+            "processes": self.process_stats.get_stats(),
+        }
+
+
+executor_runtime = ExecutionRuntime()
@@ -0,0 +1,130 @@
+import os
+import hashlib
+import datetime
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+# хэш содержимого таблицы (колонки и строки): одинаковые по данным результаты дают один хэш,
+# хотя xlsx с ними отличается байтами из-за времени создания внутри файла
+def dataframe_digest(df: "pd.DataFrame") -> str:
+    digest = hashlib.sha256()
+    digest.update(repr(list(df.columns)).encode("utf-8"))
+    digest.update(df.to_csv(index=False).encode("utf-8"))
+    return digest.hexdigest()
+
+
+# форматы результатов и расширения файлов; xlsx - формат по умолчанию, как и раньше
+OUTPUT_FORMATS = {"xlsx": ".xlsx", "csv": ".csv", "parquet": ".parquet", "arrow": ".arrow"}
+DEFAULT_OUTPUT_FORMAT = "xlsx"
+XLSX_SHEET_NAME = "Sheet1"
+
+
+def get_output_format(file_name: str) -> str:
+    extension = os.path.splitext(file_name)[1].lower()
+    for output_format, format_extension in OUTPUT_FORMATS.items():
+        if format_extension == extension:
+            return output_format
+    raise ValueError(f"unknown output format of {file_name}")
+
+
+def cell_value(value):
+    import pandas as pd
+    if value is None or (not isinstance(value, (list, tuple, dict)) and pd.isna(value)):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+
+# xlsx пишется потоково (write_only): строки сразу уходят в файл, книга целиком в памяти не собирается
+def write_xlsx(df: "pd.DataFrame", path: str) -> None:
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(XLSX_SHEET_NAME)
+    sheet.append([str(column) for column in df.columns])
+    for row in df.itertuples(index=False, name=None):
+        sheet.append([cell_value(value) for value in row])
+    workbook.save(path)
+
+
+def write_dataframe(df: "pd.DataFrame", path: str, output_format: str) -> None:
+    match output_format:
+        case "xlsx":
+            write_xlsx(df, path)
+        case "csv":
+            df.to_csv(path, index=False)
+        case "parquet":
+            df.to_parquet(path, index=False)
+        case "arrow":
+            df.reset_index(drop=True).to_feather(path)
+        case _:
+            raise ValueError(f"unknown output format {output_format}")
+
+
+def read_dataframe(path: str, output_format: str) -> "pd.DataFrame":
+    import pandas as pd
+    match output_format:
+        case "xlsx":
+            return pd.read_excel(path)
+        case "csv":
+            return pd.read_csv(path)
+        case "parquet":
+            return pd.read_parquet(path)
+        case "arrow":
+            return pd.read_feather(path)
+        case _:
+            raise ValueError(f"unknown output format {output_format}")
+
+
+# результат в другом формате получается из уже сохраненного файла, без повторного запуска парсера
+def convert_artifact(source: str, source_format: str, target: str, target_format: str) -> None:
+    write_dataframe(read_dataframe(source, source_format), target, target_format)
+
+
+DIFF_STATUS_COLUMN = "Изменение"
+DIFF_PREVIOUS_SUFFIX = " (было)"
+
+
+# отличия текущего результата от прошлого: добавленные, удаленные и измененные строки;
+# у измененных рядом с новыми значениями лежат прошлые в колонках "<колонка> (было)"
+def dataframe_diff(previous: "pd.DataFrame", current: "pd.DataFrame", key_columns: list[str]) -> "pd.DataFrame":
+    key_columns = [column for column in key_columns if column in current.columns and column in previous.columns]
+    if not key_columns:
+        key_columns = [column for column in current.columns if column in previous.columns]
+    value_columns = [column for column in current.columns if column not in key_columns and column in previous.columns]
+    merged = current.merge(
+        previous[key_columns + value_columns], on=key_columns, how="outer",
+        suffixes=("", DIFF_PREVIOUS_SUFFIX), indicator=True
+    )
+    both = merged["_merge"] == "both"
+    changed = ~both
+    for column in value_columns:
+        new, old = merged[column], merged[column + DIFF_PREVIOUS_SUFFIX]
+        changed |= both & ~(new.eq(old) | (new.isna() & old.isna()))
+    status = merged["_merge"].map({"left_only": "добавлено", "right_only": "удалено", "both": "изменено"}).astype(str)
+    diff = merged[changed].drop(columns="_merge")
+    diff.insert(0, DIFF_STATUS_COLUMN, status[changed])
+    return diff.reset_index(drop=True)
+
+
+def artifacts_diff(previous: str, previous_format: str, current: str, current_format: str, key_columns: list[str], target: str, target_format: str) -> int:
+    diff = dataframe_diff(read_dataframe(previous, previous_format), read_dataframe(current, current_format), key_columns)
+    write_dataframe(diff, target, target_format)
+    return len(diff)
+
+
+# перенос снимка в файл датасета истории; колонка snapshot хранит время снимка,
+# чтобы при чтении всего датасета строки разных снимков различались
+def artifact_to_history(source: str, source_format: str, target: str, snapshot: datetime.datetime, history_format: str) -> tuple[int, int]:
+    df = read_dataframe(source, source_format)
+    df["snapshot"] = snapshot
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_path = f"{target}.{os.getpid()}.tmp"
+    write_dataframe(df, tmp_path, history_format)
+    os.replace(tmp_path, target)
+    return len(df), os.path.getsize(target)
@@ -0,0 +1,206 @@
+import os
+import time
+import random
+import asyncio
+import threading
+import importlib.util
+from urllib.parse import urlparse
+
+import httpx
+
+from .rate_limiter import rate_limiter, THROTTLE_STATUSES
+
+HTTP2 = os.environ.get("HTTP2", "1") == "1"
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", 100))
+HTTP_MAX_KEEPALIVE = int(os.environ.get("HTTP_MAX_KEEPALIVE", 20))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", 30))
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", 30))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", 10))
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", 3))
+HTTP_RETRY_BACKOFF = float(os.environ.get("HTTP_RETRY_BACKOFF", 1))
+
+# ответы, после которых запрос повторяется; остальные статусы обрабатывает вызывающий код
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class HostStats:
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.statuses: dict[int, int] = {}
+        self.http_versions: dict[str, int] = {}
+
+    def record(self, response: httpx.Response) -> None:
+        self.statuses[response.status_code] = self.statuses.get(response.status_code, 0) + 1
+        self.http_versions[response.http_version] = self.http_versions.get(response.http_version, 0) + 1
+
+    def to_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "failures": self.failures,
+            "statuses": dict(self.statuses),
+            "http_versions": dict(self.http_versions),
+        }
+
+
+# общие HTTP-клиенты приложения: соединения к каждому хосту держатся открытыми между запусками парсеров.
+# Асинхронный клиент - для парсеров в event loop, синхронный - для кода парсеров в пуле потоков
+class HttpClientPool:
+    def __init__(self):
+        self.async_client: httpx.AsyncClient | None = None
+        self.async_loop: asyncio.AbstractEventLoop | None = None
+        self.client: httpx.Client | None = None
+        self.lock = threading.Lock()
+        self.hosts: dict[str, HostStats] = {}
+        # HTTP/2 требует пакет h2 (httpx[http2]); без него клиенты работают по HTTP/1.1
+        self.http2 = HTTP2 and importlib.util.find_spec("h2") is not None
+
+    def get_client_options(self) -> dict:
+        return {
+            "http2": self.http2,
+            "limits": httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            "timeout": httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        }
+
+    def start(self) -> None:
+        if HTTP2 and not self.http2:
+            print("h2 is not installed, http clients use HTTP/1.1")
+        self.get_client()
+        self.get_async_client()
+
+    # клиент привязан к event loop, в котором создан; вне приложения (скрипты, бенчмарки) создается заново
+    def get_async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self.async_client is None or self.async_loop is not loop:
+            self.async_client = httpx.AsyncClient(**self.get_client_options())
+            self.async_loop = loop
+        return self.async_client
+
+    def get_client(self) -> httpx.Client:
+        with self.lock:
+            if self.client is None:
+                self.client = httpx.Client(**self.get_client_options())
+            return self.client
+
+    def get_host_stats(self, host: str) -> HostStats:
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = HostStats()
+            return self.hosts[host]
+
+    def get_retry_delay(self, attempt: int, backoff: float) -> float:
+        return backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+
+    # запрос с повторами: ошибки соединения и RETRY_STATUSES повторяются с экспоненциальной паузой,
+    # 429/503 - после паузы, которую назначил rate_limiter по Retry-After. Каждая попытка берет токен хоста.
+    # После последней попытки возвращается последний ответ, ошибка соединения пробрасывается
+    async def request(self, method: str, url: str, retries: int | None = None, backoff: float | None = None, **kwargs) -> httpx.Response:
+        retries = HTTP_RETRIES if retries is None else retries
+        backoff = HTTP_RETRY_BACKOFF if backoff is None else backoff
+        host = urlparse(url).netloc
+        stats = self.get_host_stats(host)
+        client = self.get_async_client()
+        throttled = False
+        for attempt in range(retries + 1):
+            if attempt:
+                stats.retries += 1
+                if not throttled:
+                    await asyncio.sleep(self.get_retry_delay(attempt, backoff))
+            await rate_limiter.acquire(url)
+            stats.requests += 1
+            try:
+                response = await client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                print(f"{method} {url}, попытка {attempt + 1}: {e!r}")
+                if attempt == retries:
+                    stats.failures += 1
+                    raise
+                throttled = False
+                continue
+            stats.record(response)
+            rate_limiter.on_response(url, response.status_code, response.headers.get("Retry-After"))
+            throttled = response.status_code in THROTTLE_STATUSES
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                return response
+            print(f"{method} {url}, попытка {attempt + 1}: статус {response.status_code}")
+        raise RuntimeError("unreachable")
+
+    # тело успешного ответа пишется в path по частям, без чтения файла в память;
+    # файл появляется только после полной загрузки, недокачанная часть удаляется
+    def stream_to_file(self, client: httpx.Client, method: str, url: str, path: str, **kwargs) -> httpx.Response:
+        with client.stream(method, url, **kwargs) as response:
+            if response.status_code == 200:
+                tmp_path = f"{path}.part"
+                try:
+                    with open(tmp_path, "wb") as f:
+                        for chunk in response.iter_bytes():
+                            f.write(chunk)
+                    os.replace(tmp_path, path)
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+        return response
+
+    def request_sync(self, method: str, url: str, retries: int | None = None, backoff: float | None = None, path: str | None = None, **kwargs) -> httpx.Response:
+        retries = HTTP_RETRIES if retries is None else retries
+        backoff = HTTP_RETRY_BACKOFF if backoff is None else backoff
+        host = urlparse(url).netloc
+        stats = self.get_host_stats(host)
+        client = self.get_client()
+        throttled = False
+        for attempt in range(retries + 1):
+            if attempt:
+                stats.retries += 1
+                if not throttled:
+                    time.sleep(self.get_retry_delay(attempt, backoff))
+            rate_limiter.acquire_sync(url)
+            stats.requests += 1
+            try:
+                if path is None:
+                    response = client.request(method, url, **kwargs)
+                else:
+                    response = self.stream_to_file(client, method, url, path, **kwargs)
+            except httpx.TransportError as e:
+                print(f"{method} {url}, попытка {attempt + 1}: {e!r}")
+                if attempt == retries:
+                    stats.failures += 1
+                    raise
+                throttled = False
+                continue
+            stats.record(response)
+            rate_limiter.on_response(url, response.status_code, response.headers.get("Retry-After"))
+            throttled = response.status_code in THROTTLE_STATUSES
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                return response
+            print(f"{method} {url}, попытка {attempt + 1}: статус {response.status_code}")
+        raise RuntimeError("unreachable")
+
+    async def stop(self) -> None:
+        if self.async_client is not None:
+            await self.async_client.aclose()
+            self.async_client = None
+            self.async_loop = None
+        with self.lock:
+            if self.client is not None:
+                self.client.close()
+                self.client = None
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            hosts = {host: stats.to_dict() for host, stats in self.hosts.items()}
+        return {
+            "http2": self.http2,
+            "max_connections": HTTP_MAX_CONNECTIONS,
+            "max_keepalive": HTTP_MAX_KEEPALIVE,
+            "retries": HTTP_RETRIES,
+            "hosts": hosts,
+        }
+
+
+http_pool = HttpClientPool()
@@ -0,0 +1,150 @@
+import os
+import time
+import threading
+import asyncio
+import datetime
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+RATE_LIMIT_DEFAULT_RPS = float(os.environ.get("RATE_LIMIT_DEFAULT_RPS", 0))
+RATE_LIMIT_MIN_RPS = float(os.environ.get("RATE_LIMIT_MIN_RPS", 0.1))
+RATE_LIMIT_RECOVERY = float(os.environ.get("RATE_LIMIT_RECOVERY", 0.05))
+RATE_LIMIT_PENALTY_SECONDS = float(os.environ.get("RATE_LIMIT_PENALTY_SECONDS", 5))
+RATE_LIMIT_MAX_RETRY_AFTER = float(os.environ.get("RATE_LIMIT_MAX_RETRY_AFTER", 300))
+
+# ответы, которыми сайт просит снизить частоту запросов
+THROTTLE_STATUSES = {429, 503}
+
+
+def get_host(url: str) -> str:
+    return urlparse(url).netloc or url
+
+
+# Retry-After: число секунд или HTTP-дата
+def parse_retry_after(value: str | None) -> float | None:
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            date = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=datetime.timezone.utc)
+        seconds = (date - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+    return min(max(seconds, 0.0), RATE_LIMIT_MAX_RETRY_AFTER)
+
+
+# token bucket одного хоста: burst запросов подряд, дальше не чаще rate в секунду.
+# 429/503 вдвое снижают rate (не ниже RATE_LIMIT_MIN_RPS) и закрывают хост на Retry-After,
+# каждый успешный ответ возвращает RATE_LIMIT_RECOVERY от настроенной частоты
+class TokenBucket:
+    def __init__(self, host: str, rate: float, burst: int = 1):
+        self.host = host
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.decreased_at = 0.0
+        self.lock = threading.Lock()
+        self.acquired = 0
+        self.waited = 0.0
+        self.throttled = 0
+
+    def configure(self, rate: float, burst: int) -> None:
+        with self.lock:
+            self.max_rate = rate
+            self.rate = rate
+            self.burst = max(1, burst)
+            self.tokens = min(self.tokens, float(self.burst))
+
+    # берет токен и возвращает, сколько ждать до начала запроса; ждет вызывающий код (asyncio или поток)
+    def reserve(self) -> float:
+        with self.lock:
+            now = time.monotonic()
+            delay = 0.0
+            if self.rate > 0:
+                self.tokens = min(float(self.burst), self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                self.tokens -= 1
+                if self.tokens < 0:
+                    delay = -self.tokens / self.rate
+            delay = max(delay, self.blocked_until - now)
+            self.acquired += 1
+            self.waited += delay
+        return delay
+
+    def on_response(self, status: int, retry_after: str | None = None) -> None:
+        with self.lock:
+            if status in THROTTLE_STATUSES:
+                self.throttled += 1
+                pause = parse_retry_after(retry_after)
+                now = time.monotonic()
+                # ответы на запросы, ушедшие до прошлого снижения, частоту повторно не снижают
+                if self.rate > 0 and now - self.decreased_at >= 1 / self.rate:
+                    self.rate = max(min(RATE_LIMIT_MIN_RPS, self.max_rate), self.rate / 2)
+                    self.tokens = min(self.tokens, 0.0)
+                    self.decreased_at = now
+                elif self.rate <= 0 and pause is None:
+                    pause = RATE_LIMIT_PENALTY_SECONDS
+                if pause:
+                    self.blocked_until = max(self.blocked_until, now + pause)
+                print(f"{self.host} throttled with {status}, rate {self.rate:.2f}/s, paused for {pause or 0:.1f} sec.")
+            elif status < 400 and self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * RATE_LIMIT_RECOVERY)
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "rate": round(self.rate, 3),
+                "max_rate": self.max_rate,
+                "burst": self.burst,
+                "acquired": self.acquired,
+                "waited_seconds": round(self.waited, 3),
+                "throttled": self.throttled,
+                "blocked_seconds": round(max(0.0, self.blocked_until - time.monotonic()), 3),
+            }
+
+
+# общий ограничитель частоты запросов по хостам: парсеры, которые ходят на один сайт
+# (через http_pool или браузером), делят один bucket. Частота задается модулем парсера через configure
+class RateLimiter:
+    def __init__(self):
+        self.buckets: dict[str, TokenBucket] = {}
+        self.lock = threading.Lock()
+
+    def get_bucket(self, url: str) -> TokenBucket:
+        host = get_host(url)
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(host, RATE_LIMIT_DEFAULT_RPS)
+            return self.buckets[host]
+
+    # rate 0 - без ограничения частоты, но с паузами по Retry-After
+    def configure(self, url: str, rate: float, burst: int = 1) -> None:
+        self.get_bucket(url).configure(rate, burst)
+
+    async def acquire(self, url: str) -> None:
+        delay = self.get_bucket(url).reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+    def acquire_sync(self, url: str) -> None:
+        delay = self.get_bucket(url).reserve()
+        if delay:
+            time.sleep(delay)
+
+    def on_response(self, url: str, status: int, retry_after: str | None = None) -> None:
+        self.get_bucket(url).on_response(status, retry_after)
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            buckets = dict(self.buckets)
+        return {host: bucket.get_stats() for host, bucket in buckets.items()}
+
+
+rate_limiter = RateLimiter()
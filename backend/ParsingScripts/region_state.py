@@ -0,0 +1,124 @@
+import os
+import json
+import sqlite3
+import hashlib
+import datetime
+import threading
+
+REGION_STATE_PATH = os.environ.get("REGION_STATE_PATH", "./oldData/regions.sqlite3")
+INCREMENTAL_RUNS = os.environ.get("INCREMENTAL_RUNS", "0") == "1"
+
+
+def fingerprint(data: bytes | str) -> str:
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+# что известно о регионе после прошлого запуска: отпечаток ответа источника, разобранные строки
+# и, если есть, адрес файла с валидаторами HTTP для условного запроса
+class RegionState:
+    def __init__(self, fingerprint: str, payload, url: str | None = None, etag: str | None = None, last_modified: str | None = None):
+        self.fingerprint = fingerprint
+        self.payload = payload
+        self.url = url
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def get_fingerprint(self) -> str:
+        return self.fingerprint
+
+    def get_payload(self):
+        return self.payload
+
+    def get_url(self) -> str | None:
+        return self.url
+
+    def get_etag(self) -> str | None:
+        return self.etag
+
+    def get_last_modified(self) -> str | None:
+        return self.last_modified
+
+
+# отпечатки регионов для инкрементальных запусков: неизменившийся регион берется из прошлого запуска без разбора.
+# Методы синхронные: парсеры вызывают их из пула потоков
+class RegionStateStore:
+    def __init__(self, path: str = REGION_STATE_PATH):
+        self.path = path
+        self.connection: sqlite3.Connection | None = None
+        self.lock = threading.Lock()
+        self.last_runs: dict[str, dict] = {}
+
+    def connect(self) -> sqlite3.Connection:
+        if self.connection is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS regions (
+                    parser_key TEXT NOT NULL,
+                    region_id TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    url TEXT,
+                    etag TEXT,
+                    last_modified TEXT,
+                    updated_at TEXT NOT NULL,
+                    PRIMARY KEY (parser_key, region_id)
+                );
+            """)
+            self.connection = connection
+        return self.connection
+
+    def get_all(self, parser_key: str) -> dict[str, RegionState]:
+        with self.lock:
+            rows = self.connect().execute("SELECT * FROM regions WHERE parser_key = ?", (parser_key,)).fetchall()
+        return {
+            row["region_id"]: RegionState(
+                row["fingerprint"], json.loads(row["payload"]), row["url"], row["etag"], row["last_modified"]
+            )
+            for row in rows
+        }
+
+    def set(self, parser_key: str, region_id: str, state: RegionState) -> None:
+        self.set_many(parser_key, {region_id: state})
+
+    def set_many(self, parser_key: str, states: dict[str, RegionState]) -> None:
+        if not states:
+            return
+        updated_at = datetime.datetime.now().isoformat()
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO regions (parser_key, region_id, fingerprint, payload, url, etag, last_modified, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [
+                        (parser_key, region_id, state.fingerprint, json.dumps(state.payload, ensure_ascii=False),
+                         state.url, state.etag, state.last_modified, updated_at)
+                        for region_id, state in states.items()
+                    ]
+                )
+
+    # итог запуска: сколько регионов взято из прошлого запуска, сколько разобрано заново
+    def record_run(self, parser_key: str, reused: int, changed: int) -> None:
+        self.last_runs[parser_key] = {
+            "reused": reused,
+            "changed": changed,
+            "finished_at": datetime.datetime.now().isoformat(),
+        }
+        print(f"{parser_key} incremental run: {reused} regions reused, {changed} changed")
+
+    def get_stats(self) -> dict:
+        return {"incremental": INCREMENTAL_RUNS, "last_runs": dict(self.last_runs)}
+
+    def close(self) -> None:
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+
+region_state_store = RegionStateStore()
@@ -0,0 +1,103 @@
+import asyncio
+import datetime
+from types import MappingProxyType
+from typing import Mapping
+
+
+# последний результат парсера; заменяется целиком, поэтому имя файла и время всегда согласованы
+class LatestParse:
+    def __init__(self, file_name: str = "", date_time: datetime.datetime = None, blob = None, digest: str | None = None):
+        self.file_name = file_name
+        self.date_time = date_time
+        self.blob = blob # ссылка на blob в хранилище по содержимому (blob_store.BlobRef)
+        self.digest = digest # хэш содержимого таблицы, по нему находятся файлы в других форматах
+
+    def get_file_name(self) -> str:
+        return self.file_name
+
+    def get_date_time(self) -> datetime.datetime:
+        return self.date_time
+
+    def get_blob(self):
+        return self.blob
+
+    def get_digest(self) -> str | None:
+        return self.digest
+
+
+# изменяемое состояние запусков парсера, живет отдельно от снимка реестра и переживает его замену
+class ParserState:
+    def __init__(self):
+        self.latest = LatestParse()
+        self.run_lock = asyncio.Lock()
+        self.store_lock = asyncio.Lock()
+
+    def get_latest(self) -> LatestParse:
+        return self.latest
+
+    def set_latest(self, file_name: str, date_time: datetime.datetime, blob = None, digest: str | None = None):
+        self.latest = LatestParse(file_name, date_time, blob, digest)
+
+    def get_run_lock(self) -> asyncio.Lock:
+        return self.run_lock
+
+    # короткая блокировка записи результата в хранилище; уплотнение берет ее вместо блокировки запуска
+    def get_store_lock(self) -> asyncio.Lock:
+        return self.store_lock
+
+
+# неизменяемый снимок реестра; читатели берут ссылку на снимок и работают с ним без блокировок
+class RegistrySnapshot:
+    def __init__(self, parsers: dict, disabled: frozenset, version: int):
+        self.parsers: Mapping[str, "Parser"] = MappingProxyType(dict(parsers))
+        self.disabled = disabled
+        self.enabled: Mapping[str, "Parser"] = MappingProxyType(
+            {key: parser for key, parser in parsers.items() if key not in disabled}
+        )
+        self.version = version
+
+    def get(self, key: str) -> "Parser | None":
+        return self.parsers.get(key)
+
+    def get_enabled(self) -> Mapping[str, "Parser"]:
+        return self.enabled
+
+    def get_all(self) -> Mapping[str, "Parser"]:
+        return self.parsers
+
+    def is_enabled(self, key: str) -> bool:
+        return key in self.enabled
+
+    def get_version(self) -> int:
+        return self.version
+
+
+# запись собирает новый снимок и подменяет ссылку одним присваиванием (copy-on-write);
+# внутри нет await, поэтому в event loop замена атомарна
+class ParserRegistry:
+    def __init__(self, parsers: list["Parser"]):
+        self.snapshot = RegistrySnapshot({parser.get_key(): parser for parser in parsers}, frozenset(), 1)
+
+    def get_snapshot(self) -> RegistrySnapshot:
+        return self.snapshot
+
+    def get(self, key: str) -> "Parser | None":
+        return self.snapshot.get(key)
+
+    def register(self, parser: "Parser") -> RegistrySnapshot:
+        current = self.snapshot
+        previous = current.get(parser.get_key())
+        if previous is not None:
+            parser.set_state(previous.get_state())
+        parsers = dict(current.get_all())
+        parsers[parser.get_key()] = parser
+        self.snapshot = RegistrySnapshot(parsers, current.disabled - {parser.get_key()}, current.get_version() + 1)
+        return self.snapshot
+
+    def set_enabled(self, key: str, enabled: bool) -> RegistrySnapshot:
+        current = self.snapshot
+        if current.get(key) is None:
+            raise KeyError(key)
+        disabled = current.disabled - {key} if enabled else current.disabled | {key}
+        self.snapshot = RegistrySnapshot(current.get_all(), disabled, current.get_version() + 1)
+        return self.snapshot
@@ -0,0 +1,234 @@
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+
+from .executors import executor_runtime
+
+# selenium импортируется при создании первой сессии, а не при старте сервиса
+if TYPE_CHECKING:
+    from selenium.webdriver.remote.webdriver import WebDriver
+
+SELENIUM_URL = os.environ.get("SELENIUM_URL")
+DOWNLOAD_DIR = os.environ.get("DOWNLOAD_DIR")
+SELENIUM_POOL_SIZE = int(os.environ.get("SELENIUM_POOL_SIZE", 2))
+SELENIUM_SESSION_MAX_USES = int(os.environ.get("SELENIUM_SESSION_MAX_USES", 20))
+SELENIUM_BORROW_TIMEOUT = float(os.environ.get("SELENIUM_BORROW_TIMEOUT", 600))
+
+
+def create_driver(local = False, headless = True) -> "WebDriver":
+    from selenium import webdriver
+
+    options = webdriver.ChromeOptions()
+    if headless:
+        options.add_argument('--headless=new')
+        options.add_argument('--disable-gpu')
+        options.add_argument('--no-sandbox')
+        options.add_argument('--disable-dev-shm-usage')
+    options.add_argument("--disable-blink-features=AutomationControlled")
+    options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36")
+    options.add_argument("--lang=ru-RU")
+    options.add_argument("--window-size=1920,1080")
+    options.add_argument("--disable-extensions")
+    options.add_argument("--disable-plugins")
+    options.add_argument("--disable-popup-blocking")
+    options.add_argument('--start-maximized')
+
+    prefs = {
+        "download.default_directory": DOWNLOAD_DIR,
+        "download.prompt_for_download": False,
+        "download.directory_upgrade": True,
+        "safebrowsing.enabled": True
+    }
+    options.add_experimental_option("prefs", prefs)
+
+
+    if local:
+        driver = webdriver.Chrome(options=options)
+    else:
+        driver = webdriver.Remote(
+            command_executor=SELENIUM_URL,
+            options=options
+        )
+
+    if headless:
+        driver.execute_cdp_cmd(
+            "Browser.setDownloadBehavior",
+            {
+                "behavior": "allow",
+                "downloadPath": DOWNLOAD_DIR
+            }
+        )
+
+    return driver
+
+
+class PooledDriver:
+    def __init__(self, driver: "WebDriver"):
+        self.driver = driver
+        self.uses = 0
+        self.created_at = time.time()
+
+    def get_driver(self) -> "WebDriver":
+        return self.driver
+
+    def get_uses(self) -> int:
+        return self.uses
+
+    def add_use(self):
+        self.uses += 1
+
+
+def is_healthy(driver: "WebDriver") -> bool:
+    try:
+        driver.execute_script("return 1;")
+        return True
+    except Exception:
+        return False
+
+
+# очистка состояния между заимствованиями: cookies, storage текущего origin и вкладки
+def reset_session(driver: "WebDriver") -> bool:
+    try:
+        driver.delete_all_cookies()
+        driver.execute_script("window.localStorage.clear(); window.sessionStorage.clear();")
+        for handle in driver.window_handles[1:]:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(driver.window_handles[0])
+        driver.get("about:blank")
+        return True
+    except Exception as e:
+        print(f"webdriver session reset failed: {e}")
+        return False
+
+
+def quit_driver(driver: "WebDriver"):
+    try:
+        driver.quit()
+    except Exception as e:
+        print(f"webdriver quit failed: {e}")
+
+
+# пул прогретых сессий selenium; используется из синхронного кода парсеров в потоках
+class WebDriverPool:
+    def __init__(self, size: int = SELENIUM_POOL_SIZE, max_uses: int = SELENIUM_SESSION_MAX_USES, factory = create_driver):
+        self.size = size
+        self.max_uses = max_uses
+        self.factory = factory
+        self.idle: queue.Queue[PooledDriver] = queue.Queue()
+        self.slots = threading.BoundedSemaphore(size)
+        self.stats_lock = threading.Lock()
+        self.in_use = 0
+        self.created = 0
+        self.recycled = 0
+        self.failed_health_checks = 0
+        self.borrowed = 0
+        self.closed = False
+
+    def get_size(self) -> int:
+        return self.size
+
+    def new_session(self) -> PooledDriver:
+        session = PooledDriver(self.factory())
+        with self.stats_lock:
+            self.created += 1
+        return session
+
+    def discard(self, session: PooledDriver):
+        with self.stats_lock:
+            self.recycled += 1
+        quit_driver(session.get_driver())
+
+    def warm_up(self):
+        for _ in range(self.size - self.idle.qsize()):
+            try:
+                self.idle.put(self.new_session())
+            except Exception as e:
+                print(f"webdriver pool warm up failed: {e}")
+                break
+
+    def borrow(self, timeout: float = SELENIUM_BORROW_TIMEOUT) -> PooledDriver:
+        if not self.slots.acquire(timeout=timeout):
+            raise TimeoutError("no free webdriver session in pool")
+        try:
+            while True:
+                try:
+                    session = self.idle.get_nowait()
+                except queue.Empty:
+                    session = self.new_session()
+                    break
+                if is_healthy(session.get_driver()):
+                    break
+                with self.stats_lock:
+                    self.failed_health_checks += 1
+                self.discard(session)
+        except Exception:
+            self.slots.release()
+            raise
+        with self.stats_lock:
+            self.in_use += 1
+            self.borrowed += 1
+        return session
+
+    def release(self, session: PooledDriver, broken: bool = False):
+        try:
+            session.add_use()
+            if broken or self.closed or session.get_uses() >= self.max_uses:
+                self.discard(session)
+            elif not reset_session(session.get_driver()):
+                self.discard(session)
+            else:
+                self.idle.put(session)
+        finally:
+            with self.stats_lock:
+                self.in_use -= 1
+            self.slots.release()
+
+    @contextmanager
+    def session(self, timeout: float = SELENIUM_BORROW_TIMEOUT):
+        pooled = self.borrow(timeout)
+        broken = False
+        try:
+            yield pooled.get_driver()
+        except Exception:
+            broken = True
+            raise
+        finally:
+            self.release(pooled, broken)
+
+    def close_idle(self):
+        while True:
+            try:
+                session = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            quit_driver(session.get_driver())
+
+    async def start(self):
+        self.closed = False
+        await executor_runtime.run_blocking(self.warm_up)
+        print(f"webdriver pool started, {self.idle.qsize()}/{self.size} sessions ready")
+
+    async def stop(self):
+        self.closed = True
+        await executor_runtime.run_blocking(self.close_idle)
+        print("webdriver pool stopped")
+
+    def get_stats(self) -> dict:
+        with self.stats_lock:
+            return {
+                "size": self.size,
+                "idle": self.idle.qsize(),
+                "in_use": self.in_use,
+                "created": self.created,
+                "recycled": self.recycled,
+                "failed_health_checks": self.failed_health_checks,
+                "borrowed": self.borrowed,
+                "max_uses": self.max_uses,
+            }
+
+
+webdriver_pool = WebDriverPool()
@@ -0,0 +1,398 @@
+import os
+import sqlite3
+import datetime
+import threading
+
+import ParsingScripts
+from blob_store import blob_store, BlobRef
+
+ARTIFACT_INDEX_PATH = os.environ.get("ARTIFACT_INDEX_PATH", "./oldData/artifacts.sqlite3")
+
+
+class ArtifactRecord:
+    def __init__(self, parser_key: str, file_name: str, date_time: datetime.datetime, blob: BlobRef, digest: str | None = None, owner: str | None = None):
+        self.parser_key = parser_key
+        self.file_name = file_name
+        self.date_time = date_time
+        self.blob = blob
+        self.digest = digest # хэш содержимого таблицы; у файлов, перенесенных из старой папки, его нет
+        # файл результата запуска, от которого получен этот файл (другой формат); None - сам результат запуска.
+        # Производные файлы не бывают последним или прошлым результатом и уплотняются вместе со своим результатом
+        self.owner = owner
+
+    def get_parser_key(self) -> str:
+        return self.parser_key
+
+    def get_file_name(self) -> str:
+        return self.file_name
+
+    def get_date_time(self) -> datetime.datetime:
+        return self.date_time
+
+    def get_blob(self) -> BlobRef:
+        return self.blob
+
+    def get_digest(self) -> str | None:
+        return self.digest
+
+    def get_owner(self) -> str | None:
+        return self.owner
+
+    def to_dict(self) -> dict:
+        return {
+            "parser_key": self.parser_key,
+            "file_name": self.file_name,
+            "format": os.path.splitext(self.file_name)[1].lstrip(".").lower(),
+            "date_time": self.date_time.isoformat(),
+            "size": self.blob.get_size(),
+            "sha256": self.blob.get_sha256(),
+            "owner": self.owner,
+        }
+
+
+# снимок, перенесенный из xlsx в колоночный датасет истории
+class HistoryRecord:
+    def __init__(self, parser_key: str, file_name: str, date_time: datetime.datetime, path: str, rows: int, size: int):
+        self.parser_key = parser_key
+        self.file_name = file_name
+        self.date_time = date_time
+        self.path = path
+        self.rows = rows
+        self.size = size
+
+    def get_parser_key(self) -> str:
+        return self.parser_key
+
+    def get_file_name(self) -> str:
+        return self.file_name
+
+    def get_date_time(self) -> datetime.datetime:
+        return self.date_time
+
+    def get_path(self) -> str:
+        return self.path
+
+    def to_dict(self) -> dict:
+        return {
+            "parser_key": self.parser_key,
+            "file_name": self.file_name,
+            "date_time": self.date_time.isoformat(),
+            "path": self.path,
+            "rows": self.rows,
+            "size": self.size,
+        }
+
+
+# индекс артефактов парсеров: имя, время и blob каждого результата, плюс соответствие
+# "содержимое таблицы -> blob", чтобы одинаковые результаты не кодировались и не записывались повторно.
+# Папка парсера сканируется один раз, когда индекса для него еще нет; дальше индекс обновляют воркеры при записи
+class ArtifactIndex:
+    def __init__(self, path: str = ARTIFACT_INDEX_PATH):
+        self.path = path
+        self.connection: sqlite3.Connection | None = None
+        self.lock = threading.Lock()
+
+    def connect(self) -> sqlite3.Connection:
+        if self.connection is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            has_blobs = connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'blobs'"
+            ).fetchone() is not None
+            # соответствие содержимого и blob-ов до выбора форматов было только для xlsx; это кэш, его можно сбросить
+            content_columns = [row["name"] for row in connection.execute("PRAGMA table_info(contents)")]
+            if content_columns and "format" not in content_columns:
+                connection.execute("DROP TABLE contents")
+            artifact_columns = [row["name"] for row in connection.execute("PRAGMA table_info(artifacts)")]
+            if artifact_columns and "digest" not in artifact_columns:
+                connection.execute("ALTER TABLE artifacts ADD COLUMN digest TEXT")
+            if artifact_columns and "owner" not in artifact_columns:
+                connection.execute("ALTER TABLE artifacts ADD COLUMN owner TEXT")
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS artifacts (
+                    parser_key TEXT NOT NULL,
+                    file_name TEXT NOT NULL,
+                    date_time TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    digest TEXT,
+                    owner TEXT,
+                    PRIMARY KEY (parser_key, file_name)
+                );
+                CREATE INDEX IF NOT EXISTS artifacts_latest ON artifacts(parser_key, date_time);
+                CREATE INDEX IF NOT EXISTS artifacts_owner ON artifacts(parser_key, owner);
+                CREATE TABLE IF NOT EXISTS indexed_parsers (
+                    parser_key TEXT PRIMARY KEY,
+                    indexed_at TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS blobs (
+                    sha256 TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    crc32 INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS contents (
+                    digest TEXT NOT NULL,
+                    format TEXT NOT NULL,
+                    sha256 TEXT NOT NULL REFERENCES blobs(sha256),
+                    PRIMARY KEY (digest, format)
+                );
+                CREATE TABLE IF NOT EXISTS history (
+                    parser_key TEXT NOT NULL,
+                    file_name TEXT NOT NULL,
+                    date_time TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    rows INTEGER NOT NULL,
+                    size INTEGER NOT NULL,
+                    PRIMARY KEY (parser_key, file_name)
+                );
+            """)
+            # индекс без таблицы blobs создан до хранилища по содержимому: папки сканируются заново,
+            # чтобы перенести старые файлы в хранилище
+            if not has_blobs:
+                with connection:
+                    connection.execute("DELETE FROM indexed_parsers")
+            self.connection = connection
+        return self.connection
+
+    def read_record(self, row: sqlite3.Row) -> ArtifactRecord:
+        blob = BlobRef(row["sha256"], row["size"], row["crc32"])
+        return ArtifactRecord(
+            row["parser_key"], row["file_name"], datetime.datetime.fromisoformat(row["date_time"]), blob, row["digest"], row["owner"]
+        )
+
+    def insert_blob(self, connection: sqlite3.Connection, blob: BlobRef) -> None:
+        connection.execute(
+            "INSERT OR IGNORE INTO blobs (sha256, size, crc32) VALUES (?, ?, ?)",
+            (blob.get_sha256(), blob.get_size(), blob.get_crc32())
+        )
+
+    def add_sync(self, record: ArtifactRecord) -> None:
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                self.insert_blob(connection, record.blob)
+                connection.execute(
+                    "INSERT OR REPLACE INTO artifacts (parser_key, file_name, date_time, size, sha256, digest, owner) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (record.parser_key, record.file_name, record.date_time.isoformat(), record.blob.get_size(),
+                     record.blob.get_sha256(), record.digest, record.owner)
+                )
+
+    def add_content_sync(self, digest: str, output_format: str, blob: BlobRef) -> None:
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                self.insert_blob(connection, blob)
+                connection.execute(
+                    "INSERT OR REPLACE INTO contents (digest, format, sha256) VALUES (?, ?, ?)",
+                    (digest, output_format, blob.get_sha256())
+                )
+
+    # blob той же таблицы в нужном формате: каждый формат кодируется один раз
+    def find_content_sync(self, digest: str, output_format: str) -> BlobRef | None:
+        with self.lock:
+            row = self.connect().execute(
+                "SELECT blobs.* FROM contents JOIN blobs ON blobs.sha256 = contents.sha256 "
+                "WHERE contents.digest = ? AND contents.format = ?",
+                (digest, output_format)
+            ).fetchone()
+        if row is None:
+            return None
+        blob = BlobRef(row["sha256"], row["size"], row["crc32"])
+        return blob if blob_store.exists_sync(blob) else None
+
+    # разовая миграция существующей папки: один stat на файл, скрытые и временные файлы пропускаются
+    def backfill_sync(self, parser_key: str, folder: str) -> int:
+        os.makedirs(folder, exist_ok=True)
+        records = []
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.name.startswith(".") or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                blob = blob_store.adopt_sync(entry.path)
+                records.append((
+                    parser_key, entry.name, datetime.datetime.fromtimestamp(stat.st_mtime).isoformat(),
+                    blob.get_size(), blob.get_sha256(), blob
+                ))
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                for record in records:
+                    self.insert_blob(connection, record[-1])
+                connection.executemany(
+                    "INSERT OR IGNORE INTO artifacts (parser_key, file_name, date_time, size, sha256) VALUES (?, ?, ?, ?, ?)",
+                    [record[:-1] for record in records]
+                )
+                connection.execute(
+                    "INSERT OR REPLACE INTO indexed_parsers (parser_key, indexed_at) VALUES (?, ?)",
+                    (parser_key, datetime.datetime.now().isoformat())
+                )
+        return len(records)
+
+    def get_latest_sync(self, parser_key: str, folder: str) -> ArtifactRecord | None:
+        with self.lock:
+            connection = self.connect()
+            indexed = connection.execute(
+                "SELECT 1 FROM indexed_parsers WHERE parser_key = ?", (parser_key,)
+            ).fetchone()
+        if indexed is None:
+            count = self.backfill_sync(parser_key, folder)
+            print(f"artifact index: {count} existing files of {parser_key} indexed")
+        with self.lock:
+            row = self.connect().execute(
+                "SELECT artifacts.*, blobs.crc32 FROM artifacts JOIN blobs ON blobs.sha256 = artifacts.sha256 "
+                "WHERE parser_key = ? AND owner IS NULL ORDER BY date_time DESC LIMIT 1", (parser_key,)
+            ).fetchone()
+        return self.read_record(row) if row is not None else None
+
+    # результат предыдущего запуска: последний файл, сохраненный раньше указанного времени
+    def get_previous_sync(self, parser_key: str, before: datetime.datetime) -> ArtifactRecord | None:
+        with self.lock:
+            row = self.connect().execute(
+                "SELECT artifacts.*, blobs.crc32 FROM artifacts JOIN blobs ON blobs.sha256 = artifacts.sha256 "
+                "WHERE parser_key = ? AND owner IS NULL AND date_time < ? ORDER BY date_time DESC LIMIT 1", (parser_key, before.isoformat())
+            ).fetchone()
+        return self.read_record(row) if row is not None else None
+
+    def list_sync(self, parser_key: str, limit: int) -> list[ArtifactRecord]:
+        with self.lock:
+            rows = self.connect().execute(
+                "SELECT artifacts.*, blobs.crc32 FROM artifacts JOIN blobs ON blobs.sha256 = artifacts.sha256 "
+                "WHERE parser_key = ? ORDER BY date_time DESC LIMIT ?", (parser_key, limit)
+            ).fetchall()
+        return [self.read_record(row) for row in rows]
+
+    # кандидаты на уплотнение: файлы старше before, кроме самого нового - он нужен кэшу
+    def list_compactable_sync(self, parser_key: str, before: datetime.datetime) -> list[ArtifactRecord]:
+        with self.lock:
+            rows = self.connect().execute(
+                "SELECT artifacts.*, blobs.crc32 FROM artifacts JOIN blobs ON blobs.sha256 = artifacts.sha256 "
+                "WHERE parser_key = ? AND owner IS NULL AND date_time < ? AND date_time < "
+                "(SELECT MAX(date_time) FROM artifacts WHERE parser_key = ? AND owner IS NULL) ORDER BY date_time",
+                (parser_key, before.isoformat(), parser_key)
+            ).fetchall()
+        return [self.read_record(row) for row in rows]
+
+    # файлы в других форматах, полученные из результата запуска
+    def list_owned_sync(self, parser_key: str, owner: str) -> list[ArtifactRecord]:
+        with self.lock:
+            rows = self.connect().execute(
+                "SELECT artifacts.*, blobs.crc32 FROM artifacts JOIN blobs ON blobs.sha256 = artifacts.sha256 "
+                "WHERE parser_key = ? AND owner = ?", (parser_key, owner)
+            ).fetchall()
+        return [self.read_record(row) for row in rows]
+
+    def list_history_sync(self, parser_key: str) -> list[HistoryRecord]:
+        with self.lock:
+            rows = self.connect().execute(
+                "SELECT * FROM history WHERE parser_key = ? ORDER BY date_time", (parser_key,)
+            ).fetchall()
+        return [
+            HistoryRecord(row["parser_key"], row["file_name"], datetime.datetime.fromisoformat(row["date_time"]),
+                          row["path"], row["rows"], row["size"])
+            for row in rows
+        ]
+
+    # убирает результат запуска и полученные из него файлы из индекса и, если передан history, записывает снимок
+    # в историю одной транзакцией; возвращает blob-ы, на которые больше не ссылается ни один файл - их можно удалить с диска
+    def move_to_history_sync(self, record: ArtifactRecord, history: HistoryRecord | None) -> list[BlobRef]:
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                owned = connection.execute(
+                    "SELECT artifacts.*, blobs.crc32 FROM artifacts JOIN blobs ON blobs.sha256 = artifacts.sha256 "
+                    "WHERE parser_key = ? AND owner = ?", (record.parser_key, record.file_name)
+                ).fetchall()
+                connection.execute(
+                    "DELETE FROM artifacts WHERE parser_key = ? AND (file_name = ? OR owner = ?)",
+                    (record.parser_key, record.file_name, record.file_name)
+                )
+                if history is not None:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO history (parser_key, file_name, date_time, path, rows, size) VALUES (?, ?, ?, ?, ?, ?)",
+                        (history.parser_key, history.file_name, history.date_time.isoformat(), history.path, history.rows, history.size)
+                    )
+                blobs = {record.get_blob().get_sha256(): record.get_blob()}
+                for row in owned:
+                    blobs.setdefault(row["sha256"], BlobRef(row["sha256"], row["size"], row["crc32"]))
+                released = []
+                for sha256, blob in blobs.items():
+                    referenced = connection.execute("SELECT 1 FROM artifacts WHERE sha256 = ? LIMIT 1", (sha256,)).fetchone()
+                    if referenced is not None:
+                        continue
+                    connection.execute("DELETE FROM contents WHERE sha256 = ?", (sha256,))
+                    connection.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+                    released.append(blob)
+                return released
+
+    def remove_history_sync(self, parser_key: str, file_name: str) -> None:
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.execute("DELETE FROM history WHERE parser_key = ? AND file_name = ?", (parser_key, file_name))
+
+    def get_stats_sync(self) -> dict:
+        with self.lock:
+            connection = self.connect()
+            rows = connection.execute(
+                "SELECT parser_key, COUNT(*) AS files, SUM(size) AS bytes, COUNT(DISTINCT sha256) AS blobs "
+                "FROM artifacts GROUP BY parser_key"
+            ).fetchall()
+            stored = connection.execute("SELECT COUNT(*) AS blobs, COALESCE(SUM(size), 0) AS bytes FROM blobs").fetchone()
+            history = connection.execute("SELECT COUNT(*) AS snapshots, COALESCE(SUM(size), 0) AS bytes FROM history").fetchone()
+        return {
+            "parsers": {row["parser_key"]: {"files": row["files"], "bytes": row["bytes"], "blobs": row["blobs"]} for row in rows},
+            "blobs": stored["blobs"],
+            "stored_bytes": stored["bytes"],
+            "history_snapshots": history["snapshots"],
+            "history_bytes": history["bytes"],
+        }
+
+    async def list_compactable(self, parser_key: str, before: datetime.datetime) -> list[ArtifactRecord]:
+        return await ParsingScripts.executor_runtime.run_blocking(self.list_compactable_sync, parser_key, before)
+
+    async def list_owned(self, parser_key: str, owner: str) -> list[ArtifactRecord]:
+        return await ParsingScripts.executor_runtime.run_blocking(self.list_owned_sync, parser_key, owner)
+
+    async def list_history(self, parser_key: str) -> list[HistoryRecord]:
+        return await ParsingScripts.executor_runtime.run_blocking(self.list_history_sync, parser_key)
+
+    async def move_to_history(self, record: ArtifactRecord, history: HistoryRecord | None) -> list[BlobRef]:
+        return await ParsingScripts.executor_runtime.run_blocking(self.move_to_history_sync, record, history)
+
+    async def remove_history(self, parser_key: str, file_name: str) -> None:
+        await ParsingScripts.executor_runtime.run_blocking(self.remove_history_sync, parser_key, file_name)
+
+    async def add(self, parser_key: str, file_name: str, blob: BlobRef, date_time: datetime.datetime, digest: str | None = None, owner: str | None = None) -> ArtifactRecord:
+        record = ArtifactRecord(parser_key, file_name, date_time, blob, digest, owner)
+        await ParsingScripts.executor_runtime.run_blocking(self.add_sync, record)
+        return record
+
+    async def add_content(self, digest: str, output_format: str, blob: BlobRef) -> None:
+        await ParsingScripts.executor_runtime.run_blocking(self.add_content_sync, digest, output_format, blob)
+
+    async def find_content(self, digest: str, output_format: str) -> BlobRef | None:
+        return await ParsingScripts.executor_runtime.run_blocking(self.find_content_sync, digest, output_format)
+
+    async def get_latest(self, parser_key: str, folder: str) -> ArtifactRecord | None:
+        return await ParsingScripts.executor_runtime.run_blocking(self.get_latest_sync, parser_key, folder)
+
+    async def get_previous(self, parser_key: str, before: datetime.datetime) -> ArtifactRecord | None:
+        return await ParsingScripts.executor_runtime.run_blocking(self.get_previous_sync, parser_key, before)
+
+    async def list(self, parser_key: str, limit: int = 100) -> list[ArtifactRecord]:
+        return await ParsingScripts.executor_runtime.run_blocking(self.list_sync, parser_key, limit)
+
+    async def get_stats(self) -> dict:
+        return await ParsingScripts.executor_runtime.run_blocking(self.get_stats_sync)
+
+    async def close(self) -> None:
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+
+artifact_index = ArtifactIndex()
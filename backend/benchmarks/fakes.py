@@ -0,0 +1,192 @@
+import json
+import time
+import threading
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from benchmarks import fixtures
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    latency = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def count(self):
+        with self.server.stats_lock:
+            self.server.requests += 1
+
+    def read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def send_bytes(self, status: int, body: bytes, content_type: str, headers: dict | None = None):
+        if self.latency:
+            time.sleep(self.latency)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status: int, data: dict):
+        self.send_bytes(status, json.dumps(data, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8")
+
+    def send_stats(self) -> bool:
+        if urlparse(self.path).path != "/__stats":
+            return False
+        with self.server.stats_lock:
+            self.send_json(200, {"requests": self.server.requests})
+        return True
+
+
+# JSON-RPC UslugaDogovora.GetContractServices, который вызывает SBIS.make_saby_request
+class SabyHandler(FakeHandler):
+    def do_GET(self):
+        if not self.send_stats():
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        self.count()
+        body = self.read_body()
+        if self.headers.get("x-calledmethod") != "UslugaDogovora.GetContractServices":
+            self.send_json(400, {"error": "unexpected method"})
+            return
+        try:
+            payload = json.loads(body)
+            region_code = payload["params"]["AdditionalParameters"]["d"][2]
+        except (ValueError, KeyError, IndexError, TypeError):
+            self.send_json(400, {"error": "bad payload"})
+            return
+        self.send_json(200, fixtures.sbis_response(region_code))
+
+
+# страницы price-download/<регион> и файлы прайс-листов для KONTUR.main
+class KonturHandler(FakeHandler):
+    def do_GET(self):
+        if self.send_stats():
+            return
+        self.count()
+        path = urlparse(self.path).path.strip("/").split("/")
+        if len(path) == 2 and path[0] == "price-download":
+            host = self.headers.get("Host")
+            file_url = f"http://{host}/files/{path[1]}.doc"
+            page = fixtures.kontur_page(path[1], file_url).encode("utf-8")
+            self.send_bytes(200, page, "text/html; charset=utf-8")
+        elif len(path) == 2 and path[0] == "files" and path[1].endswith(".doc"):
+            region_code = path[1][:-len(".doc")]
+            etag = f'"{region_code}-v1"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_bytes(304, b"", "application/msword", {"ETag": etag})
+                return
+            self.send_bytes(200, fixtures.price_list_doc(region_code), "application/msword", {
+                "Content-Disposition": f'attachment; filename="{region_code}_pricelist.doc"',
+                "ETag": etag,
+                "Last-Modified": "Mon, 01 Sep 2025 00:00:00 GMT",
+            })
+        else:
+            self.send_json(404, {"error": "not found"})
+
+
+# заглушка docTranslator: на любой файл возвращает один и тот же docx
+class DocTranslatorHandler(FakeHandler):
+    docx = b""
+
+    def do_GET(self):
+        if self.send_stats():
+            return
+        self.count()
+        if urlparse(self.path).path == "/health":
+            self.send_json(200, {"status": "ok"})
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        self.count()
+        self.read_body()
+        if urlparse(self.path).path != "/convert":
+            self.send_json(404, {"error": "not found"})
+            return
+        self.send_bytes(200, self.docx, "application/vnd.openxmlformats-officedocument.wordprocessingml.document")
+
+
+def make_server(handler, host: str, port: int, latency: float) -> ThreadingHTTPServer:
+    handler_class = type(handler.__name__, (handler,), {"latency": latency})
+    if handler is DocTranslatorHandler:
+        handler_class.docx = fixtures.price_list_docx()
+    server = ThreadingHTTPServer((host, port), handler_class)
+    server.daemon_threads = True
+    server.requests = 0
+    server.stats_lock = threading.Lock()
+    return server
+
+
+def serve(host: str, ports: dict, latency: float, ready):
+    servers = {
+        "saby": make_server(SabyHandler, host, ports["saby"], latency),
+        "kontur": make_server(KonturHandler, host, ports["kontur"], latency),
+        "doctranslator": make_server(DocTranslatorHandler, host, ports["doctranslator"], latency),
+    }
+    for server in servers.values():
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    ready.put({name: server.server_address[1] for name, server in servers.items()})
+    threading.Event().wait()
+
+
+# фейковые сервисы запускаются в отдельном процессе, чтобы не влиять на замеры CPU и памяти парсера
+class FakeServices:
+    def __init__(self, host: str = "127.0.0.1", public_host: str | None = None, latency: float = 0.0):
+        self.host = host
+        self.public_host = public_host or host
+        self.latency = latency
+        self.process = None
+        self.ports = {}
+
+    def start(self) -> "FakeServices":
+        context = multiprocessing.get_context("spawn")
+        ready = context.Queue()
+        ports = {"saby": 0, "kontur": 0, "doctranslator": 0}
+        self.process = context.Process(target=serve, args=(self.host, ports, self.latency, ready), daemon=True)
+        self.process.start()
+        self.ports = ready.get(timeout=30)
+        return self
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join(timeout=5)
+            self.process = None
+
+    def url(self, name: str, path: str = "") -> str:
+        return f"http://{self.public_host}:{self.ports[name]}{path}"
+
+    def local_url(self, name: str, path: str = "") -> str:
+        host = "127.0.0.1" if self.host in ("0.0.0.0", "") else self.host
+        return f"http://{host}:{self.ports[name]}{path}"
+
+    def get_environment(self) -> dict:
+        return {
+            "SABY_URL": self.url("saby", "/service/?x_version=bench"),
+            "KONTUR_BASE_URL": self.url("kontur", "/price-download/77"),
+            "DOCTRANSLATOR_URL": self.url("doctranslator", "/convert"),
+        }
+
+    def get_request_counts(self) -> dict:
+        import urllib.request
+        counts = {}
+        for name in self.ports:
+            with urllib.request.urlopen(self.local_url(name, "/__stats"), timeout=5) as response:
+                counts[name] = json.loads(response.read())["requests"]
+        return counts
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
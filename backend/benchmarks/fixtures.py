@@ -0,0 +1,72 @@
+import json
+import zlib
+from io import BytesIO
+
+from docx import Document
+
+SBIS_NOMENCLATURES = [
+    "EOpSBISfrmLIoN", "EOpSBISfrmLB2o", "EOpSBISfrmLUo", "EOpSBISfrmLO2oN",
+    "EOpSBISfrmIoN", "EOpSBISfrmB2o", "EOpSBISfrmUo", "EOpSBISfrmO2oN",
+    "EOpNull", "EOpSBISfrmUPQ12", "EOussvMin",
+]
+
+KONTUR_LINK_TEXT = "Скачать полный прайс-лист, часть 2"
+
+
+def region_price(region_code: str, index: int) -> int:
+    # детерминированная "цена", чтобы результаты прогонов можно было сравнивать
+    return 1000 + (zlib.crc32(f"{region_code}:{index}".encode()) % 9000)
+
+
+def sbis_response(region_code: str) -> dict:
+    data = [
+        {"nomenclature": nomenclature, "price": region_price(region_code, index)}
+        for index, nomenclature in enumerate(SBIS_NOMENCLATURES)
+    ]
+    return {"jsonrpc": "2.0", "result": json.dumps({"data": data}, ensure_ascii=False), "id": 1}
+
+
+def kontur_page(region_code: str, file_url: str) -> str:
+    return f"""<!DOCTYPE html>
+<html lang="ru">
+<head><meta charset="UTF-8"><title>Прайс-лист {region_code}</title></head>
+<body>
+  <h1>Прайс-лист для региона {region_code}</h1>
+  <a href="{file_url.replace('.doc', '_1.doc')}">Скачать полный прайс-лист, часть 1</a>
+  <a href="{file_url}">{KONTUR_LINK_TEXT}</a>
+</body>
+</html>"""
+
+
+def price_list_docx() -> bytes:
+    doc = Document()
+
+    tariffs = doc.add_table(rows=4, cols=6)
+    rows = [
+        ["Тариф", "Срок", "ИП УСН", "ИП ОСНО", "ЮЛ УСН", "ЮЛ ОСНО"],
+        ["Оптимальный Плюс", "1 год", "4 500", "5 200", "6 100", "7 300"],
+        ["Бюджетник Плюс", "1 год", "", "", "", "8 900"],
+        ["Бюджетник", "1 год", "", "", "", "6 700"],
+    ]
+    for row, values in zip(tariffs.rows, rows):
+        for cell, value in zip(row.cells, values):
+            cell.text = value
+
+    common = doc.add_table(rows=8, cols=2)
+    common_rows = [
+        ["Количество организаций на обслуживании", "Цена"],
+        ["1+4", "12 000"], ["1+9", "18 000"], ["1+19", "27 000"], ["1+49", "45 000"],
+        ["1+99", "70 000"], ["1+199", "110 000"], ["1+499", "190 000"],
+    ]
+    for row, values in zip(common.rows, common_rows):
+        for cell, value in zip(row.cells, values):
+            cell.text = value
+
+    buffer = BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+# содержимое .doc не важно: заглушка docTranslator всегда возвращает price_list_docx
+def price_list_doc(region_code: str) -> bytes:
+    return f"fake doc price list for region {region_code}\n".encode() * 64
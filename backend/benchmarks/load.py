@@ -0,0 +1,382 @@
+import os
+import sys
+import json
+import time
+import random
+import signal
+import socket
+import asyncio
+import argparse
+import datetime
+import tempfile
+import multiprocessing
+from collections import defaultdict
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINTS = ("/parse", "/forceparse", "/check", "/result")
+# блокировка считается узким местом, если заметная доля захватов ждет или среднее ожидание велико;
+# долгое удержание без ожидающих (блокировка запуска одного парсера) узким местом не считается
+CONTENDED_SHARE = 0.1
+SLOW_WAIT_SECONDS = 0.01
+
+
+def percentile(values: list[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(percent / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def get_free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_stub(parser_type, seconds: float, rows: int):
+    import pandas as pd
+    from ParsingScripts import ParserType
+    from ParsingScripts.executors import executor_runtime
+
+    async def run():
+        # selenium-парсеры в проде занимают поток пула, httpx-парсеры только ждут сеть
+        if parser_type == ParserType.SELENIUM:
+            await executor_runtime.run_blocking(time.sleep, seconds)
+        else:
+            await asyncio.sleep(seconds)
+        return pd.DataFrame({"Код региона": range(rows), "Цена": [1000 + i for i in range(rows)]})
+    return run
+
+
+# сервер с заглушками парсеров; запускается в отдельном процессе, чтобы генератор нагрузки не делил с ним event loop
+def serve(port: int, options: dict):
+    os.environ.update(options["environment"])
+    os.chdir(tempfile.mkdtemp(prefix="parsing-load-"))
+    sys.path.insert(0, BACKEND_DIR)
+    if not options["verbose"]:
+        sys.stdout = open(os.devnull, "w")
+
+    import uvicorn
+    import ParsingScripts
+    from ParsingScripts import ParserType
+
+    for parser in ParsingScripts.parser_registry.get_snapshot().get_all().values():
+        seconds = options["selenium_seconds"] if parser.get_type() == ParserType.SELENIUM else options["httpx_seconds"]
+        parser.run = make_stub(parser.get_type(), seconds, options["rows"])
+        os.makedirs(parser.get_output_path(), exist_ok=True)
+    ParsingScripts.webdriver_pool.warm_up = lambda: None
+
+    from main import app
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+class LoadServer:
+    def __init__(self, options: dict):
+        self.options = options
+        self.port = get_free_port()
+        self.process = None
+
+    def get_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def start(self):
+        context = multiprocessing.get_context("spawn")
+        self.process = context.Process(target=serve, args=(self.port, self.options), daemon=True)
+        self.process.start()
+        async with httpx.AsyncClient() as client:
+            for _ in range(300):
+                try:
+                    response = await client.get(self.get_url() + "/stats")
+                    if response.status_code == 200:
+                        return
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.1)
+        raise RuntimeError("load test server did not start")
+
+    # SIGINT, чтобы uvicorn выполнил shutdown lifespan и закрыл пулы процессов
+    def stop(self):
+        if self.process is not None:
+            os.kill(self.process.pid, signal.SIGINT)
+            self.process.join(timeout=10)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join(timeout=10)
+            self.process = None
+
+
+class LoadStats:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+        self.order_seconds: list[float] = []
+        self.orders_started = 0
+        self.orders_completed = 0
+        self.orders_timed_out = 0
+        self.peaks: dict[str, float] = defaultdict(float)
+
+    def observe(self, endpoint: str, seconds: float, ok: bool):
+        self.latencies[endpoint].append(seconds)
+        if not ok:
+            self.errors[endpoint] += 1
+
+
+def parse_metrics(text: str) -> dict[tuple[str, tuple], float]:
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        name_labels, value = line.rsplit(" ", 1)
+        labels = ()
+        if "{" in name_labels:
+            name, raw = name_labels[:-1].split("{", 1)
+            labels = tuple(sorted(tuple(pair.split("=", 1)) for pair in raw.split('",') if pair))
+            labels = tuple((key, item.strip('"')) for key, item in labels)
+        else:
+            name = name_labels
+        samples[(name, labels)] = float(value)
+    return samples
+
+
+def get_lock_report(samples: dict, elapsed: float) -> dict:
+    locks = defaultdict(dict)
+    for (name, labels), value in samples.items():
+        labels = dict(labels)
+        lock = labels.get("lock")
+        if lock is None:
+            continue
+        if name == "parsing_lock_wait_seconds_count":
+            locks[lock]["acquisitions"] = int(value)
+        elif name == "parsing_lock_wait_seconds_sum":
+            locks[lock]["wait_seconds"] = value
+        elif name == "parsing_lock_hold_seconds_sum":
+            locks[lock]["hold_seconds"] = value
+        elif name == "parsing_lock_wait_seconds_bucket" and labels.get("le") == "0.01":
+            locks[lock]["fast_acquisitions"] = int(value)
+
+    report = {}
+    for lock, values in locks.items():
+        acquisitions = values.get("acquisitions", 0)
+        wait = values.get("wait_seconds", 0.0)
+        hold = values.get("hold_seconds", 0.0)
+        # для блокировок на объект (order_lock, parser_lock) сумма складывается по всем экземплярам
+        utilization = hold / elapsed if elapsed else 0.0
+        contended_share = 1 - values.get("fast_acquisitions", acquisitions) / acquisitions if acquisitions else 0.0
+        report[lock] = {
+            "acquisitions": acquisitions,
+            "mean_wait_ms": wait / acquisitions * 1000 if acquisitions else 0.0,
+            "contended_share": contended_share,
+            "utilization": utilization,
+            "saturated": bool(acquisitions) and (
+                contended_share >= CONTENDED_SHARE or wait / acquisitions >= SLOW_WAIT_SECONDS
+            ),
+        }
+    return report
+
+
+async def sample_server(client: httpx.AsyncClient, stats: LoadStats, interval: float, stop: asyncio.Event):
+    while not stop.is_set():
+        try:
+            response = await client.get("/metrics")
+            for (name, labels), value in parse_metrics(response.text).items():
+                if name in ("parsing_queue_depth", "parsing_workers_busy"):
+                    key = f"{name}{{{dict(labels).get('queue')}}}"
+                    stats.peaks[key] = max(stats.peaks[key], value)
+        except httpx.HTTPError:
+            pass
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def timed_post(client: httpx.AsyncClient, stats: LoadStats, endpoint: str, body: dict) -> httpx.Response:
+    started = time.perf_counter()
+    try:
+        async with client.stream("POST", endpoint, json=body) as response:
+            await response.aread()
+    except httpx.HTTPError:
+        stats.observe(endpoint, time.perf_counter() - started, False)
+        raise
+    stats.observe(endpoint, time.perf_counter() - started, response.status_code < 400)
+    return response
+
+
+async def virtual_user(client: httpx.AsyncClient, stats: LoadStats, rng: random.Random, keys: list[str], args, stop_at: float):
+    while time.monotonic() < stop_at:
+        forced = rng.random() < args.force_ratio
+        sources = rng.sample(keys, rng.randint(1, min(args.max_sources, len(keys))))
+        date_time = datetime.datetime.now().strftime("%d.%m.%Y_%H-%M")
+        body = {"source": [{"key": key} if forced else {"key": key, "datetime": date_time} for key in sources]}
+        started = time.perf_counter()
+        stats.orders_started += 1
+        try:
+            response = await timed_post(client, stats, "/forceparse" if forced else "/parse", body)
+            if response.status_code >= 400:
+                continue
+            order = {"order_id": response.json()["order_id"]}
+
+            deadline = time.monotonic() + args.order_timeout
+            finished = False
+            while time.monotonic() < deadline:
+                await asyncio.sleep(args.poll_interval)
+                response = await timed_post(client, stats, "/check", order)
+                if response.status_code >= 400:
+                    break
+                tasks = response.json()["status"]["tasks"]
+                if all(status in ("completed", "failed") for status in tasks.values()):
+                    finished = True
+                    break
+            if not finished:
+                stats.orders_timed_out += 1
+                continue
+
+            response = await timed_post(client, stats, "/result", order)
+            if response.status_code < 400:
+                stats.orders_completed += 1
+                stats.order_seconds.append(time.perf_counter() - started)
+        except httpx.HTTPError:
+            await asyncio.sleep(args.poll_interval)
+        if args.think_time:
+            await asyncio.sleep(rng.expovariate(1 / args.think_time))
+
+
+async def run_load(args, httpx_workers: int) -> dict:
+    server = LoadServer({
+        "environment": {
+            "ORDER_STORE": "memory",
+            "HTTPX_WORKERS": str(httpx_workers),
+            "SELENIUM_POOL_SIZE": str(args.selenium_workers),
+            "TRACE_EXPORT_PATH": "",
+        },
+        "httpx_seconds": args.httpx_seconds,
+        "selenium_seconds": args.selenium_seconds,
+        "rows": args.rows,
+        "verbose": args.verbose,
+    })
+    await server.start()
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=server.get_url(), limits=limits, timeout=args.order_timeout) as client:
+            keys = [parser["key"] for parser in (await client.get("/availableparsers")).json()["parsers"]]
+            if args.parsers:
+                keys = [key for key in keys if key in args.parsers]
+
+            stats = LoadStats()
+            stop = asyncio.Event()
+            sampler = asyncio.create_task(sample_server(client, stats, args.sample_interval, stop))
+            started = time.monotonic()
+            stop_at = started + args.duration
+            rng = random.Random(args.seed)
+            await asyncio.gather(*[
+                virtual_user(client, stats, random.Random(rng.random()), keys, args, stop_at)
+                for _ in range(args.concurrency)
+            ])
+            elapsed = time.monotonic() - started
+            stop.set()
+            await sampler
+
+            samples = parse_metrics((await client.get("/metrics")).text)
+            server_stats = (await client.get("/stats")).json()
+    finally:
+        server.stop()
+
+    return {
+        "httpx_workers": httpx_workers,
+        "selenium_workers": args.selenium_workers,
+        "concurrency": args.concurrency,
+        "elapsed_seconds": elapsed,
+        "orders_started": stats.orders_started,
+        "orders_completed": stats.orders_completed,
+        "orders_timed_out": stats.orders_timed_out,
+        "orders_per_second": stats.orders_completed / elapsed if elapsed else 0.0,
+        "order_seconds": {f"p{p}": percentile(stats.order_seconds, p) for p in (50, 95, 99)},
+        "endpoints": {
+            endpoint: {
+                "requests": len(stats.latencies[endpoint]),
+                "errors": stats.errors[endpoint],
+                "p50_ms": percentile(stats.latencies[endpoint], 50) * 1000,
+                "p95_ms": percentile(stats.latencies[endpoint], 95) * 1000,
+                "p99_ms": percentile(stats.latencies[endpoint], 99) * 1000,
+            }
+            for endpoint in ENDPOINTS
+        },
+        "peaks": dict(stats.peaks),
+        "locks": get_lock_report(samples, elapsed),
+        "coalesced_runs": server_stats["coalesced_runs"],
+        "result_cache": server_stats["result_cache"],
+    }
+
+
+def print_report(report: dict):
+    print(f"\nhttpx workers: {report['httpx_workers']}, selenium workers: {report['selenium_workers']}, "
+          f"клиентов: {report['concurrency']}, {report['elapsed_seconds']:.1f} с")
+    print(f"  заказов завершено {report['orders_completed']}/{report['orders_started']} "
+          f"({report['orders_per_second']:.2f}/с), не дождались {report['orders_timed_out']}, "
+          f"объединено запусков {report['coalesced_runs']}")
+    order = report["order_seconds"]
+    print(f"  время заказа p50 {order['p50']:.2f} с, p95 {order['p95']:.2f} с, p99 {order['p99']:.2f} с")
+
+    print(f"  {'endpoint':<14}{'запросов':>10}{'ошибок':>8}{'p50 мс':>10}{'p95 мс':>10}{'p99 мс':>10}")
+    for endpoint, values in report["endpoints"].items():
+        print(f"  {endpoint:<14}{values['requests']:>10}{values['errors']:>8}"
+              f"{values['p50_ms']:>10.1f}{values['p95_ms']:>10.1f}{values['p99_ms']:>10.1f}")
+
+    print(f"  {'lock':<20}{'захватов':>10}{'ожид. мс':>10}{'с ожид.':>9}{'занят':>8}")
+    for lock, values in sorted(report["locks"].items(), key=lambda item: -item[1]["utilization"]):
+        mark = "  <- узкое место" if values["saturated"] else ""
+        print(f"  {lock:<20}{values['acquisitions']:>10}{values['mean_wait_ms']:>10.2f}"
+              f"{values['contended_share']:>9.0%}{values['utilization']:>8.0%}{mark}")
+
+    if report["peaks"]:
+        print("  пики: " + ", ".join(f"{key}={value:g}" for key, value in sorted(report["peaks"].items())))
+
+
+def print_sweep(reports: list[dict]):
+    print(f"\n{'httpx workers':>14}{'заказов/с':>11}{'p95 заказа':>12}{'p95 /check':>12}  узкие места")
+    for report in reports:
+        saturated = ", ".join(lock for lock, values in report["locks"].items() if values["saturated"]) or "-"
+        print(f"{report['httpx_workers']:>14}{report['orders_per_second']:>11.2f}"
+              f"{report['order_seconds']['p95']:>11.2f}с{report['endpoints']['/check']['p95_ms']:>10.1f}мс  {saturated}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест API с заглушками парсеров фиксированной длительности")
+    parser.add_argument("--workers", default="3", help="число httpx-воркеров; список через запятую для сравнения")
+    parser.add_argument("--selenium-workers", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=20, help="число одновременных клиентов")
+    parser.add_argument("--duration", type=float, default=30, help="длительность подачи заказов, секунды")
+    parser.add_argument("--httpx-seconds", type=float, default=2, help="длительность заглушки httpx-парсера")
+    parser.add_argument("--selenium-seconds", type=float, default=5, help="длительность заглушки selenium-парсера")
+    parser.add_argument("--rows", type=int, default=100, help="строк в результате заглушки")
+    parser.add_argument("--force-ratio", type=float, default=0.2, help="доля заказов через /forceparse")
+    parser.add_argument("--max-sources", type=int, default=3, help="максимум источников в заказе")
+    parser.add_argument("--parsers", nargs="*", default=None, help="ограничить набор парсеров")
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    parser.add_argument("--think-time", type=float, default=0.0, help="средняя пауза клиента между заказами")
+    parser.add_argument("--order-timeout", type=float, default=300)
+    parser.add_argument("--sample-interval", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default=None, help="записать отчет в JSON")
+    parser.add_argument("--verbose", action="store_true", help="не скрывать вывод сервера")
+    args = parser.parse_args()
+
+    reports = []
+    for httpx_workers in [int(value) for value in args.workers.split(",")]:
+        report = asyncio.run(run_load(args, httpx_workers))
+        print_report(report)
+        reports.append(report)
+    if len(reports) > 1:
+        print_sweep(reports)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
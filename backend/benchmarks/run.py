@@ -0,0 +1,215 @@
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import asyncio
+import platform
+import tempfile
+import statistics
+import multiprocessing
+
+from benchmarks.fakes import FakeServices
+
+BENCHMARKS = ("sbis", "kontur")
+# метрики, для которых рост значения считается регрессией
+LOWER_IS_BETTER = ("wall_seconds", "cpu_seconds", "peak_rss_mb")
+HIGHER_IS_BETTER = ("requests_per_second",)
+
+
+def get_peak_rss_mb(who) -> float:
+    # ru_maxrss на linux в килобайтах, на macOS в байтах
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def get_children_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def load_parser(name: str, kontur_regions: int | None):
+    if name == "sbis":
+        from ParsingScripts.SBIS import parse_sbis
+        return parse_sbis
+    from ParsingScripts import KONTUR
+    if kontur_regions:
+        KONTUR.regions = KONTUR.regions[:kontur_regions]
+    return KONTUR.parse_kontur
+
+
+def run_once(parse, fakes: FakeServices) -> dict:
+    from ParsingScripts.executors import executor_runtime
+
+    executor_runtime.start()
+    process_pool = executor_runtime.process_pool
+    requests_before = sum(fakes.get_request_counts().values())
+    children_before = get_children_cpu()
+    cpu_before = time.process_time()
+    started = time.perf_counter()
+
+    df = asyncio.run(parse())
+
+    wall = time.perf_counter() - started
+    cpu = time.process_time() - cpu_before
+    # процессы пула завершаются, чтобы их CPU попал в RUSAGE_CHILDREN этого прогона
+    executor_runtime.shutdown()
+    process_pool.shutdown(wait=True)
+    cpu += get_children_cpu() - children_before
+    requests = sum(fakes.get_request_counts().values()) - requests_before
+
+    return {
+        "wall_seconds": wall,
+        "cpu_seconds": cpu,
+        "requests": requests,
+        "requests_per_second": requests / wall if wall else 0.0,
+        "rows": len(df),
+    }
+
+
+def run_benchmark(name: str, fakes_env: dict, options: dict, results):
+    # переменные окружения должны быть заданы до импорта ParsingScripts
+    os.environ.update(fakes_env)
+    if not options["keep_pacing"]:
+        os.environ["SBIS_HOST_RPS"] = "0"
+        os.environ["KONTUR_HOST_RPS"] = "0"
+    if name == "kontur" and not os.environ.get("DOWNLOAD_DIR"):
+        os.environ["DOWNLOAD_DIR"] = tempfile.mkdtemp(prefix="kontur-bench-")
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    fakes = FakeServices(public_host=options["public_host"])
+    fakes.ports = options["ports"]
+    fakes.host = options["host"]
+    parse = load_parser(name, options["kontur_regions"])
+
+    runs = []
+    for _ in range(options["repeat"]):
+        runs.append(run_once(parse, fakes))
+
+    if name == "kontur":
+        from ParsingScripts.webdriver_pool import webdriver_pool
+        webdriver_pool.close_idle()
+
+    results.put({
+        "runs": runs,
+        "peak_rss_mb": get_peak_rss_mb(resource.RUSAGE_SELF),
+        "children_peak_rss_mb": get_peak_rss_mb(resource.RUSAGE_CHILDREN),
+    })
+
+
+def summarize(result: dict) -> dict:
+    runs = result["runs"]
+    return {
+        "wall_seconds": statistics.median(run["wall_seconds"] for run in runs),
+        "cpu_seconds": statistics.median(run["cpu_seconds"] for run in runs),
+        "peak_rss_mb": max(result["peak_rss_mb"], result["children_peak_rss_mb"]),
+        "requests_per_second": statistics.median(run["requests_per_second"] for run in runs),
+        "requests": runs[-1]["requests"],
+        "rows": runs[-1]["rows"],
+        "repeat": len(runs),
+    }
+
+
+# каждый бенчмарк выполняется в отдельном процессе, чтобы пиковая память не смешивалась
+def run_isolated(name: str, fakes: FakeServices, options: dict) -> dict:
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    options = dict(options, ports=fakes.ports, host=fakes.host)
+    process = context.Process(target=run_benchmark, args=(name, fakes.get_environment(), options, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return summarize(result)
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    regressions = []
+    for name, metrics in results.items():
+        previous = baseline.get("benchmarks", {}).get(name)
+        if not previous:
+            continue
+        for metric in LOWER_IS_BETTER:
+            if previous.get(metric) and metrics[metric] > previous[metric] * (1 + threshold):
+                regressions.append(f"{name}.{metric}: {previous[metric]:.3f} -> {metrics[metric]:.3f}")
+        for metric in HIGHER_IS_BETTER:
+            if previous.get(metric) and metrics[metric] < previous[metric] * (1 - threshold):
+                regressions.append(f"{name}.{metric}: {previous[metric]:.3f} -> {metrics[metric]:.3f}")
+    return regressions
+
+
+def print_results(results: dict, baseline: dict):
+    for name, metrics in results.items():
+        previous = baseline.get("benchmarks", {}).get(name, {})
+        print(f"\n{name} ({metrics['repeat']} прогонов, {metrics['requests']} запросов, {metrics['rows']} строк)")
+        for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            line = f"  {metric:<22}{metrics[metric]:>12.3f}"
+            if previous.get(metric):
+                change = (metrics[metric] - previous[metric]) / previous[metric] * 100
+                line += f"   baseline {previous[metric]:.3f} ({change:+.1f}%)"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк парсеров на локальных фейках SBIS, KONTUR и docTranslator")
+    parser.add_argument("benchmarks", nargs="*", default=["sbis"], choices=BENCHMARKS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа фейков, секунды")
+    parser.add_argument("--host", default="127.0.0.1", help="адрес, на котором слушают фейки")
+    parser.add_argument("--public-host", default=None, help="адрес фейков для браузера в selenium-контейнере")
+    parser.add_argument("--kontur-regions", type=int, default=None, help="ограничить число регионов KONTUR")
+    parser.add_argument("--keep-pacing", action="store_true", help="не отключать ограничение частоты запросов SBIS и KONTUR")
+    parser.add_argument("--baseline", default=None, help="JSON-файл с результатами для сравнения")
+    parser.add_argument("--save-baseline", action="store_true", help="записать результаты в --baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="допустимое ухудшение относительно baseline")
+    args = parser.parse_args()
+
+    # браузер нужен kontur только без быстрого HTTP-пути
+    kontur_browser = os.environ.get("KONTUR_HTTP_FAST_PATH", "1") != "1"
+    if "kontur" in args.benchmarks and kontur_browser and not os.environ.get("SELENIUM_URL"):
+        parser.error("для kontur с KONTUR_HTTP_FAST_PATH=0 нужен SELENIUM_URL")
+
+    baseline = {}
+    if args.baseline and os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    options = {
+        "repeat": args.repeat,
+        "public_host": args.public_host,
+        "kontur_regions": args.kontur_regions,
+        "keep_pacing": args.keep_pacing,
+    }
+    results = {}
+    with FakeServices(host=args.host, public_host=args.public_host, latency=args.latency) as fakes:
+        for name in args.benchmarks:
+            print(f"Запуск бенчмарка {name}...")
+            results[name] = run_isolated(name, fakes, options)
+
+    print_results(results, baseline)
+
+    if args.save_baseline:
+        if not args.baseline:
+            parser.error("--save-baseline требует --baseline")
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "latency": args.latency,
+                "benchmarks": results,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"\nBaseline сохранен в {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print("\nРегрессии относительно baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+import os
+import zlib
+import shutil
+import hashlib
+import uuid
+
+import ParsingScripts
+
+BLOB_STORE_PATH = os.environ.get("BLOB_STORE_PATH", "./oldData/blobs")
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+# ссылка на неизменяемый blob: задачи и кэш хранят ее вместо байтов файла
+class BlobRef:
+    def __init__(self, sha256: str, size: int, crc32: int):
+        self.sha256 = sha256
+        self.size = size
+        self.crc32 = crc32
+
+    def get_sha256(self) -> str:
+        return self.sha256
+
+    def get_size(self) -> int:
+        return self.size
+
+    def get_crc32(self) -> int:
+        return self.crc32
+
+    def to_record(self) -> dict:
+        return {"sha256": self.sha256, "size": self.size, "crc32": self.crc32}
+
+    @classmethod
+    def from_record(cls, record: dict) -> "BlobRef | None":
+        if not record.get("sha256"):
+            return None
+        return cls(record["sha256"], record["size"], record["crc32"])
+
+
+# данные файла сбрасываются на диск до переименования: после сбоя питания blob не окажется пустым или обрезанным
+def fsync_file(path: str) -> None:
+    with open(path, "rb") as f:
+        os.fsync(f.fileno())
+
+
+def digest_file(path: str) -> BlobRef:
+    digest = hashlib.sha256()
+    crc = 0
+    size = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+    return BlobRef(digest.hexdigest(), size, crc)
+
+
+# хранилище по содержимому: одинаковые файлы лежат одним blob-ом <root>/<sha[:2]>/<sha>
+class BlobStore:
+    def __init__(self, root: str = BLOB_STORE_PATH):
+        self.root = root
+        self.writes = 0
+        self.dedup_hits = 0
+        self.dedup_bytes = 0
+
+    def get_path(self, ref: BlobRef) -> str:
+        return os.path.join(self.root, ref.get_sha256()[:2], ref.get_sha256())
+
+    def exists_sync(self, ref: BlobRef) -> bool:
+        return os.path.exists(self.get_path(ref))
+
+    # временный файл внутри хранилища: кодировщик пишет в него напрямую, затем файл переносится
+    # на место blob-а переименованием, без чтения в память
+    def get_tmp_path(self, extension: str = "") -> str:
+        os.makedirs(os.path.join(self.root, "tmp"), exist_ok=True)
+        return os.path.join(self.root, "tmp", f"{uuid.uuid4().hex}{extension}")
+
+    def put_file_sync(self, path: str) -> BlobRef:
+        ref = digest_file(path)
+        if self.exists_sync(ref):
+            os.remove(path)
+            self.dedup_hits += 1
+            self.dedup_bytes += ref.get_size()
+            return ref
+        os.makedirs(os.path.dirname(self.get_path(ref)), exist_ok=True)
+        fsync_file(path)
+        os.replace(path, self.get_path(ref))
+        self.writes += 1
+        return ref
+
+    # результат с уже известным содержимым таблицы: не кодируется и не пишется заново
+    def reuse(self, ref: BlobRef) -> BlobRef:
+        self.dedup_hits += 1
+        self.dedup_bytes += ref.get_size()
+        return ref
+
+    # перенос существующего файла в хранилище без копирования данных (hard link), для старых результатов
+    def adopt_sync(self, path: str) -> BlobRef:
+        ref = digest_file(path)
+        if not self.exists_sync(ref):
+            link_or_copy(path, self.get_path(ref))
+        return ref
+
+    # именованный файл <KEY>_<дата>.xlsx в папке парсера - hard link на blob, место на диске не занимает
+    def link_sync(self, ref: BlobRef, path: str) -> None:
+        if os.path.exists(path):
+            os.remove(path)
+        link_or_copy(self.get_path(ref), path)
+
+    def remove_sync(self, ref: BlobRef) -> None:
+        try:
+            os.remove(self.get_path(ref))
+        except FileNotFoundError:
+            pass
+
+    async def put_file(self, path: str) -> BlobRef:
+        return await ParsingScripts.executor_runtime.run_blocking(self.put_file_sync, path)
+
+    async def exists(self, ref: BlobRef) -> bool:
+        return await ParsingScripts.executor_runtime.run_blocking(self.exists_sync, ref)
+
+    async def link(self, ref: BlobRef, path: str) -> None:
+        await ParsingScripts.executor_runtime.run_blocking(self.link_sync, ref, path)
+
+    async def remove(self, ref: BlobRef) -> None:
+        await ParsingScripts.executor_runtime.run_blocking(self.remove_sync, ref)
+
+    def get_stats(self) -> dict:
+        return {
+            "writes": self.writes,
+            "dedup_hits": self.dedup_hits,
+            "dedup_bytes": self.dedup_bytes,
+        }
+
+
+def link_or_copy(source: str, target: str) -> None:
+    os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+    try:
+        os.link(source, target)
+    except OSError:
+        tmp_path = f"{target}.{os.getpid()}.tmp"
+        shutil.copyfile(source, tmp_path)
+        fsync_file(tmp_path)
+        os.replace(tmp_path, target)
+
+
+blob_store = BlobStore()
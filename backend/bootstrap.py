@@ -1,5 +1,5 @@
 import os
-import datetime
+import time
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 import asyncio
@@ -7,34 +7,60 @@ import asyncio
 
 import ParsingScripts
 import workers
+from artifact_index import artifact_index
+from compaction import compaction_worker
 
+HTTPX_WORKERS = int(os.environ.get("HTTPX_WORKERS", 3))
 
-def get_latest_file_info(folder_path):
-    files = [os.path.join(folder_path, f) for f in os.listdir(folder_path)
-             if os.path.isfile(os.path.join(folder_path, f))]
+# длительность этапов запуска, секунды; отдается в /stats и /metrics
+startup_timings: dict[str, float] = {}
 
-    if not files:
-        return "", None
+# прогрев после старта: сервис уже отвечает, пока создаются сессии браузера и импортируются модули парсеров
+async def warm_up():
+    started = time.perf_counter()
+    await ParsingScripts.webdriver_pool.start()
+    if ParsingScripts.PARSERS_WARM_UP:
+        await ParsingScripts.warm_up_parsers()
+    startup_timings["warm_up"] = time.perf_counter() - started
 
-    latest_file = max(files, key=os.path.getmtime)
-    mtime = os.path.getmtime(latest_file)
-    dt = datetime.datetime.fromtimestamp(mtime)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    ParsingScripts.executor_runtime.start()
+    ParsingScripts.http_pool.start()
 
-    return os.path.basename(latest_file), dt
+    # последний результат каждого парсера берется из индекса артефактов, а не сканированием папок
+    for parser in ParsingScripts.parser_registry.get_snapshot().get_all().values():
+        latest = await artifact_index.get_latest(parser.get_key(), parser.get_output_path())
+        if latest is not None:
+            parser.set_latest(latest.get_file_name(), latest.get_date_time(), latest.get_blob(), latest.get_digest())
+        print(f"{parser.get_key()}, {latest.get_date_time() if latest else None}, {latest.get_file_name() if latest else ''}")
+    startup_timings["latest_files"] = time.perf_counter() - started
 
+    evicted = await ParsingScripts.executor_runtime.run_blocking(ParsingScripts.checkpoint_store.evict)
+    if evicted:
+        print(f"evicted {evicted} stale checkpoint regions")
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    async with workers.orders_lock:
-        for parser in ParsingScripts.parsers.values():
-            latest_parse_file_name, dt = get_latest_file_info(parser.output_path)
-            parser.set_latest_parse_file_name(latest_parse_file_name)
-            parser.set_latest_parse_date_time(dt)
-            print(f"{parser.get_key()}, {dt}, {latest_parse_file_name}")
-
-    for _ in range(3):
+    restore_started = time.perf_counter()
+    await workers.restore_orders()
+    startup_timings["restore_orders"] = time.perf_counter() - restore_started
+
+    for _ in range(HTTPX_WORKERS):
         asyncio.create_task(workers.worker(workers.httpx_queue))
-    asyncio.create_task(workers.worker(workers.selenium_queue))
+    for _ in range(ParsingScripts.webdriver_pool.get_size()):
+        asyncio.create_task(workers.worker(workers.selenium_queue))
     asyncio.create_task(workers.distributor_worker())
-    print("workers started")
+    asyncio.create_task(workers.order_eviction_worker())
+    asyncio.create_task(compaction_worker())
+    asyncio.create_task(warm_up())
+    startup_timings["lifespan"] = time.perf_counter() - started
+    print(f"workers started, startup timings: {startup_timings}")
     yield
+
+    await ParsingScripts.webdriver_pool.stop()
+    await ParsingScripts.http_pool.stop()
+    await workers.order_store.close()
+    await artifact_index.close()
+    ParsingScripts.region_state_store.close()
+    ParsingScripts.checkpoint_store.close()
+    ParsingScripts.executor_runtime.shutdown()
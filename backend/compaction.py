@@ -0,0 +1,162 @@
+import os
+import time
+import asyncio
+import datetime
+
+import ParsingScripts
+from ParsingScripts.formats import artifact_to_history, get_output_format
+from artifact_index import artifact_index, ArtifactRecord, HistoryRecord
+from blob_store import blob_store
+from metrics import lock_wait
+from order_store import order_store
+
+HISTORY_PATH = os.environ.get("HISTORY_PATH", "./oldData/history")
+HISTORY_FORMAT = os.environ.get("HISTORY_FORMAT", "parquet")
+COMPACTION_INTERVAL_SECONDS = int(os.environ.get("COMPACTION_INTERVAL_SECONDS", 3600))
+COMPACTION_MIN_AGE_DAYS = int(os.environ.get("COMPACTION_MIN_AGE_DAYS", 1))
+RETENTION_DAILY_DAYS = int(os.environ.get("RETENTION_DAILY_DAYS", 30))
+
+HISTORY_EXTENSIONS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+
+def remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+# какие снимки остаются в истории: за последние daily_days дней - последний снимок каждого дня,
+# раньше - последний снимок каждого месяца
+def select_retained(snapshots: list[tuple[str, datetime.datetime]], today: datetime.date, daily_days: int) -> set[str]:
+    latest: dict[tuple, tuple[str, datetime.datetime]] = {}
+    for file_name, date_time in snapshots:
+        if (today - date_time.date()).days <= daily_days:
+            period = ("day", date_time.date())
+        else:
+            period = ("month", date_time.year, date_time.month)
+        if period not in latest or latest[period][1] <= date_time:
+            latest[period] = (file_name, date_time)
+    return {file_name for file_name, _ in latest.values()}
+
+
+# датасет разбит по парсеру и дате в стиле hive: <HISTORY_PATH>/parser=<KEY>/date=<YYYY-MM-DD>/<снимок>.parquet,
+# pandas/pyarrow читают его целиком или по разделам без разбора xlsx
+def get_history_path(parser_key: str, file_name: str, date_time: datetime.datetime) -> str:
+    stem = os.path.splitext(file_name)[0]
+    return os.path.join(
+        HISTORY_PATH, f"parser={parser_key}", f"date={date_time.date().isoformat()}",
+        stem + HISTORY_EXTENSIONS.get(HISTORY_FORMAT, ".parquet")
+    )
+
+
+# фоновое уплотнение oldData: закрытые дни переносятся из файлов результатов в колоночный датасет,
+# лишние по политике хранения снимки удаляются; самый новый результат парсера не трогается
+class HistoryCompactor:
+    def __init__(self):
+        self.runs = 0
+        self.compacted = 0
+        self.dropped = 0
+        self.expired = 0
+        self.deferred = 0
+        self.failed = 0
+        self.released_bytes = 0
+        self.last_run_seconds = 0.0
+        self.lock = asyncio.Lock()
+
+    async def compact_parser(self, parser: ParsingScripts.Parser, now: datetime.datetime) -> None:
+        key = parser.get_key()
+        before = datetime.datetime.combine(now.date() - datetime.timedelta(days=COMPACTION_MIN_AGE_DAYS - 1), datetime.time())
+        candidates = await artifact_index.list_compactable(key, before)
+        history = await artifact_index.list_history(key)
+        if not candidates and not history:
+            return
+        snapshots = [(record.get_file_name(), record.get_date_time()) for record in candidates + history]
+        retained = select_retained(snapshots, now.date(), RETENTION_DAILY_DAYS)
+        # результат, который заказ еще не забрал, остается на месте до следующего уплотнения
+        referenced = await order_store.get_referenced_blobs() if candidates else set()
+
+        for record in candidates:
+            # файлы в других форматах, полученные из результата, уходят вместе с ним
+            owned = await artifact_index.list_owned(key, record.get_file_name())
+            if any(item.get_blob().get_sha256() in referenced for item in [record] + owned):
+                self.deferred += 1
+            elif record.get_file_name() in retained:
+                await self.compact_record(parser, record, owned)
+            else:
+                await self.drop_record(parser, record, owned, None)
+                self.dropped += 1
+
+        for record in history:
+            if record.get_file_name() in retained:
+                continue
+            await ParsingScripts.executor_runtime.run_blocking(remove_file, record.get_path())
+            await artifact_index.remove_history(key, record.get_file_name())
+            self.expired += 1
+
+    async def compact_record(self, parser: ParsingScripts.Parser, record: ArtifactRecord, owned: list[ArtifactRecord]) -> None:
+        target = get_history_path(parser.get_key(), record.get_file_name(), record.get_date_time())
+        try:
+            rows, size = await ParsingScripts.executor_runtime.run_cpu(
+                artifact_to_history, blob_store.get_path(record.get_blob()), get_output_format(record.get_file_name()),
+                target, record.get_date_time(), HISTORY_FORMAT
+            )
+        except Exception as e:
+            print(f"failed to compact {record.get_file_name()} of {parser.get_key()}: {e}")
+            self.failed += 1
+            return
+        history = HistoryRecord(parser.get_key(), record.get_file_name(), record.get_date_time(), target, rows, size)
+        await self.drop_record(parser, record, owned, history)
+        self.compacted += 1
+
+    async def drop_record(self, parser: ParsingScripts.Parser, record: ArtifactRecord, owned: list[ArtifactRecord], history: HistoryRecord | None) -> None:
+        released = await artifact_index.move_to_history(record, history)
+        for item in [record] + owned:
+            await ParsingScripts.executor_runtime.run_blocking(remove_file, parser.get_output_path() + item.get_file_name())
+        for blob in released:
+            await blob_store.remove(blob)
+            self.released_bytes += blob.get_size()
+
+    # парсер уплотняется под блокировкой записи результата, а не запуска: идущий запуск парсера уплотнение не ждет,
+    # а сохранение его результата не сошлется на blob, который удаляется
+    async def run(self) -> None:
+        async with self.lock:
+            started = time.perf_counter()
+            now = datetime.datetime.now()
+            for parser in ParsingScripts.parser_registry.get_snapshot().get_all().values():
+                try:
+                    async with lock_wait(parser.get_store_lock(), "store_lock"):
+                        await self.compact_parser(parser, now)
+                except Exception as e:
+                    print(f"compaction of {parser.get_key()} failed: {e}")
+                    self.failed += 1
+            self.runs += 1
+            self.last_run_seconds = time.perf_counter() - started
+            print(f"compaction finished in {self.last_run_seconds:.2f} sec., stats: {self.get_stats()}")
+
+    def get_stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "compacted": self.compacted,
+            "dropped": self.dropped,
+            "expired": self.expired,
+            "deferred": self.deferred,
+            "failed": self.failed,
+            "released_bytes": self.released_bytes,
+            "last_run_seconds": round(self.last_run_seconds, 3),
+            "format": HISTORY_FORMAT,
+        }
+
+
+history_compactor = HistoryCompactor()
+
+
+async def compaction_worker():
+    if COMPACTION_INTERVAL_SECONDS <= 0:
+        return
+    while True:
+        await asyncio.sleep(COMPACTION_INTERVAL_SECONDS)
+        try:
+            await history_compactor.run()
+        except Exception as e:
+            print(f"compaction failed: {e}")
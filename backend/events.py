@@ -0,0 +1,33 @@
+import asyncio
+import json
+import uuid
+
+# рассылка изменений состояния задач подписчикам конкретного заказа
+class OrderEvents:
+    def __init__(self):
+        self.subscribers: dict[uuid.UUID, set[asyncio.Queue]] = {}
+
+    def subscribe(self, order_id: uuid.UUID) -> asyncio.Queue:
+        queue = asyncio.Queue()
+        self.subscribers.setdefault(order_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, order_id: uuid.UUID, queue: asyncio.Queue) -> None:
+        queues = self.subscribers.get(order_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            self.subscribers.pop(order_id, None)
+
+    def publish(self, order_id: uuid.UUID, event: dict) -> None:
+        for queue in self.subscribers.get(order_id, ()):
+            queue.put_nowait(event)
+
+    def get_subscriber_count(self) -> int:
+        return sum(len(queues) for queues in self.subscribers.values())
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+order_events = OrderEvents()
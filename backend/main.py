@@ -1,15 +1,31 @@
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import StreamingResponse, JSONResponse
+import time
+IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, Request, HTTPException, Header
+from fastapi.responses import StreamingResponse, JSONResponse, Response, PlainTextResponse
 import uuid
 import datetime
-import zipfile
 import asyncio
-import io
+import os
+import re
+import secrets
 
 import ParsingScripts
-from bootstrap import lifespan 
+from bootstrap import lifespan, startup_timings
 from workers import ParsingOrder, ParsingTask, order_queue
-from workers import get_order, remove_order
+from workers import add_order, get_order, get_coalesced_runs, get_rendered_results, get_queue_position, get_task_file_path, retry_order, schedule_order_removal
+from zip_stream import ZipMember, ZipStream, parse_range
+from workers import httpx_queue, selenium_queue
+from status import TaskPriority, TaskStatus
+from events import order_events, format_sse
+import metrics
+from metrics import lock_wait
+from result_cache import result_cache
+from artifact_index import artifact_index
+from blob_store import blob_store
+from compaction import history_compactor
+from ParsingScripts.formats import OUTPUT_FORMATS, DEFAULT_OUTPUT_FORMAT
+from tracing import trace_buffer
 
 
 from fastapi.middleware.cors import CORSMiddleware
@@ -17,6 +33,13 @@ from fastapi.responses import RedirectResponse
 from pydantic import BaseModel, Field
 from typing import Optional, List
 
+# время импорта приложения вместе с зависимостями, без модулей парсеров
+startup_timings["import"] = time.perf_counter() - IMPORT_STARTED
+
+SSE_KEEPALIVE_SECONDS = 15
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+PARSER_KEY_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
 class Source(BaseModel):
     key: str = Field(..., description="Ключ парсера, зарегистрированный в реестре")
     datetime: Optional[str] = Field(
@@ -24,9 +47,17 @@ class Source(BaseModel):
         description="Дата/время в формате 'dd.mm.yyyy_HH-MM'. Не требуется для forced-запуска.",
         examples=["10.09.2025_12-30"],
     )
+    format: Optional[str] = Field(
+        None,
+        description="Формат результата источника: xlsx, csv, parquet или arrow. По умолчанию - формат заказа.",
+        examples=["parquet"],
+    )
+    diff: Optional[bool] = Field(None, description="Добавить к результату файл отличий от прошлого запуска. По умолчанию - как у заказа.")
 
 class ParseRequest(BaseModel):
     source: List[Source] = Field(..., min_items=1, description="Список источников для запуска")
+    format: str = Field(DEFAULT_OUTPUT_FORMAT, description="Формат результатов заказа: xlsx, csv, parquet или arrow", examples=["csv"])
+    diff: bool = Field(False, description="Добавить к результатам файлы отличий от прошлого запуска (<файл>_diff)")
 
 class OrderIdRequest(BaseModel):
     order_id: uuid.UUID = Field(..., description="UUID заказа")
@@ -34,11 +65,21 @@ class OrderIdRequest(BaseModel):
 class ParseResponse(BaseModel):
     order_id: uuid.UUID
 
+class ParserRegistration(BaseModel):
+    key: str = Field(..., description="Ключ парсера, латиница, цифры, '_' и '-'")
+    name: str = Field(..., description="Отображаемое имя")
+    module: str = Field(..., description="Модуль внутри пакета ParsingScripts", examples=["SBIS"])
+    function: str = Field(..., description="Асинхронная функция модуля, возвращающая DataFrame", examples=["parse_sbis"])
+    type: ParsingScripts.ParserType = Field(..., description="Очередь, в которой выполняется парсер")
+    max_age_seconds: int = Field(12 * 3600, ge=0, description="Насколько старше запрошенного времени может быть сохраненный результат")
+    diff_keys: List[str] = Field([], description="Колонки, по которым строки сравниваются с прошлым запуском")
+
 tags_metadata = [
     {"name": "Parsers", "description": "Работа со списком доступных парсеров"},
     {"name": "Orders", "description": "Создание и проверка задач парсинга"},
     {"name": "Results", "description": "Получение результатов парсинга"},
     {"name": "Health", "description": "Проверка статуса сервиса"},
+    {"name": "Admin", "description": "Управление реестром парсеров (нужен заголовок X-Admin-Token)"},
 ]
 
 app = FastAPI(
@@ -66,16 +107,87 @@ async def root():
     return RedirectResponse(url="/docs")
 
 
+@app.get("/stats", tags=["Health"], summary="Статистика работы сервиса")
+async def stats():
+    return {
+        "coalesced_runs": get_coalesced_runs(),
+        "rendered_results": get_rendered_results(),
+        "queues": {"httpx": httpx_queue.qsize(), "selenium": selenium_queue.qsize()},
+        "result_cache": result_cache.get_stats(),
+        "webdriver_pool": ParsingScripts.webdriver_pool.get_stats(),
+        "executors": ParsingScripts.executor_runtime.get_stats(),
+        "artifacts": await artifact_index.get_stats(),
+        "blob_store": blob_store.get_stats(),
+        "compaction": history_compactor.get_stats(),
+        "regions": ParsingScripts.region_state_store.get_stats(),
+        "http": ParsingScripts.http_pool.get_stats(),
+        "rate_limits": ParsingScripts.rate_limiter.get_stats(),
+        "checkpoints": await ParsingScripts.executor_runtime.run_blocking(ParsingScripts.checkpoint_store.get_stats),
+        "startup": startup_timings,
+        "parser_imports": ParsingScripts.import_seconds,
+    }
+
+def collect_metrics():
+    metrics.queue_depth.set(order_queue.qsize(), queue="order")
+    metrics.queue_depth.set(httpx_queue.qsize(), queue="httpx")
+    metrics.queue_depth.set(selenium_queue.qsize(), queue="selenium")
+    for (labels, total) in metrics.workers_total.values.items():
+        busy = metrics.workers_busy.values.get(labels, 0)
+        metrics.workers_idle.set(total - busy, **dict(labels))
+
+    cache_stats = result_cache.get_stats()
+    metrics.cache_lookups_total.set_total(cache_stats["hits"], outcome="hit")
+    metrics.cache_lookups_total.set_total(cache_stats["misses"], outcome="miss")
+    metrics.cache_hit_ratio.set(cache_stats["hit_rate"])
+    metrics.blob_dedup_hits.set_total(blob_store.get_stats()["dedup_hits"])
+
+    executor_stats = ParsingScripts.executor_runtime.get_stats()
+    for pool, pool_stats in executor_stats.items():
+        metrics.pool_active.set(pool_stats["active"], pool=pool)
+        metrics.pool_size.set(pool_stats["max_workers"], pool=pool)
+    webdriver_stats = ParsingScripts.webdriver_pool.get_stats()
+    metrics.pool_active.set(webdriver_stats["in_use"], pool="webdriver")
+    metrics.pool_size.set(webdriver_stats["size"], pool="webdriver")
+    metrics.event_subscribers.set(order_events.get_subscriber_count())
+    for phase, seconds in startup_timings.items():
+        metrics.startup_seconds.set(seconds, phase=phase)
+    for module, seconds in ParsingScripts.import_seconds.items():
+        metrics.parser_import_seconds.set(seconds, module=module)
+    for host, bucket_stats in ParsingScripts.rate_limiter.get_stats().items():
+        metrics.host_rate_limit.set(bucket_stats["rate"], host=host)
+        metrics.host_throttled_total.set_total(bucket_stats["throttled"], host=host)
+
+metrics.registry.add_collector(collect_metrics)
+
+@app.get("/metrics", tags=["Health"], summary="Метрики в формате Prometheus", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.get("/availableparsers", tags=["Parsers"], summary="Список доступных парсеров")
 async def available_parsers():
     available_parsers = []
-    async with ParsingScripts.parsers_lock:
-        for key, parser in ParsingScripts.parsers.items():
-            available_parsers.append ({
-                "name": parser.name,
-                "key": key
-            })
-        return {"parsers": available_parsers}
+    for key, parser in ParsingScripts.parser_registry.get_snapshot().get_enabled().items():
+        available_parsers.append ({
+            "name": parser.name,
+            "key": key
+        })
+    return {"parsers": available_parsers}
+
+@app.get("/parsers/{key}/artifacts", tags=["Parsers"], summary="Сохраненные результаты парсера",
+         description="Имя, время, размер и sha256 последних файлов парсера из индекса артефактов.")
+async def parser_artifacts(key: str, limit: int = 100):
+    if ParsingScripts.parser_registry.get(key) is None:
+        raise HTTPException(status_code=404, detail=f"undefined source({key})")
+    records = await artifact_index.list(key, max(1, min(limit, 1000)))
+    return {"parser_key": key, "artifacts": [record.to_dict() for record in records]}
+
+@app.get("/parsers/{key}/history", tags=["Parsers"], summary="История результатов парсера",
+         description="Снимки, перенесенные из xlsx в колоночный датасет (Parquet или Arrow IPC), с путями к файлам разделов.")
+async def parser_history(key: str):
+    if ParsingScripts.parser_registry.get(key) is None:
+        raise HTTPException(status_code=404, detail=f"undefined source({key})")
+    records = await artifact_index.list_history(key)
+    return {"parser_key": key, "history": [record.to_dict() for record in records]}
 
 @app.post("/parse",
     tags=["Orders"],
@@ -97,30 +209,38 @@ async def create_forced_parse_order(body: ParseRequest):
 
 
 async def start_parsing(body: ParseRequest, forced = False):
-    async with ParsingScripts.parsers_lock:
-        parsing_tasks = []
-        for source in body.source:
-            if source["key"] not in ParsingScripts.parsers:
-                raise HTTPException(status_code=400, detail=f"undefined source({source.key})")
-            
-            pt_id = uuid.uuid4()
-            if forced:
-                date_time = None
-            else:
-                if not source.datetime:
-                    raise HTTPException(status_code=400, detail="missing datetime for non-forced run")
-                try:
-                    date_time = datetime.datetime.strptime(source.datetime, "%d.%m.%Y_%H-%M")
-                except ValueError:
-                    raise HTTPException(status_code=400, detail="bad datetime format, expected dd.mm.yyyy_HH-MM")
-            pt = ParsingTask(source.key, date_time, pt_id)
-            parsing_tasks.append(pt)
-            
-        po_id = uuid.uuid4()
-        po = ParsingOrder(po_id,parsing_tasks,datetime.datetime.now())
-        print(f"registred forced = {forced}, {po}")
-        order_queue.put_nowait(po)
-        return {"order_id": po_id}
+    snapshot = ParsingScripts.parser_registry.get_snapshot()
+    parsing_tasks = []
+    for source in body.source:
+        if snapshot.get(source.key) is None:
+            raise HTTPException(status_code=400, detail=f"undefined source({source.key})")
+        if not snapshot.is_enabled(source.key):
+            raise HTTPException(status_code=400, detail=f"disabled source({source.key})")
+        
+        pt_id = uuid.uuid4()
+        if forced:
+            date_time = None
+        else:
+            if not source.datetime:
+                raise HTTPException(status_code=400, detail="missing datetime for non-forced run")
+            try:
+                date_time = datetime.datetime.strptime(source.datetime, "%d.%m.%Y_%H-%M")
+            except ValueError:
+                raise HTTPException(status_code=400, detail="bad datetime format, expected dd.mm.yyyy_HH-MM")
+        output_format = (source.format or body.format).lower()
+        if output_format not in OUTPUT_FORMATS:
+            raise HTTPException(status_code=400, detail=f"unsupported format({output_format}), expected one of {', '.join(OUTPUT_FORMATS)}")
+        priority = TaskPriority.FORCED if forced else TaskPriority.NORMAL
+        diff = body.diff if source.diff is None else source.diff
+        pt = ParsingTask(source.key, date_time, pt_id, priority, output_format, diff)
+        parsing_tasks.append(pt)
+        
+    po_id = uuid.uuid4()
+    po = ParsingOrder(po_id,parsing_tasks,datetime.datetime.now())
+    print(f"registred forced = {forced}, {po}")
+    await add_order(po_id, po)
+    order_queue.put_nowait(po)
+    return {"order_id": po_id}
 
 @app.post(
     "/check",
@@ -132,50 +252,265 @@ async def check_status(body: OrderIdRequest):
     order: ParsingOrder = await get_order(body.order_id)
     if order is None:
         raise HTTPException(status_code=400, detail=f"unknown order_id {body.order_id}")
-    async with order.get_lock():
+    return {"status": await get_order_status(order)}
+
+async def get_order_status(order: ParsingOrder) -> dict:
+    async with lock_wait(order.get_lock(), "order_lock"):
         status = await order.get_full_status()
-    return {"status": {"order_id": str(body.order_id), "tasks": status}}
+        queue = {}
+        for task in order.get_task_list():
+            position = get_queue_position(task)
+            if position is not None:
+                queue[task.get_parser_key()] = position
+    return {"order_id": str(order.get_id()), "tasks": status, "queue": queue}
+
+def is_order_finished(status: dict) -> bool:
+    return all(task_status in (TaskStatus.COMPLETED, TaskStatus.FAILED) for task_status in status["tasks"].values())
 
 @app.post(
-    "/result",
-    tags=["Results"],
-    summary="Получить результат заказа",
-    description="Возвращает архив с результатами или другой формат, согласно реализации.",
+    "/orders/{order_id}/retry",
+    tags=["Orders"],
+    summary="Повторить упавшие задачи заказа",
+    description="Упавшие задачи снова ставятся в очередь; прерванный запуск парсера продолжается с последнего пройденного региона.",
 )
-async def get_result(body: OrderIdRequest):
-    
-    order_id = order.order_id
+async def retry_order_tasks(order_id: uuid.UUID):
+    order: ParsingOrder = await get_order(order_id)
+    if order is None:
+        raise HTTPException(status_code=400, detail=f"unknown order_id {order_id}")
+    retried = await retry_order(order)
+    if not retried:
+        raise HTTPException(status_code=400, detail=f"no failed tasks in order {order_id}")
+    return {"order_id": order_id, "retried": retried}
 
-    if order_id is None:
-        raise HTTPException(status_code=400, detail="Missing order_id")
+@app.get(
+    "/orders/{order_id}/events",
+    tags=["Orders"],
+    summary="Подписка на статус заказа",
+    description="Server-Sent Events: снимок статуса (status), изменения задач (task) и завершение заказа (done).",
+)
+async def order_events_stream(order_id: uuid.UUID, request: Request):
+    order: ParsingOrder = await get_order(order_id)
+    if order is None:
+        raise HTTPException(status_code=400, detail=f"unknown order_id {order_id}")
+    queue = order_events.subscribe(order_id)
 
-    try:
-        order_uuid = uuid.UUID(order_id)
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid order_id format")
+    async def stream():
+        try:
+            status = await get_order_status(order)
+            yield format_sse("status", status)
+            while not is_order_finished(status):
+                try:
+                    event = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse("task", event)
+                status = await get_order_status(order)
+            yield format_sse("done", status)
+        finally:
+            order_events.unsubscribe(order_id, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-    order : ParsingOrder = await get_order(order_uuid)
-    async with order.get_lock():
+@app.get(
+    "/orders/{order_id}/trace",
+    tags=["Orders"],
+    summary="Трасса заказа",
+    description="Фазы обработки заказа и его задач: ожидание в очередях, распределение, ожидание парсера, запуск, кодирование, запись.",
+)
+async def order_trace(order_id: uuid.UUID):
+    traces = trace_buffer.get(str(order_id))
+    if traces is None:
+        raise HTTPException(status_code=404, detail=f"no trace for order_id {order_id}")
+    return {
+        "order_id": str(order_id),
+        "trace_id": traces[0].get_trace_id(),
+        "spans": [span.to_dict() for trace in traces for span in trace.get_spans()],
+    }
+
+# временные файлы архива закрываются после ответа, даже если тело не читалось (HEAD) или клиент отключился до первого куска
+class ZipStreamResponse(StreamingResponse):
+    def __init__(self, stream: ZipStream, byte_range: tuple[int, int] | None, status_code: int, headers: dict):
+        start, end = byte_range or (0, None)
+        super().__init__(stream.iter_range(start, end), status_code=status_code, media_type="application/zip", headers=headers)
+        self.stream = stream
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.stream.close()
+
+async def build_result_response(order_id: uuid.UUID, request: Request):
+    order : ParsingOrder = await get_order(order_id)
+    if order is None:
+        raise HTTPException(status_code=400, detail=f"unknown order_id {order_id}")
+    async with lock_wait(order.get_lock(), "order_lock"):
         task_list = order.get_task_list()
+        order_date_time = order.get_date_time()
         print(f"sending {order}")
-    
-    files_bin = {}
+
+    members = []
+    file_names = set()
     for task in task_list:
+        path = await get_task_file_path(task)
+        if path is None:
+            continue
         async with task.get_lock():
-            files_bin[task.get_file_name()] = task.get_file()
+            file_name = task.get_file_name()
+            date_time = task.get_date_time() or order_date_time
+            blob = task.get_blob()
+            diff_file_name = task.get_diff_file_name()
+            diff_blob = task.get_diff_blob()
+        if file_name not in file_names:
+            file_names.add(file_name)
+            if blob is not None:
+                members.append(ZipMember(file_name, path, date_time, blob.get_size(), blob.get_crc32()))
+            else:
+                members.append(ZipMember(file_name, path, date_time))
+        if diff_blob is not None and diff_file_name not in file_names:
+            file_names.add(diff_file_name)
+            members.append(ZipMember(
+                diff_file_name, blob_store.get_path(diff_blob), date_time, diff_blob.get_size(), diff_blob.get_crc32()
+            ))
 
-    zip_buffer = io.BytesIO()
+    try:
+        stream = await ParsingScripts.executor_runtime.run_blocking(ZipStream(members).prepare)
+    except FileNotFoundError:
+        raise HTTPException(status_code=410, detail=f"result files of order {order_id} were removed by history compaction, request the parse again")
+    headers = {
+        "Content-Disposition": "attachment; filename=reports.zip",
+        "Accept-Ranges": "bytes",
+        "ETag": stream.etag,
+    }
 
-    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-        for file_name in files_bin:
-            zip_file.writestr(file_name, files_bin[file_name].read())
-        
-    zip_buffer.seek(0)
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if if_range is None or if_range == stream.etag:
+        try:
+            byte_range = parse_range(request.headers.get("range"), stream.size)
+        except ValueError:
+            stream.close()
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{stream.size}"})
 
-    asyncio.create_task(remove_order(order_id, delay=3600))
+    schedule_order_removal(order, delay=3600)
 
-    return StreamingResponse(
-        zip_buffer,
-        media_type="application/zip",
-        headers={"Content-Disposition": "attachment; filename=reports.zip"}
+    if byte_range is None:
+        headers["Content-Length"] = str(stream.size)
+        return ZipStreamResponse(stream, None, 200, headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{stream.size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return ZipStreamResponse(stream, byte_range, 206, headers)
+
+@app.post(
+    "/result",
+    tags=["Results"],
+    summary="Получить результат заказа",
+    description="Возвращает zip-архив с результатами. Архив отдается потоком, поддерживаются заголовки Range/If-Range.",
+)
+async def get_result(body: OrderIdRequest, request: Request):
+    return await build_result_response(body.order_id, request)
+
+@app.get(
+    "/result/{order_id}",
+    tags=["Results"],
+    summary="Скачать результат заказа",
+    description="То же, что POST /result, но подходит для прямой ссылки и докачки.",
+)
+async def download_result(order_id: uuid.UUID, request: Request):
+    return await build_result_response(order_id, request)
+
+def check_admin_token(token: str | None):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="admin api is disabled, set ADMIN_TOKEN")
+    if not token or not secrets.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="bad admin token")
+
+def describe_parser(parser: ParsingScripts.Parser, snapshot: ParsingScripts.RegistrySnapshot) -> dict:
+    latest = parser.get_latest()
+    return {
+        "key": parser.get_key(),
+        "name": parser.get_name(),
+        "type": parser.get_type(),
+        "enabled": snapshot.is_enabled(parser.get_key()),
+        "output_path": parser.get_output_path(),
+        "max_age_seconds": int(parser.get_max_age().total_seconds()),
+        "diff_keys": parser.get_diff_keys(),
+        "latest_parse_file_name": latest.get_file_name(),
+        "latest_parse_datetime": latest.get_date_time().isoformat() if latest.get_date_time() else None,
+    }
+
+def describe_registry(snapshot: ParsingScripts.RegistrySnapshot) -> dict:
+    return {
+        "version": snapshot.get_version(),
+        "parsers": [describe_parser(parser, snapshot) for parser in snapshot.get_all().values()],
+    }
+
+@app.get("/admin/parsers", tags=["Admin"], summary="Реестр парсеров, включая отключенные")
+async def admin_parsers(x_admin_token: str | None = Header(None)):
+    check_admin_token(x_admin_token)
+    return describe_registry(ParsingScripts.parser_registry.get_snapshot())
+
+# регистрирует новый парсер или заменяет существующий; состояние последнего запуска при замене сохраняется
+@app.post("/admin/parsers", tags=["Admin"], summary="Зарегистрировать или заменить парсер")
+async def admin_register_parser(body: ParserRegistration, x_admin_token: str | None = Header(None)):
+    check_admin_token(x_admin_token)
+    if not PARSER_KEY_PATTERN.match(body.key):
+        raise HTTPException(status_code=400, detail=f"bad parser key({body.key})")
+    if not all(part.isidentifier() for part in body.module.split(".")):
+        raise HTTPException(status_code=400, detail=f"bad module name({body.module})")
+    try:
+        module = await ParsingScripts.executor_runtime.run_blocking(ParsingScripts.import_parser_module, body.module)
+    except ImportError as e:
+        raise HTTPException(status_code=400, detail=f"cannot import module({body.module}): {e}")
+    run = getattr(module, body.function, None)
+    if run is None or not asyncio.iscoroutinefunction(run):
+        raise HTTPException(status_code=400, detail=f"{body.module}.{body.function} is not an async function")
+
+    parser = ParsingScripts.Parser(
+        key=body.key,
+        name=body.name,
+        run=run,
+        type=body.type,
+        output_path=f"./oldData/{body.key}/",
+        max_age=datetime.timedelta(seconds=body.max_age_seconds),
+        module=body.module,
+        function=body.function,
+        diff_keys=body.diff_keys,
     )
+    os.makedirs(parser.get_output_path(), exist_ok=True)
+    snapshot = ParsingScripts.parser_registry.register(parser)
+    print(f"registered parser {body.key} ({body.module}.{body.function}), registry version {snapshot.get_version()}")
+    return describe_registry(snapshot)
+
+async def set_parser_enabled(key: str, enabled: bool, token: str | None) -> dict:
+    check_admin_token(token)
+    try:
+        snapshot = ParsingScripts.parser_registry.set_enabled(key, enabled)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"undefined source({key})")
+    print(f"parser {key} enabled = {enabled}, registry version {snapshot.get_version()}")
+    return describe_registry(snapshot)
+
+@app.post("/admin/compaction", tags=["Admin"], summary="Запустить уплотнение истории",
+          description="Переносит закрытые дни из xlsx в датасет истории и применяет политику хранения, не дожидаясь фонового запуска.")
+async def admin_compaction(x_admin_token: str | None = Header(None)):
+    check_admin_token(x_admin_token)
+    await history_compactor.run()
+    return history_compactor.get_stats()
+
+@app.post("/admin/parsers/{key}/disable", tags=["Admin"], summary="Отключить парсер", description="Новые заказы на парсер отклоняются, принятые задачи дорабатывают.")
+async def admin_disable_parser(key: str, x_admin_token: str | None = Header(None)):
+    return await set_parser_enabled(key, False, x_admin_token)
+
+@app.post("/admin/parsers/{key}/enable", tags=["Admin"], summary="Включить парсер")
+async def admin_enable_parser(key: str, x_admin_token: str | None = Header(None)):
+    return await set_parser_enabled(key, True, x_admin_token)
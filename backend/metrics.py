@@ -0,0 +1,167 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DURATION_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 7200)
+WAIT_BUCKETS = (0.01, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+LOCK_BUCKETS = (0.0001, 0.001, 0.01, 0.1, 0.5, 1, 5, 10)
+LOCK_HOLD_BUCKETS = (0.0001, 0.001, 0.01, 0.1, 1, 10, 60, 300, 1800)
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values: dict[tuple, float] = {}
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        for labels, value in self.values.items():
+            lines.append(f"{self.name}{format_labels(dict(labels))} {format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.items())
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def set_total(self, value: float, **labels):
+        self.values[tuple(labels.items())] = value
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        self.values[tuple(labels.items())] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.items())
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: tuple = DURATION_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self.series: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.items())
+        series = self.series.get(key)
+        if series is None:
+            series = [[0] * len(self.buckets), 0.0, 0]
+            self.series[key] = series
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+                break
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        for key, (counts, total, count) in self.series.items():
+            labels = dict(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                bucket_labels = format_labels({**labels, "le": format_value(bound)})
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(labels)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(labels)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list[Metric] = []
+        self.collectors = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    # сборщики обновляют gauge из текущего состояния сервиса перед каждой выдачей
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self.collectors:
+            try:
+                collector()
+            except Exception as e:
+                print(f"metrics collector failed: {e}")
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+queue_depth = registry.register(Gauge("parsing_queue_depth", "Number of items waiting in a queue"))
+queue_wait_seconds = registry.register(Histogram("parsing_queue_wait_seconds", "Time an item spent waiting in a queue", WAIT_BUCKETS))
+parser_run_seconds = registry.register(Histogram("parsing_parser_run_seconds", "Duration of a parser run", DURATION_BUCKETS))
+parser_runs_total = registry.register(Counter("parsing_parser_runs_total", "Parser runs by result"))
+coalesced_runs_total = registry.register(Counter("parsing_coalesced_runs_total", "Tasks that joined an already running parser instead of starting a new run"))
+workers_total = registry.register(Gauge("parsing_workers", "Started workers per queue"))
+workers_busy = registry.register(Gauge("parsing_workers_busy", "Workers currently processing a task"))
+workers_idle = registry.register(Gauge("parsing_workers_idle", "Workers currently waiting for a task"))
+cache_lookups_total = registry.register(Counter("parsing_result_cache_lookups_total", "Result cache lookups by outcome"))
+cache_hit_ratio = registry.register(Gauge("parsing_result_cache_hit_ratio", "Share of result cache lookups that found a fresh result"))
+blob_dedup_hits = registry.register(Counter("parsing_blob_dedup_total", "Results that reused an existing blob instead of writing a new one"))
+lock_wait_seconds = registry.register(Histogram("parsing_lock_wait_seconds", "Time spent waiting to acquire a lock", LOCK_BUCKETS))
+lock_hold_seconds = registry.register(Histogram("parsing_lock_hold_seconds", "Time a lock was held after acquiring it", LOCK_HOLD_BUCKETS))
+pool_active = registry.register(Gauge("parsing_pool_active", "Busy workers of an executor or session pool"))
+pool_size = registry.register(Gauge("parsing_pool_size", "Maximum workers of an executor or session pool"))
+event_subscribers = registry.register(Gauge("parsing_event_subscribers", "Open order event streams"))
+startup_seconds = registry.register(Gauge("parsing_startup_seconds", "Duration of a service startup phase"))
+parser_import_seconds = registry.register(Gauge("parsing_parser_import_seconds", "Time taken by the first import of a parser module"))
+host_rate_limit = registry.register(Gauge("parsing_host_rate_limit", "Current request rate allowed for a host, requests per second"))
+host_throttled_total = registry.register(Counter("parsing_host_throttled_total", "429/503 responses that lowered the request rate of a host"))
+
+
+@asynccontextmanager
+async def lock_wait(lock: asyncio.Lock, name: str):
+    started = time.monotonic()
+    async with lock:
+        acquired = time.monotonic()
+        lock_wait_seconds.observe(acquired - started, lock=name)
+        try:
+            yield
+        finally:
+            lock_hold_seconds.observe(time.monotonic() - acquired, lock=name)
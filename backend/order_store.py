@@ -0,0 +1,265 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+
+import ParsingScripts
+
+ORDER_STORE = os.environ.get("ORDER_STORE", "sqlite")
+ORDER_STORE_PATH = os.environ.get("ORDER_STORE_PATH", "./oldData/orders.sqlite3")
+ORDER_TTL_SECONDS = float(os.environ.get("ORDER_TTL_SECONDS", 24 * 3600))
+ORDER_STORE_MAX_ORDERS = int(os.environ.get("ORDER_STORE_MAX_ORDERS", 1000))
+ORDER_EVICTION_INTERVAL = float(os.environ.get("ORDER_EVICTION_INTERVAL", 300))
+
+UNFINISHED_STATUSES = ("pending", "in_progress")
+
+# хранилище заказов: запись заказа - dict с полями id, date_time, status, error, updated_at, tasks;
+# запись задачи - dict с полями id, order_id, parser_key, date_time, priority, status, error, file_name, position
+class OrderStore(ABC):
+    @abstractmethod
+    async def save_order(self, record: dict) -> None:
+        ...
+
+    @abstractmethod
+    async def save_task(self, record: dict) -> None:
+        ...
+
+    @abstractmethod
+    async def load_order(self, order_id: str) -> dict | None:
+        ...
+
+    @abstractmethod
+    async def load_unfinished(self) -> list[dict]:
+        ...
+
+    @abstractmethod
+    async def remove_order(self, order_id: str) -> None:
+        ...
+
+    @abstractmethod
+    async def evict(self, ttl: float, max_orders: int) -> list[str]:
+        ...
+
+    # sha256 blob-ов, на которые ссылаются задачи сохраненных заказов: уплотнение истории их не удаляет
+    @abstractmethod
+    async def get_referenced_blobs(self) -> set[str]:
+        ...
+
+    async def close(self) -> None:
+        pass
+
+
+def is_finished(record: dict) -> bool:
+    return all(task["status"] not in UNFINISHED_STATUSES for task in record["tasks"])
+
+
+def get_task_blobs(task: dict) -> list[str]:
+    return [blob["sha256"] for blob in (task.get("blob"), task.get("diff_blob")) if blob and blob.get("sha256")]
+
+
+class MemoryOrderStore(OrderStore):
+    def __init__(self):
+        self.orders: dict[str, dict] = {}
+
+    async def save_order(self, record: dict) -> None:
+        record = dict(record, tasks=[dict(task) for task in record["tasks"]], updated_at=time.time())
+        self.orders[record["id"]] = record
+
+    async def save_task(self, record: dict) -> None:
+        order = self.orders.get(record["order_id"])
+        if order is None:
+            return
+        order["tasks"] = [dict(record) if task["id"] == record["id"] else task for task in order["tasks"]]
+        order["updated_at"] = time.time()
+
+    async def load_order(self, order_id: str) -> dict | None:
+        return self.orders.get(order_id)
+
+    async def load_unfinished(self) -> list[dict]:
+        return [record for record in self.orders.values() if not is_finished(record)]
+
+    async def remove_order(self, order_id: str) -> None:
+        self.orders.pop(order_id, None)
+
+    async def evict(self, ttl: float, max_orders: int) -> list[str]:
+        finished = sorted(
+            (record for record in self.orders.values() if is_finished(record)),
+            key=lambda record: record["updated_at"]
+        )
+        deadline = time.time() - ttl
+        overflow = max(0, len(self.orders) - max_orders)
+        evicted = []
+        for record in finished:
+            if record["updated_at"] < deadline or len(evicted) < overflow:
+                evicted.append(record["id"])
+        for order_id in evicted:
+            self.orders.pop(order_id, None)
+        return evicted
+
+    async def get_referenced_blobs(self) -> set[str]:
+        return {sha256 for record in self.orders.values() for task in record["tasks"] for sha256 in get_task_blobs(task)}
+
+
+class SqliteOrderStore(OrderStore):
+    def __init__(self, path: str = ORDER_STORE_PATH):
+        self.path = path
+        self.connection: sqlite3.Connection | None = None
+        self.lock = threading.Lock()
+
+    def connect(self) -> sqlite3.Connection:
+        if self.connection is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA foreign_keys=ON")
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS orders (
+                    id TEXT PRIMARY KEY,
+                    date_time TEXT,
+                    status TEXT NOT NULL,
+                    error TEXT,
+                    updated_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id TEXT PRIMARY KEY,
+                    order_id TEXT NOT NULL REFERENCES orders(id) ON DELETE CASCADE,
+                    position INTEGER NOT NULL,
+                    data TEXT NOT NULL,
+                    status TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS tasks_order_id ON tasks(order_id);
+                CREATE INDEX IF NOT EXISTS orders_updated_at ON orders(updated_at);
+            """)
+            self.connection = connection
+        return self.connection
+
+    def save_order_sync(self, record: dict) -> None:
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.execute(
+                    "INSERT INTO orders (id, date_time, status, error, updated_at) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET date_time = excluded.date_time, status = excluded.status, "
+                    "error = excluded.error, updated_at = excluded.updated_at",
+                    (record["id"], record["date_time"], record["status"], record["error"], time.time())
+                )
+                connection.executemany(
+                    "INSERT OR REPLACE INTO tasks (id, order_id, position, data, status) VALUES (?, ?, ?, ?, ?)",
+                    [(task["id"], record["id"], task["position"], json.dumps(task), task["status"]) for task in record["tasks"]]
+                )
+
+    def save_task_sync(self, record: dict) -> None:
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.execute(
+                    "UPDATE tasks SET data = ?, status = ? WHERE id = ?",
+                    (json.dumps(record), record["status"], record["id"])
+                )
+                connection.execute(
+                    "UPDATE orders SET updated_at = ? WHERE id = ?",
+                    (time.time(), record["order_id"])
+                )
+
+    def read_order(self, connection: sqlite3.Connection, row: sqlite3.Row) -> dict:
+        tasks = connection.execute(
+            "SELECT data FROM tasks WHERE order_id = ? ORDER BY position", (row["id"],)
+        ).fetchall()
+        return {
+            "id": row["id"],
+            "date_time": row["date_time"],
+            "status": row["status"],
+            "error": row["error"],
+            "updated_at": row["updated_at"],
+            "tasks": [json.loads(task["data"]) for task in tasks],
+        }
+
+    def load_order_sync(self, order_id: str) -> dict | None:
+        with self.lock:
+            connection = self.connect()
+            row = connection.execute("SELECT * FROM orders WHERE id = ?", (order_id,)).fetchone()
+            if row is None:
+                return None
+            return self.read_order(connection, row)
+
+    def load_unfinished_sync(self) -> list[dict]:
+        with self.lock:
+            connection = self.connect()
+            rows = connection.execute(
+                "SELECT * FROM orders WHERE id IN (SELECT order_id FROM tasks WHERE status IN (?, ?)) ORDER BY updated_at",
+                UNFINISHED_STATUSES
+            ).fetchall()
+            return [self.read_order(connection, row) for row in rows]
+
+    def remove_order_sync(self, order_id: str) -> None:
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.execute("DELETE FROM orders WHERE id = ?", (order_id,))
+
+    def evict_sync(self, ttl: float, max_orders: int) -> list[str]:
+        with self.lock:
+            connection = self.connect()
+            finished = "id NOT IN (SELECT order_id FROM tasks WHERE status IN (?, ?))"
+            expired = [row["id"] for row in connection.execute(
+                f"SELECT id FROM orders WHERE {finished} AND updated_at < ?",
+                (*UNFINISHED_STATUSES, time.time() - ttl)
+            )]
+            total = connection.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+            overflow = total - len(expired) - max_orders
+            if overflow > 0:
+                expired += [row["id"] for row in connection.execute(
+                    f"SELECT id FROM orders WHERE {finished} AND updated_at >= ? ORDER BY updated_at LIMIT ?",
+                    (*UNFINISHED_STATUSES, time.time() - ttl, overflow)
+                )]
+            with connection:
+                connection.executemany("DELETE FROM orders WHERE id = ?", [(order_id,) for order_id in expired])
+            return expired
+
+    def get_referenced_blobs_sync(self) -> set[str]:
+        with self.lock:
+            rows = self.connect().execute("SELECT data FROM tasks").fetchall()
+        return {sha256 for row in rows for sha256 in get_task_blobs(json.loads(row["data"]))}
+
+    async def save_order(self, record: dict) -> None:
+        await ParsingScripts.executor_runtime.run_blocking(self.save_order_sync, record)
+
+    async def save_task(self, record: dict) -> None:
+        await ParsingScripts.executor_runtime.run_blocking(self.save_task_sync, record)
+
+    async def load_order(self, order_id: str) -> dict | None:
+        return await ParsingScripts.executor_runtime.run_blocking(self.load_order_sync, order_id)
+
+    async def load_unfinished(self) -> list[dict]:
+        return await ParsingScripts.executor_runtime.run_blocking(self.load_unfinished_sync)
+
+    async def remove_order(self, order_id: str) -> None:
+        await ParsingScripts.executor_runtime.run_blocking(self.remove_order_sync, order_id)
+
+    async def evict(self, ttl: float, max_orders: int) -> list[str]:
+        return await ParsingScripts.executor_runtime.run_blocking(self.evict_sync, ttl, max_orders)
+
+    async def get_referenced_blobs(self) -> set[str]:
+        return await ParsingScripts.executor_runtime.run_blocking(self.get_referenced_blobs_sync)
+
+    async def close(self) -> None:
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+
+def create_order_store(kind: str = ORDER_STORE) -> OrderStore:
+    match kind:
+        case "sqlite":
+            return SqliteOrderStore()
+        case "memory":
+            return MemoryOrderStore()
+        case _:
+            raise ValueError(f"unknown order store: {kind}")
+
+
+order_store = create_order_store()
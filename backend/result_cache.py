@@ -0,0 +1,66 @@
+import datetime
+
+import ParsingScripts
+from blob_store import blob_store, BlobRef
+
+class CachedResult:
+    def __init__(self, file_name: str, blob: BlobRef, date_time: datetime.datetime, digest: str | None = None):
+        self.file_name = file_name
+        self.blob = blob
+        self.date_time = date_time
+        self.digest = digest
+
+    def get_file_name(self) -> str:
+        return self.file_name
+
+    def get_blob(self) -> BlobRef:
+        return self.blob
+
+    def get_date_time(self) -> datetime.datetime:
+        return self.date_time
+
+    def get_digest(self) -> str | None:
+        return self.digest
+
+# результат свежий, если он получен не раньше чем за max_age до запрошенного времени
+def is_fresh(latest_parse: datetime.datetime, deadline_time: datetime.datetime, max_age: datetime.timedelta) -> bool:
+    if latest_parse is None or deadline_time is None:
+        return False
+    return latest_parse >= deadline_time - max_age
+
+# кэш отдает ссылку на последний blob парсера; байты в памяти не держатся,
+# при отдаче файл читается через mmap и делится всеми заказами через page cache
+class ResultCache:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.missing_blobs = 0
+
+    async def has_fresh(self, parser: ParsingScripts.Parser, deadline_time: datetime.datetime) -> bool:
+        return is_fresh(parser.get_latest_parse_datetime(), deadline_time, parser.get_max_age())
+
+    async def lookup(self, parser: ParsingScripts.Parser, deadline_time: datetime.datetime) -> CachedResult | None:
+        latest = parser.get_latest()
+        if not is_fresh(latest.get_date_time(), deadline_time, parser.get_max_age()) or latest.get_blob() is None:
+            self.misses += 1
+            return None
+
+        if not await blob_store.exists(latest.get_blob()):
+            print(f"cached result {latest.get_file_name()} of {parser.get_key()} is missing in blob store")
+            self.missing_blobs += 1
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return CachedResult(latest.get_file_name(), latest.get_blob(), latest.get_date_time(), latest.get_digest())
+
+    def get_stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "missing_blobs": self.missing_blobs,
+        }
+
+result_cache = ResultCache()
@@ -0,0 +1,51 @@
+import asyncio
+import datetime
+import os
+import time
+
+from metrics import queue_wait_seconds
+
+AGING_SECONDS = float(os.environ.get("SCHEDULER_AGING_SECONDS", 300))
+
+class ScheduledItem:
+    def __init__(self, task, priority: int, deadline: datetime.datetime | None):
+        self.task = task
+        self.priority = priority
+        self.deadline = deadline
+        self.enqueued_at = time.monotonic()
+        self.enqueued_datetime = datetime.datetime.now()
+
+    def get_key(self, now: float) -> tuple:
+        # старение: за каждые AGING_SECONDS ожидания задача поднимается на один класс приоритета
+        aged_priority = self.priority - int((now - self.enqueued_at) // AGING_SECONDS)
+        deadline = self.deadline if self.deadline is not None else self.enqueued_datetime
+        return (aged_priority, deadline, self.enqueued_at)
+
+# очередь задач: сначала класс приоритета (с учетом старения), затем earliest-deadline-first
+class PriorityTaskQueue(asyncio.Queue):
+    def __init__(self, name: str, maxsize: int = 0):
+        self.name = name
+        super().__init__(maxsize)
+
+    def _init(self, maxsize):
+        self._queue: list[ScheduledItem] = []
+
+    def _put(self, item):
+        self._queue.append(ScheduledItem(item, item.get_priority(), item.get_date_time()))
+
+    def _get(self):
+        now = time.monotonic()
+        best = min(range(len(self._queue)), key=lambda i: self._queue[i].get_key(now))
+        item = self._queue.pop(best)
+        queue_wait_seconds.observe(now - item.enqueued_at, queue=self.name)
+        return item.task
+
+    def get_ordered(self) -> list:
+        now = time.monotonic()
+        return [item.task for item in sorted(self._queue, key=lambda item: item.get_key(now))]
+
+    def get_position(self, task) -> int | None:
+        for position, queued in enumerate(self.get_ordered(), start=1):
+            if queued is task:
+                return position
+        return None
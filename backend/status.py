@@ -10,3 +10,7 @@ class OrderStatus(str,enum.Enum):
     IN_PROGRESS = "in_progress"
     COMPLETED = "completed"
     FAILED = "failed"
+
+class TaskPriority(int,enum.Enum):
+    FORCED = 0
+    NORMAL = 1
@@ -0,0 +1,183 @@
+import os
+import json
+import time
+import secrets
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+TRACE_BUFFER_SIZE = int(os.environ.get("TRACE_BUFFER_SIZE", 500))
+TRACE_EXPORT_PATH = os.environ.get("TRACE_EXPORT_PATH", "")
+SERVICE_NAME = "parsing-manager"
+
+
+def new_trace_id() -> str:
+    return secrets.token_hex(16)
+
+
+def new_span_id() -> str:
+    return secrets.token_hex(8)
+
+
+def otlp_attributes(attributes: dict) -> list[dict]:
+    result = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            otlp_value = {"boolValue": value}
+        elif isinstance(value, int):
+            otlp_value = {"intValue": str(value)}
+        elif isinstance(value, float):
+            otlp_value = {"doubleValue": value}
+        else:
+            otlp_value = {"stringValue": str(value)}
+        result.append({"key": key, "value": otlp_value})
+    return result
+
+
+class Span:
+    def __init__(self, name: str, trace_id: str, parent_id: str | None = None, attributes: dict | None = None, start: float | None = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = new_span_id()
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start = time.time() if start is None else start
+        self.end = None
+
+    def finish(self, end: float | None = None):
+        if self.end is None:
+            self.end = time.time() if end is None else end
+
+    def is_finished(self) -> bool:
+        return self.end is not None
+
+    def get_duration(self) -> float | None:
+        return None if self.end is None else self.end - self.start
+
+    def copy_to(self, trace_id: str, parent_id: str, **attributes) -> "Span":
+        span = Span(self.name, trace_id, parent_id, {**self.attributes, **attributes}, self.start)
+        span.end = self.end
+        return span
+
+    def to_dict(self) -> dict:
+        duration = self.get_duration()
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "start": self.start,
+            "end": self.end,
+            "duration_ms": None if duration is None else round(duration * 1000, 3),
+            "attributes": self.attributes,
+        }
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(int(self.start * 1e9)),
+            "endTimeUnixNano": str(int((self.end or time.time()) * 1e9)),
+            "attributes": otlp_attributes(self.attributes),
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+# трасса заказа или задачи: корневой span и дочерние span по фазам обработки
+class Trace:
+    def __init__(self, name: str, **attributes):
+        self.root = Span(name, new_trace_id(), attributes=attributes)
+        self.spans: list[Span] = []
+        self.lock = threading.Lock()
+
+    def get_trace_id(self) -> str:
+        return self.root.trace_id
+
+    def get_root(self) -> Span:
+        return self.root
+
+    # задачи заказа попадают в трассу заказа
+    def attach(self, parent: "Trace"):
+        with self.lock:
+            self.root.trace_id = parent.get_trace_id()
+            self.root.parent_id = parent.get_root().span_id
+            for span in self.spans:
+                span.trace_id = self.root.trace_id
+
+    def begin(self, name: str, **attributes) -> Span:
+        span = Span(name, self.root.trace_id, self.root.span_id, attributes)
+        with self.lock:
+            self.spans.append(span)
+        return span
+
+    def finish(self, name: str):
+        with self.lock:
+            for span in reversed(self.spans):
+                if span.name == name and not span.is_finished():
+                    span.finish()
+                    return
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        span = self.begin(name, **attributes)
+        try:
+            yield span
+        except BaseException as e:
+            span.attributes["error"] = str(e)
+            raise
+        finally:
+            span.finish()
+
+    def add(self, spans: list[Span], **attributes):
+        copies = [span.copy_to(self.root.trace_id, self.root.span_id, **attributes) for span in spans]
+        with self.lock:
+            self.spans.extend(copies)
+
+    def close(self):
+        self.root.finish()
+
+    def get_spans(self) -> list[Span]:
+        with self.lock:
+            return [self.root] + list(self.spans)
+
+
+class TraceBuffer:
+    def __init__(self, size: int = TRACE_BUFFER_SIZE):
+        self.size = size
+        self.traces: OrderedDict[str, list[Trace]] = OrderedDict()
+
+    def add(self, key: str, traces: list[Trace]):
+        self.traces[key] = traces
+        self.traces.move_to_end(key)
+        while len(self.traces) > self.size:
+            self.traces.popitem(last=False)
+
+    def get(self, key: str) -> list[Trace] | None:
+        return self.traces.get(key)
+
+
+def to_otlp(traces: list[Trace]) -> dict:
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": otlp_attributes({"service.name": SERVICE_NAME})},
+            "scopeSpans": [{
+                "scope": {"name": SERVICE_NAME},
+                "spans": [span.to_otlp() for trace in traces for span in trace.get_spans()],
+            }],
+        }]
+    }
+
+
+# OTLP/JSON, по одному объекту ExportTraceServiceRequest на строку
+def export_otlp(traces: list[Trace], path: str = TRACE_EXPORT_PATH):
+    if not path:
+        return
+    line = json.dumps(to_otlp(traces), ensure_ascii=False)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+
+trace_buffer = TraceBuffer()
@@ -1,53 +1,42 @@
-import pandas as pd
 import asyncio
 import datetime
-from io import BytesIO
 import time
 
 import ParsingScripts
+from ParsingScripts.checkpoints import RunCheckpoint, current_checkpoint
 from ParsingScripts import ParserType
-from status import TaskStatus, OrderStatus
+from ParsingScripts.formats import write_dataframe, convert_artifact, artifacts_diff, dataframe_digest, get_output_format, OUTPUT_FORMATS, DEFAULT_OUTPUT_FORMAT
+from status import TaskStatus, OrderStatus, TaskPriority
+from scheduler import PriorityTaskQueue
+from artifact_index import artifact_index
+from result_cache import result_cache, CachedResult
+from blob_store import blob_store, BlobRef
+from events import order_events
+from metrics import lock_wait, parser_run_seconds, parser_runs_total, coalesced_runs_total, queue_wait_seconds
+from metrics import workers_total, workers_busy
+from tracing import Trace, trace_buffer, export_otlp
+from order_store import order_store, ORDER_TTL_SECONDS, ORDER_STORE_MAX_ORDERS, ORDER_EVICTION_INTERVAL
 
 import os
 import uuid
 
-class SafeFileOpener:
-    def __init__(self, file_path: str, file_mode: str = "rb", timeout: float = 30.0, delay: float = 0.5):
-        self.file_path = file_path
-        self.file_mode = file_mode
-        self.timeout = timeout
-        self.delay = delay
-        self.file_descriptor = None
-
-    async def __aenter__(self):
-        start = asyncio.get_event_loop().time()
-
-        while True:
-            try:
-                if os.path.exists(self.file_path):
-                    self.file_descriptor = open(self.file_path, self.file_mode)
-                    return self.file_descriptor
-            except (OSError, PermissionError):
-                pass
-
-            if asyncio.get_event_loop().time() - start > self.timeout:
-                raise TimeoutError(f"File opening timed out for: {self.file_path}")
-
-            await asyncio.sleep(self.delay)
-
-    async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self.file_descriptor is not None and not self.file_descriptor.closed:
-            self.file_descriptor.close()
-
 class ParsingTask:
-    def __init__(self,parser_key: ParsingScripts.ParserKey, date_time: datetime.datetime, id: uuid.UUID):
+    def __init__(self,parser_key: ParsingScripts.ParserKey, date_time: datetime.datetime, id: uuid.UUID, priority: TaskPriority = TaskPriority.NORMAL, output_format: str = DEFAULT_OUTPUT_FORMAT, diff: bool = False):
         self.parser_key = parser_key
         self.date_time = date_time
         self.id = id
-        self.file = None
+        self.priority = priority
+        self.output_format = output_format
+        self.diff = diff # нужен ли вместе с результатом файл отличий от прошлого запуска
+        self.diff_blob: BlobRef | None = None
+        self.diff_file_name = ""
+        self.run_id: str | None = None # запуск парсера, которого ждет задача; по нему продолжается прерванный запуск
+        self.order_id = None
+        self.blob: BlobRef | None = None # ссылка на результат в blob_store, байты в задаче не хранятся
         self.file_name = ""
         self.status = TaskStatus.PENDING
         self.error = None
+        self.trace = Trace("task", task_id=str(id), parser=parser_key)
         self.lock = asyncio.Lock()
 
     def __str__(self):
@@ -61,8 +50,8 @@ class ParsingTask:
     def get_id(self) -> uuid.UUID: 
         return self.id
 
-    def get_file(self) -> bytes: 
-        return self.file
+    def get_blob(self) -> BlobRef | None: 
+        return self.blob
 
     def get_file_name(self) -> str: 
         return self.file_name
@@ -73,22 +62,56 @@ class ParsingTask:
     def get_date_time(self) -> datetime: 
         return self.date_time
 
+    def get_priority(self) -> TaskPriority:
+        return self.priority
+
+    def get_output_format(self) -> str:
+        return self.output_format
+
+    def get_diff(self) -> bool:
+        return self.diff
+
+    def get_run_id(self) -> str | None:
+        return self.run_id
+
+    def get_diff_blob(self) -> BlobRef | None:
+        return self.diff_blob
+
+    def get_diff_file_name(self) -> str:
+        return self.diff_file_name
+
+    def get_order_id(self) -> uuid.UUID:
+        return self.order_id
+
+    def get_trace(self) -> Trace:
+        return self.trace
+
     def get_lock(self) -> asyncio.Lock:
         return self.lock
 
-    async def get_parser(self) -> ParsingScripts.Parser:
-        async with ParsingScripts.parsers_lock:
-            return ParsingScripts.parsers[self.parser_key]
+    # парсер берется из текущего снимка реестра без блокировки; отключенный парсер дорабатывает принятые задачи
+    def get_parser(self) -> ParsingScripts.Parser:
+        parser = ParsingScripts.parser_registry.get(self.parser_key)
+        if parser is None:
+            raise KeyError(f"undefined source({self.parser_key})")
+        return parser
     
     def get_parser_key(self):
         return self.parser_key
 
-    def set_file(self, file: bytes): 
-        self.file = file
+    def set_blob(self, blob: BlobRef | None): 
+        self.blob = blob
 
     def set_file_name(self, file_name: str): 
         self.file_name = file_name
 
+    def set_run_id(self, run_id: str | None):
+        self.run_id = run_id
+
+    def set_diff_result(self, file_name: str, blob: BlobRef | None):
+        self.diff_file_name = file_name
+        self.diff_blob = blob
+
     def set_error(self, error: str): 
         self.error = error
 
@@ -98,14 +121,56 @@ class ParsingTask:
     def set_date_time(self, date_time: datetime.datetime):
         self.date_time = date_time
 
+    def set_order_id(self, order_id: uuid.UUID):
+        self.order_id = order_id
+
+    def to_record(self, position: int) -> dict:
+        return {
+            "id": str(self.id),
+            "order_id": str(self.order_id),
+            "parser_key": self.parser_key,
+            "date_time": self.date_time.isoformat() if self.date_time else None,
+            "priority": int(self.priority),
+            "output_format": self.output_format,
+            "diff": self.diff,
+            "run_id": self.run_id,
+            "diff_file_name": self.diff_file_name,
+            "diff_blob": self.diff_blob.to_record() if self.diff_blob else None,
+            "status": self.status.value if isinstance(self.status, TaskStatus) else self.status,
+            "error": self.error,
+            "file_name": self.file_name,
+            "blob": self.blob.to_record() if self.blob else None,
+            "position": position,
+        }
+
+    @classmethod
+    def from_record(cls, record: dict) -> "ParsingTask":
+        date_time = datetime.datetime.fromisoformat(record["date_time"]) if record["date_time"] else None
+        task = cls(
+            record["parser_key"], date_time, uuid.UUID(record["id"]), TaskPriority(record["priority"]),
+            record.get("output_format") or DEFAULT_OUTPUT_FORMAT, bool(record.get("diff"))
+        )
+        task.set_status(TaskStatus(record["status"]))
+        task.set_error(record["error"])
+        task.set_file_name(record["file_name"])
+        task.set_blob(BlobRef.from_record(record.get("blob") or {}))
+        task.set_diff_result(record.get("diff_file_name") or "", BlobRef.from_record(record.get("diff_blob") or {}))
+        task.set_run_id(record.get("run_id"))
+        return task
+
 class ParsingOrder:
     def __init__(self, id: uuid.UUID,task_list: list[ParsingTask], date_time):
         self.id = id
         self.task_list = task_list
+        self.trace = Trace("order", order_id=str(id))
+        for task in task_list:
+            task.set_order_id(id)
+            task.get_trace().attach(self.trace)
         self.date_time = date_time
         self.status = OrderStatus.PENDING
         self.lock = asyncio.Lock()
         self.error = ""
+        self.removal: asyncio.Task | None = None # отложенное удаление после первой выдачи результата
 
     def __str__(self):
         if self.error:
@@ -139,142 +204,516 @@ class ParsingOrder:
     def get_lock(self) -> asyncio.Lock:
         return self.lock
 
+    def get_trace(self) -> Trace:
+        return self.trace
+
+    def get_removal(self) -> asyncio.Task | None:
+        return self.removal
+
+    def get_traces(self) -> list[Trace]:
+        return [self.trace] + [task.get_trace() for task in self.task_list]
+
+    def is_finished(self) -> bool:
+        return all(task.get_status() in (TaskStatus.COMPLETED, TaskStatus.FAILED) for task in self.task_list)
+
     def set_error(self, error: str) -> None:
         self.error = error
 
     def set_status(self, status: str) -> None:
         self.status = status
 
+    def set_removal(self, removal: asyncio.Task | None) -> None:
+        self.removal = removal
+
+    def to_record(self) -> dict:
+        return {
+            "id": str(self.id),
+            "date_time": self.date_time.isoformat() if self.date_time else None,
+            "status": self.status.value if isinstance(self.status, OrderStatus) else self.status,
+            "error": self.error,
+            "tasks": [task.to_record(position) for position, task in enumerate(self.task_list)],
+        }
+
+    @classmethod
+    def from_record(cls, record: dict) -> "ParsingOrder":
+        date_time = datetime.datetime.fromisoformat(record["date_time"]) if record["date_time"] else None
+        order = cls(uuid.UUID(record["id"]), [ParsingTask.from_record(task) for task in record["tasks"]], date_time)
+        order.set_status(OrderStatus(record["status"]))
+        order.set_error(record["error"] or "")
+        return order
+
 order_queue: asyncio.Queue[ParsingOrder] = asyncio.Queue()
-httpx_queue: asyncio.Queue[ParsingTask] = asyncio.Queue()
-selenium_queue: asyncio.Queue[ParsingTask] = asyncio.Queue()
+httpx_queue: PriorityTaskQueue = PriorityTaskQueue("httpx")
+selenium_queue: PriorityTaskQueue = PriorityTaskQueue("selenium")
+
+def get_queue_position(task: ParsingTask) -> int | None:
+    for queue in (httpx_queue, selenium_queue):
+        position = queue.get_position(task)
+        if position is not None:
+            return position
+    return None
 
 orders_lock = asyncio.Lock()
 orders: dict[str, ParsingOrder] = {}
 
-async def add_order(key: str, result: dict) -> None:
-    async with orders_lock:
+async def add_order(key: uuid.UUID, result: ParsingOrder) -> None:
+    async with lock_wait(orders_lock, "orders_lock"):
         orders[key] = result
-        print(f"Orders: {orders}")
-
-async def get_order(key: str) -> ParsingOrder:
-    async with orders_lock:
-        return orders.get(key)
-
-async def remove_order(key: str, delay: int) -> None:
+        print(f"Orders: {len(orders)}")
+    trace_buffer.add(str(key), result.get_traces())
+    result.get_trace().begin("order.queue")
+    async with result.get_lock():
+        record = result.to_record()
+    await order_store.save_order(record)
+
+# чтение без orders_lock: обращение к dict атомарно в event loop, заказ, вытесненный из памяти, поднимается из хранилища
+async def get_order(key: uuid.UUID) -> ParsingOrder:
+    order = orders.get(key)
+    if order is not None:
+        return order
+    record = await order_store.load_order(str(key))
+    if record is None:
+        return None
+    return orders.setdefault(key, ParsingOrder.from_record(record))
+
+# фоновые задачи хранятся до завершения: event loop держит на задачи только слабые ссылки
+background_tasks: set[asyncio.Task] = set()
+
+def forget_background_task(task: asyncio.Task) -> None:
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"background task {task.get_name()} failed: {task.exception()!r}")
+
+def spawn(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(forget_background_task)
+    return task
+
+# удаление планируется один раз на заказ, сколько бы раз ни запрашивали результат (Range, докачка)
+def schedule_order_removal(order: "ParsingOrder", delay: int) -> None:
+    if order.get_removal() is None:
+        order.set_removal(spawn(remove_order(order.get_id(), delay)))
+
+async def remove_order(key: uuid.UUID, delay: int) -> None:
     await asyncio.sleep(delay)
-    async with orders_lock:
+    async with lock_wait(orders_lock, "orders_lock"):
         orders.pop(key, None)
-
-async def worker(queue:asyncio.Queue):
+    await order_store.remove_order(str(key))
+
+# каждое изменение состояния задачи сохраняется в хранилище и рассылается подписчикам заказа
+async def report_task_state(task: ParsingTask) -> None:
+    async with task.get_lock():
+        order_id = task.get_order_id()
+        if order_id is None:
+            return
+        record = task.to_record(0)
+    order_events.publish(order_id, {
+        "task_id": record["id"],
+        "key": record["parser_key"],
+        "status": record["status"],
+        "error": record["error"],
+    })
+    try:
+        await order_store.save_task(record)
+    except Exception as e:
+        print(f"failed to persist {task}: {e}")
+    if record["status"] in (TaskStatus.COMPLETED, TaskStatus.FAILED):
+        await finish_trace(task)
+
+# трасса закрывается, когда задача завершена; трасса заказа - когда завершены все его задачи
+async def finish_trace(task: ParsingTask) -> None:
+    task.get_trace().close()
+    order = orders.get(task.get_order_id())
+    if order is None or not order.is_finished() or order.get_trace().get_root().is_finished():
+        return
+    order.get_trace().close()
+    try:
+        await ParsingScripts.executor_runtime.run_blocking(export_otlp, order.get_traces())
+    except Exception as e:
+        print(f"failed to export trace of {order}: {e}")
+
+async def get_task_file_path(task: ParsingTask) -> str | None:
+    async with task.get_lock():
+        file_name = task.get_file_name()
+        status = task.get_status()
+        blob = task.get_blob()
+    if status != TaskStatus.COMPLETED or not file_name:
+        return None
+    if blob is not None:
+        return blob_store.get_path(blob)
+    parser = task.get_parser()
+    return parser.get_output_path() + file_name
+
+# незавершенные заказы после перезапуска снова отправляются в распределение
+async def restore_orders() -> None:
+    for record in await order_store.load_unfinished():
+        order = ParsingOrder.from_record(record)
+        for task in order.get_task_list():
+            if task.get_status() == TaskStatus.IN_PROGRESS:
+                task.set_status(TaskStatus.PENDING)
+        await add_order(order.get_id(), order)
+        order_queue.put_nowait(order)
+        print(f"restored {order}")
+
+# повтор заказа: упавшие задачи снова ставятся в очередь с прежним run_id, и запуск продолжается с чекпоинта
+async def retry_order(order: ParsingOrder) -> int:
+    retried = 0
+    async with lock_wait(order.get_lock(), "order_lock"):
+        for task in order.get_task_list():
+            async with task.get_lock():
+                if task.get_status() != TaskStatus.FAILED:
+                    continue
+                task.set_status(TaskStatus.PENDING)
+                task.set_error(None)
+            retried += 1
+        if not retried:
+            return 0
+        order.set_status(OrderStatus.PENDING)
+        order.set_error("")
+        if order.get_removal() is not None:
+            order.get_removal().cancel()
+            order.set_removal(None)
+        record = order.to_record()
+    await order_store.save_order(record)
+    order.get_trace().begin("order.queue")
+    order_queue.put_nowait(order)
+    print(f"retrying {retried} tasks of {order}")
+    return retried
+
+async def order_eviction_worker():
+    while True:
+        await asyncio.sleep(ORDER_EVICTION_INTERVAL)
+        try:
+            evicted = await order_store.evict(ORDER_TTL_SECONDS, ORDER_STORE_MAX_ORDERS)
+            async with lock_wait(orders_lock, "orders_lock"):
+                for order_id in evicted:
+                    orders.pop(uuid.UUID(order_id), None)
+            if evicted:
+                print(f"evicted {len(evicted)} orders")
+        except Exception as e:
+            print(f"order eviction failed: {e}")
+
+inflight_lock = asyncio.Lock()
+inflight_runs: dict[str, tuple[asyncio.Task, Trace]] = {}
+coalesced_runs = 0
+
+def get_coalesced_runs() -> int:
+    return coalesced_runs
+
+async def complete_task(task: ParsingTask, file_name: str, blob: BlobRef, date_time: datetime.datetime, diff: tuple[str, BlobRef] | None = None) -> None:
+    async with task.get_lock():
+        task.set_blob(blob)
+        task.set_file_name(file_name)
+        if diff is not None:
+            task.set_diff_result(*diff)
+        task.set_date_time(date_time)
+        task.set_status(TaskStatus.COMPLETED)
+    await report_task_state(task)
+
+async def fail_task(task: ParsingTask, error: str) -> None:
+    async with task.get_lock():
+        task.set_status(TaskStatus.FAILED)
+        task.set_error(error)
+        print(f"worker failed parse {task}")
+    await report_task_state(task)
+
+# span запуска парсера копируются в трассу каждой задачи, дождавшейся этого запуска
+# возвращает результат именно этого запуска: parser.get_latest() к моменту чтения может указывать на более новый
+async def produce_result(parser: ParsingScripts.Parser, run_trace: Trace, output_format: str = DEFAULT_OUTPUT_FORMAT, run_id: str | None = None) -> ParsingScripts.LatestParse:
+    checkpoint = RunCheckpoint(run_id, parser.get_key()) if run_id else None
+    current_checkpoint.set(checkpoint)
+    lock_span = run_trace.begin("parser.lock_wait")
+    async with lock_wait(parser.get_lock(), "parser_lock"):
+        lock_span.finish()
+        try:
+            with run_trace.span("parser.load", loaded=parser.is_loaded()):
+                run = await parser.load()
+            start_time = time.time()
+            with run_trace.span("parser.run"):
+                df = await run()
+        except Exception:
+            parser_runs_total.inc(parser=parser.get_key(), result="failed")
+            raise
+        end_time = time.time()
+        parser_run_seconds.observe(end_time - start_time, parser=parser.get_key())
+        parser_runs_total.inc(parser=parser.get_key(), result="completed")
+        file_name, blob = await store_result(parser, df, run_trace, output_format)
+        latest = parser.get_latest()
+    if checkpoint is not None:
+        await ParsingScripts.executor_runtime.run_blocking(checkpoint.remove)
+    print(f"new latest parse {file_name} for {parser.get_key()}, time taken: {end_time - start_time} sec.")
+    return latest
+
+# у каждого запуска свой файл и своя строка индекса, даже если запуски пришлись на одну секунду;
+# вызывается под блокировкой парсера, поэтому имя не займет параллельный запуск
+async def get_artifact_file_name(parser: ParsingScripts.Parser, date_time: datetime.datetime, output_format: str) -> str:
+    stem = f"{parser.get_key()}_{date_time.strftime('%d.%m.%Y_%H-%M-%S')}"
+    extension = OUTPUT_FORMATS[output_format]
+    file_name = stem + extension
+    suffix = 1
+    while await path_exists(parser.get_output_path() + file_name):
+        suffix += 1
+        file_name = f"{stem}_{suffix}{extension}"
+    return file_name
+
+async def path_exists(path: str) -> bool:
+    return await ParsingScripts.executor_runtime.run_blocking(os.path.exists, path)
+
+# запуск сохраняется в формате задачи, которая его начала; остальные форматы получаются из этого файла по запросу.
+# Сохранение идет под блокировкой записи парсера: уплотнение истории не удалит blob,
+# на который ссылается только что полученный результат
+async def store_result(parser: ParsingScripts.Parser, df, run_trace: Trace, output_format: str) -> tuple[str, BlobRef]:
+    with run_trace.span("result.digest"):
+        digest = await ParsingScripts.executor_runtime.run_cpu(dataframe_digest, df)
+    async with lock_wait(parser.get_store_lock(), "store_lock"):
+        date_time = datetime.datetime.now()
+        file_name = await get_artifact_file_name(parser, date_time, output_format)
+        # тарифы меняются редко: если такая таблица уже сохранялась, используется ее blob без кодирования и записи
+        blob = await artifact_index.find_content(digest, output_format)
+        if blob is not None:
+            blob_store.reuse(blob)
+        else:
+            tmp_path = blob_store.get_tmp_path(OUTPUT_FORMATS[output_format])
+            with run_trace.span("result.encode", format=output_format):
+                await ParsingScripts.executor_runtime.run_cpu(write_dataframe, df, tmp_path, output_format)
+            with run_trace.span("artifact.write"):
+                blob = await blob_store.put_file(tmp_path)
+        full_path = parser.get_output_path() + file_name
+        with run_trace.span("artifact.index", sha256=blob.get_sha256()):
+            try:
+                await blob_store.link(blob, full_path)
+                await artifact_index.add_content(digest, output_format, blob)
+                await artifact_index.add(parser.get_key(), file_name, blob, date_time, digest)
+            except Exception as e:
+                print(f"failed to index artifact {full_path}: {e}")
+
+        parser.set_latest(file_name, date_time, blob, digest)
+    return file_name, blob
+
+render_locks: dict[tuple[str, str], asyncio.Lock] = {}
+rendered_results = 0
+
+def get_rendered_results() -> int:
+    return rendered_results
+
+# результат в формате задачи: готовый файл того же содержимого берется из индекса,
+# иначе конвертируется из последнего сохраненного файла и запоминается для следующих задач.
+# В индексе файл записывается как производный от результата запуска: он не становится последним результатом
+# и удаляется уплотнением вместе с ним. Блокировка записи не дает уплотнению удалить найденный blob до записи в индекс
+async def render_result(parser: ParsingScripts.Parser, latest: ParsingScripts.LatestParse | CachedResult, output_format: str, trace: Trace) -> tuple[str, BlobRef]:
+    global rendered_results
+    file_name = latest.get_file_name()
+    source_format = get_output_format(file_name)
+    if source_format == output_format:
+        return file_name, latest.get_blob()
+    file_name = os.path.splitext(file_name)[0] + OUTPUT_FORMATS[output_format]
+    digest = latest.get_digest()
+    async with render_locks.setdefault((parser.get_key(), output_format), asyncio.Lock()):
+        async with lock_wait(parser.get_store_lock(), "store_lock"):
+            blob = await artifact_index.find_content(digest, output_format) if digest is not None else None
+            if blob is None:
+                tmp_path = blob_store.get_tmp_path(OUTPUT_FORMATS[output_format])
+                with trace.span("result.render", source_format=source_format, format=output_format):
+                    await ParsingScripts.executor_runtime.run_cpu(
+                        convert_artifact, blob_store.get_path(latest.get_blob()), source_format, tmp_path, output_format
+                    )
+                    blob = await blob_store.put_file(tmp_path)
+                rendered_results += 1
+            full_path = parser.get_output_path() + file_name
+            try:
+                await blob_store.link(blob, full_path)
+                if digest is not None:
+                    await artifact_index.add_content(digest, output_format, blob)
+                await artifact_index.add(parser.get_key(), file_name, blob, latest.get_date_time(), digest, latest.get_file_name())
+            except Exception as e:
+                print(f"failed to index artifact {full_path}: {e}")
+    return file_name, blob
+
+# файл отличий результата от предыдущего запуска парсера; для пары одинаковых таблиц считается один раз на формат.
+# Как и файл в другом формате, записывается в индекс производным от результата и уплотняется вместе с ним.
+# Ошибка сравнения не мешает выдать основной результат
+async def render_diff(parser: ParsingScripts.Parser, latest: ParsingScripts.LatestParse | CachedResult, output_format: str, trace: Trace) -> tuple[str, BlobRef] | None:
+    try:
+        async with lock_wait(parser.get_store_lock(), "store_lock"):
+            previous = await artifact_index.get_previous(parser.get_key(), latest.get_date_time())
+            if previous is None:
+                return None
+            file_name = os.path.splitext(latest.get_file_name())[0] + "_diff" + OUTPUT_FORMATS[output_format]
+            digest = None
+            blob = None
+            if previous.get_digest() is not None and latest.get_digest() is not None:
+                digest = f"diff:{previous.get_digest()}:{latest.get_digest()}"
+                blob = await artifact_index.find_content(digest, output_format)
+            if blob is None:
+                tmp_path = blob_store.get_tmp_path(OUTPUT_FORMATS[output_format])
+                with trace.span("result.diff", previous=previous.get_file_name(), format=output_format) as diff_span:
+                    diff_span.attributes["rows"] = await ParsingScripts.executor_runtime.run_cpu(
+                        artifacts_diff,
+                        blob_store.get_path(previous.get_blob()), get_output_format(previous.get_file_name()),
+                        blob_store.get_path(latest.get_blob()), get_output_format(latest.get_file_name()),
+                        parser.get_diff_keys(), tmp_path, output_format
+                    )
+                    blob = await blob_store.put_file(tmp_path)
+            await blob_store.link(blob, parser.get_output_path() + file_name)
+            if digest is not None:
+                await artifact_index.add_content(digest, output_format, blob)
+            await artifact_index.add(parser.get_key(), file_name, blob, latest.get_date_time(), digest, latest.get_file_name())
+        return file_name, blob
+    except Exception as e:
+        print(f"failed to build diff for {parser.get_key()}: {e}")
+        return None
+
+def get_run_id(inflight: tuple[asyncio.Task, Trace]) -> str | None:
+    return inflight[1].get_root().attributes.get("run_id")
+
+def forget_run(key: str, inflight: tuple[asyncio.Task, Trace]) -> None:
+    if inflight_runs.get(key) is inflight:
+        inflight_runs.pop(key, None)
+
+# один запуск парсера на ключ: задачи, пришедшие во время работы парсера, ждут его результат
+# run_id задачи, начавшей запуск, становится ключом чекпоинта; задачи, присоединившиеся к запуску, запоминают его же
+async def get_inflight_run(parser: ParsingScripts.Parser, start: bool, output_format: str = DEFAULT_OUTPUT_FORMAT, run_id: str | None = None) -> tuple[asyncio.Task, Trace] | None:
+    global coalesced_runs
+    key = parser.get_key()
+    async with lock_wait(inflight_lock, "inflight_lock"):
+        inflight = inflight_runs.get(key)
+        if inflight is not None:
+            coalesced_runs += 1
+            coalesced_runs_total.inc(parser=key)
+            print(f"joined running parse of {key}, coalesced runs: {coalesced_runs}")
+            return inflight
+        if not start:
+            return None
+        run_id = run_id or str(uuid.uuid4())
+        run_trace = Trace("run", parser=key, run_id=run_id)
+        run = asyncio.create_task(produce_result(parser, run_trace, output_format, run_id))
+        inflight = (run, run_trace)
+        inflight_runs[key] = inflight
+        run.add_done_callback(lambda finished: forget_run(key, inflight))
+        return inflight
+
+async def follow_run(task: ParsingTask, inflight: tuple[asyncio.Task, Trace]) -> None:
+    run, run_trace = inflight
+    trace = task.get_trace()
+    async with task.get_lock():
+        task.set_run_id(get_run_id(inflight))
+    try:
+        with trace.span("task.wait_run", run_trace_id=run_trace.get_trace_id()):
+            try:
+                latest = await asyncio.shield(run)
+            finally:
+                trace.add(run_trace.get_spans()[1:], run_trace_id=run_trace.get_trace_id())
+        parser = task.get_parser()
+        file_name, blob = await render_result(parser, latest, task.get_output_format(), trace)
+        diff = await render_diff(parser, latest, task.get_output_format(), trace) if task.get_diff() else None
+        await complete_task(task, file_name, blob, datetime.datetime.now(), diff)
+        print(f"worker finished parse {task}")
+    except Exception as e:
+        await fail_task(task, str(e))
+
+async def worker(queue:PriorityTaskQueue):
+    workers_total.inc(queue=queue.name)
     while True:
         task : ParsingTask = await queue.get()
+        workers_busy.inc(queue=queue.name)
         try:
             async with task.get_lock():
                 task_id : uuid.UUID = task.get_id()
                 deadline_time : datetime.datetime = task.get_date_time()
-                parser: ParsingScripts.Parser = await task.get_parser()
+                parser: ParsingScripts.Parser = task.get_parser()
                 print(f"in work {task}")
-            async with parser.get_lock():
-                latest_parse = parser.get_latest_parse_datetime()
-
-
-            # if (latest_parse is not None and
-            #     latest_parse > deadline_time
-            #     ):
-            if (latest_parse is not None and deadline_time is not None):
-                async with parser.get_lock():
-                    full_latest_path = parser.get_output_path() + parser.get_latest_parse_file_name()
-                    file_name = parser.get_latest_parse_file_name()
-
-                with open(full_latest_path, "rb") as f:
-                    xlsxfile_bin = BytesIO(f.read())
-                xlsxfile_bin.seek(0)
-                async with task.get_lock():
-                    task.set_file(xlsxfile_bin)
-                    task.set_file_name(file_name)
-                    task.set_date_time(parser.get_latest_parse_datetime())
-                    task.set_status(TaskStatus.COMPLETED)
-                    print(f"found old data in {full_latest_path}  {task}")
+            trace = task.get_trace()
+            trace.finish("task.queue")
+            with trace.span("task.cache_lookup") as lookup_span:
+                cached = await result_cache.lookup(parser, deadline_time)
+                lookup_span.attributes["hit"] = cached is not None
+            if cached is not None:
+                file_name, blob = await render_result(parser, cached, task.get_output_format(), trace)
+                diff = await render_diff(parser, cached, task.get_output_format(), trace) if task.get_diff() else None
+                await complete_task(task, file_name, blob, cached.get_date_time(), diff)
+                print(f"found old data {file_name} {task}")
             else:
                 print(f"worker start new parse {task_id}")
                 async with task.get_lock():
-                    task.set_file(None)
+                    task.set_blob(None)
                     task.set_file_name("")
+                    task.set_diff_result("", None)
+                    task.set_run_id(task.get_run_id() or str(task_id))
                     task.set_date_time(datetime.datetime.now())
                     task.set_status(TaskStatus.IN_PROGRESS)
                     print(f"parsing started in {task}")
-                
-                start_time = time.time()
-                async with parser.get_lock():
-                    df = await parser.run()
-                
-                end_time = time.time()
-             
-
-                file_name = f"{parser.get_key()}_{datetime.datetime.now().strftime('%d.%m.%Y_%H-%M')}.xlsx"
-                xlsxfile_bin = BytesIO() 
-                df.to_excel(xlsxfile_bin, index=False)
-                xlsxfile_bin.seek(0)
-                with open(parser.get_output_path() + file_name, "wb") as f:
-                    f.write(xlsxfile_bin.read())
-                xlsxfile_bin.seek(0)
-                async with task.get_lock():
-                    task.set_file(xlsxfile_bin)
-                    task.set_file_name(file_name)
-                    task.set_date_time(datetime.datetime.now())
-                    task.set_status(TaskStatus.COMPLETED)
-                    print(f"worker finished parse {task}, time taken: {end_time - start_time} sec.")
+                await report_task_state(task)
 
-                async with parser.get_lock():
-                    parser.set_latest_parse_date_time(datetime.datetime.now())
-                    parser.set_latest_parse_file_name(file_name)
-                    print(f"new latest parse {file_name} for {parser.get_key()}")
+                inflight = await get_inflight_run(
+                    parser, start=True, output_format=task.get_output_format(), run_id=task.get_run_id()
+                )
+                await follow_run(task, inflight)
 
         except Exception as e:
-            async with task.get_lock():
-                task.set_status(TaskStatus.FAILED)
-                task.set_error(str(e))
-                print(f"worker failed parse {task}")
+            await fail_task(task, str(e))
         finally:
+            workers_busy.dec(queue=queue.name)
             queue.task_done()
 
 async def distributor_worker():
     while True:
         order: ParsingOrder = await order_queue.get()
+        distribute_span = None
         try:
-            async with order.get_lock():
+            async with lock_wait(order.get_lock(), "order_lock"):
                 order_id: uuid.UUID = order.get_id()
+                created = order.get_date_time()
                 print(f"distributing {order}")
+            if created is not None:
+                queue_wait_seconds.observe((datetime.datetime.now() - created).total_seconds(), queue="order")
+            order.get_trace().finish("order.queue")
 
-            await add_order(order_id, order)
-
-
-            async with order.get_lock():
+            distribute_span = order.get_trace().begin("order.distribute")
+            async with lock_wait(order.get_lock(), "order_lock"):
                 for task in order.get_task_list():
                     async with task.get_lock():
-                        parser:ParsingScripts.Parser = await task.get_parser()
+                        if task.get_status() in (TaskStatus.COMPLETED, TaskStatus.FAILED):
+                            continue
+                        parser:ParsingScripts.Parser = task.get_parser()
                         task.set_status(TaskStatus.PENDING)
                         task_id = task.get_id()
-                    async with parser.get_lock():
-                        parser_type = parser.get_type()
-                        print(f"distributing {order_id}, {task_id}, {parser_type}")
+                        deadline_time = task.get_date_time()
+                    await report_task_state(task)
+                    parser_type = parser.get_type()
+                    print(f"distributing {order_id}, {task_id}, {parser_type}")
+
+                    inflight = None
+                    if not await result_cache.has_fresh(parser, deadline_time):
+                        inflight = await get_inflight_run(parser, start=False)
+                    if inflight is not None:
+                        async with task.get_lock():
+                            task.set_status(TaskStatus.IN_PROGRESS)
+                            task.set_run_id(get_run_id(inflight))
+                        await report_task_state(task)
+                        spawn(follow_run(task, inflight))
+                        continue
 
                     match parser_type:
                         case ParserType.HTTPX:
+                            task.get_trace().begin("task.queue", queue="httpx")
                             httpx_queue.put_nowait(task)
                         case ParserType.SELENIUM:
+                            task.get_trace().begin("task.queue", queue="selenium")
                             selenium_queue.put_nowait(task)
                         case _:
                             async with task.get_lock():
                                 task.set_status(TaskStatus.FAILED)
                                 print(f"Unknown parser type: {parser_type} in {task}")
+                            await report_task_state(task)
                 order.set_status(OrderStatus.PENDING)
                 
         except Exception as e:
-            async with order.get_lock():
+            async with lock_wait(order.get_lock(), "order_lock"):
                 order.set_status(OrderStatus.FAILED)
                 order.set_error(str(e))
                 print(f"Failed to distribute {order}: {e}")
         finally:
+            if distribute_span is not None:
+                distribute_span.finish()
             order_queue.task_done()
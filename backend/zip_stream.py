@@ -0,0 +1,193 @@
+import os
+import mmap
+import struct
+import zlib
+import hashlib
+import datetime
+import tempfile
+
+CHUNK_SIZE = 64 * 1024
+SPOOL_MAX_SIZE = 1024 * 1024
+
+# форматы, которые уже сжаты внутри (xlsx/docx - это zip), повторно их не сжимаем
+COMPRESSED_EXTENSIONS = {".xlsx", ".docx", ".zip", ".gz", ".parquet", ".arrow", ".png", ".jpg", ".jpeg"}
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+ZIP_VERSION = 20
+UTF8_FLAG = 0x800
+
+LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+CENTRAL_HEADER = struct.Struct("<4s4B4HL2L5H2L")
+END_OF_CENTRAL_DIR = struct.Struct("<4s4H2LH")
+
+
+def dos_date_time(date_time: datetime.datetime) -> tuple[int, int]:
+    date_time = max(date_time, datetime.datetime(1980, 1, 1))
+    dos_time = (date_time.hour << 11) | (date_time.minute << 5) | (date_time.second // 2)
+    dos_date = ((date_time.year - 1980) << 9) | (date_time.month << 4) | date_time.day
+    return dos_time, dos_date
+
+
+def read_chunks(file, offset: int, length: int):
+    file.seek(offset)
+    while length > 0:
+        chunk = file.read(min(CHUNK_SIZE, length))
+        if not chunk:
+            raise IOError("zip member is shorter than expected")
+        length -= len(chunk)
+        yield chunk
+
+
+class ZipMember:
+    # size и crc известны для blob-ов из хранилища: несжимаемый файл тогда не читается при подготовке
+    def __init__(self, name: str, path: str, date_time: datetime.datetime, size: int | None = None, crc: int | None = None):
+        self.name = name
+        self.encoded_name = name.encode("utf-8")
+        self.path = path
+        self.date_time = date_time
+        self.method = ZIP_STORED
+        self.crc = crc or 0
+        self.size = size or 0
+        self.known = size is not None and crc is not None
+        self.compressed_size = 0
+        self.compressed_file = None
+
+    # один проход по файлу кусками: crc, размер и, для сжимаемых форматов, deflate во временный файл
+    def prepare(self):
+        extension = os.path.splitext(self.name)[1].lower()
+        compress = extension not in COMPRESSED_EXTENSIONS
+        if self.known and not compress:
+            self.compressed_size = self.size
+            return
+        self.crc = 0
+        self.size = 0
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15) if compress else None
+        if compress:
+            self.method = ZIP_DEFLATED
+            self.compressed_file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        with open(self.path, "rb") as f:
+            while chunk := f.read(CHUNK_SIZE):
+                self.crc = zlib.crc32(chunk, self.crc)
+                self.size += len(chunk)
+                if compress:
+                    self.compressed_file.write(compressor.compress(chunk))
+        if compress:
+            self.compressed_file.write(compressor.flush())
+            self.compressed_size = self.compressed_file.tell()
+        else:
+            self.compressed_size = self.size
+        if self.compressed_size >= 0xFFFFFFFF or self.size >= 0xFFFFFFFF:
+            raise ValueError(f"{self.name} is too large for a zip without zip64")
+
+    def local_header(self) -> bytes:
+        dos_time, dos_date = dos_date_time(self.date_time)
+        return LOCAL_HEADER.pack(
+            b"PK\x03\x04", ZIP_VERSION, 0, UTF8_FLAG, self.method, dos_time, dos_date,
+            self.crc, self.compressed_size, self.size, len(self.encoded_name), 0
+        ) + self.encoded_name
+
+    def central_header(self, offset: int) -> bytes:
+        dos_time, dos_date = dos_date_time(self.date_time)
+        return CENTRAL_HEADER.pack(
+            b"PK\x01\x02", ZIP_VERSION, 3, ZIP_VERSION, 0, UTF8_FLAG, self.method, dos_time, dos_date,
+            self.crc, self.compressed_size, self.size, len(self.encoded_name), 0, 0, 0, 0,
+            0o644 << 16, offset
+        ) + self.encoded_name
+
+    def read_data(self, offset: int, length: int):
+        if self.compressed_file is not None:
+            yield from read_chunks(self.compressed_file, offset, length)
+            return
+        # несжатые данные читаются из отображения файла в память: без буферов чтения и seek на каждый диапазон
+        with open(self.path, "rb") as f:
+            if length <= 0:
+                return
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                if offset + length > len(mapped):
+                    raise IOError("zip member is shorter than expected")
+                for start in range(offset, offset + length, CHUNK_SIZE):
+                    yield mapped[start:min(start + CHUNK_SIZE, offset + length)]
+            finally:
+                mapped.close()
+
+    def close(self):
+        if self.compressed_file is not None:
+            self.compressed_file.close()
+            self.compressed_file = None
+
+
+# zip-архив, который не собирается в памяти: раскладка известна заранее,
+# поэтому можно отдать любой диапазон байт (HTTP Range) без построения всего архива
+class ZipStream:
+    def __init__(self, members: list[ZipMember]):
+        self.members = members
+        self.segments: list[tuple[int, int, object]] = []
+        self.size = 0
+        self.etag = ""
+
+    def prepare(self):
+        central_directory = b""
+        digest = hashlib.sha1()
+        for member in self.members:
+            try:
+                member.prepare()
+            except BaseException:
+                # временные файлы уже подготовленных файлов архива не должны остаться открытыми
+                self.close()
+                raise
+            header = member.local_header()
+            central_directory += member.central_header(self.size)
+            self.add_segment(len(header), header)
+            self.add_segment(member.compressed_size, member)
+            digest.update(header)
+        central_offset = self.size
+        end = END_OF_CENTRAL_DIR.pack(
+            b"PK\x05\x06", 0, 0, len(self.members), len(self.members),
+            len(central_directory), central_offset, 0
+        )
+        self.add_segment(len(central_directory) + len(end), central_directory + end)
+        self.etag = f'"{digest.hexdigest()}"'
+        return self
+
+    def add_segment(self, length: int, source):
+        self.segments.append((self.size, length, source))
+        self.size += length
+
+    def iter_range(self, start: int = 0, end: int | None = None):
+        end = self.size - 1 if end is None else end
+        try:
+            for offset, length, source in self.segments:
+                if offset + length <= start or offset > end:
+                    continue
+                local_start = max(start - offset, 0)
+                local_end = min(end - offset, length - 1)
+                if isinstance(source, bytes):
+                    yield source[local_start:local_end + 1]
+                else:
+                    yield from source.read_data(local_start, local_end - local_start + 1)
+        finally:
+            self.close()
+
+    def close(self):
+        for member in self.members:
+            member.close()
+
+
+# разбор заголовка Range: поддерживается один диапазон; None - отдать файл целиком
+def parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    if not first:
+        if not last.isdigit() or int(last) == 0:
+            raise ValueError("unsatisfiable range")
+        return max(size - int(last), 0), size - 1
+    if not first.isdigit() or (last and not last.isdigit()):
+        return None
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("unsatisfiable range")
+    return start, end